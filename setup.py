@@ -43,12 +43,17 @@ setup(
         'questionary==1.5.2',
         'iPython==7.13.0',
         'SQLAlchemy==1.3.15',
+        'appdirs==1.4.3',
+        'PyYAML==5.3.1',
         'vantage6-common >= 1.2.3',
         'vantage6-client >= 1.2.3',
     ],
     extras_require={
         'dev': [
             'coverage==5.0.4'
+        ],
+        'profile': [
+            'numpy'
         ]
     },
     package_data={
@@ -58,8 +63,8 @@ setup(
     },
     entry_points={
         'console_scripts': [
-            'vnode=vantage6.cli.node:cli_node',
-            'vserver=vantage6.cli.server:cli_server'
+            'vnode=vantage6.cli.entry:vnode',
+            'vserver=vantage6.cli.entry:vserver'
         ]
     }
 )
\ No newline at end of file
@@ -0,0 +1,170 @@
+import json
+import os
+import socketserver
+import struct
+import tempfile
+import threading
+import time
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+import docker
+
+from vantage6.cli.async_docker import AsyncDockerClient, unix_socket_path
+from vantage6.cli.docker_session import DockerSession
+
+
+class StubDocker(socketserver.StreamRequestHandler):
+    """Docker daemon on a Unix socket that answers after a short delay."""
+
+    def handle(self):
+        request_line = self.rfile.readline().decode()
+        while self.rfile.readline() not in (b"\r\n", b""):
+            pass
+        method, path, _ = request_line.split(" ")
+        server = self.server
+
+        with server.lock:
+            server.requests.append((method, path))
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight,
+                                       server.in_flight)
+        time.sleep(server.delay)
+        with server.lock:
+            server.in_flight -= 1
+
+        if "missing" in path:
+            body = json.dumps({"message": "No such container"}).encode()
+            self.wfile.write(b"HTTP/1.1 404 Not Found\r\n"
+                             b"Content-Type: application/json\r\n"
+                             b"Content-Length: %d\r\n\r\n" % len(body))
+            self.wfile.write(body)
+        elif path.endswith("/json"):
+            body = json.dumps({"Config": {"Tty": "tty" in path}}).encode()
+            self.wfile.write(b"HTTP/1.1 200 OK\r\n"
+                             b"Content-Type: application/json\r\n"
+                             b"Content-Length: %d\r\n\r\n" % len(body))
+            self.wfile.write(body)
+        elif "/logs" in path and "tty" in path:
+            # raw output, which happens to start like a frame header
+            self.wfile.write(b"HTTP/1.1 200 OK\r\n"
+                             b"Transfer-Encoding: chunked\r\n\r\n")
+            for chunk in (b"\x01\x00\x00\x00hello\n", b"world\n"):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\n\r\n")
+        elif "/logs" in path:
+            # two frames (stdout and stderr), split over three chunks
+            frames = b"".join(struct.pack(">BxxxI", stream, len(line)) + line
+                              for stream, line in ((1, b"hello\n"),
+                                                   (2, b"world\n")))
+            self.wfile.write(b"HTTP/1.1 200 OK\r\n"
+                             b"Transfer-Encoding: chunked\r\n\r\n")
+            for chunk in (frames[:5], frames[5:17], frames[17:]):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            self.wfile.write(b"HTTP/1.1 204 No Content\r\n\r\n")
+
+
+class StubServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    # the default backlog of 5 is too small for concurrent clients
+    request_queue_size = 128
+
+
+def container(name):
+    mock = MagicMock(id=f"{name}-id")
+    mock.name = name
+    return mock
+
+
+class AsyncDockerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.socket = os.path.join(self.folder.name, "docker.sock")
+        self.server = StubServer(self.socket, StubDocker)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.in_flight = 0
+        self.server.max_in_flight = 0
+        self.server.delay = 0.05
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.folder.cleanup()
+
+    def test_unix_socket_path(self):
+        self.assertEqual(unix_socket_path(f"unix://{self.socket}"),
+                         self.socket)
+        self.assertIsNone(unix_socket_path("tcp://127.0.0.1:2375"))
+        self.assertIsNone(unix_socket_path("unix:///does/not/exist"))
+
+    def test_concurrent_requests_are_capped(self):
+        client = AsyncDockerClient(self.socket, max_in_flight=10)
+        containers = [container(f"node-{i}") for i in range(100)]
+
+        start = time.monotonic()
+        errors = client.for_each(containers, lambda c: client.kill(c.id))
+        duration = time.monotonic() - start
+
+        self.assertEqual(errors, {})
+        self.assertEqual(len(self.server.requests), 100)
+        self.assertEqual(self.server.max_in_flight, 10)
+        self.assertEqual(client.calls["POST /containers/{id}/kill"], 100)
+        # ten batches of 50ms, rather than a hundred
+        self.assertLess(duration, 2.5)
+
+    def test_errors(self):
+        client = AsyncDockerClient(self.socket)
+        containers = [container("node"), container("missing")]
+
+        errors = client.for_each(containers, lambda c: client.stop(c.id))
+
+        self.assertEqual(list(errors), ["missing"])
+        self.assertIsInstance(errors["missing"], docker.errors.NotFound)
+        self.assertIn("No such container", str(errors["missing"]))
+        self.assertIn(("POST", "/v1.35/containers/node-id/stop?t=10"),
+                      self.server.requests)
+
+    def test_follow_logs(self):
+        client = AsyncDockerClient(self.socket)
+        logs = []
+
+        client.for_each([container("node")],
+                        lambda c: client.follow_logs(c.id, logs.append))
+
+        self.assertEqual(logs, [b"hello\n", b"world\n"])
+
+    def test_follow_logs_tty(self):
+        """The output of a container with a TTY is passed on as is."""
+        client = AsyncDockerClient(self.socket)
+        logs = []
+
+        client.for_each([container("node-tty")],
+                        lambda c: client.follow_logs(c.id, logs.append))
+
+        self.assertEqual(b"".join(logs), b"\x01\x00\x00\x00hello\nworld\n")
+
+    def test_session_uses_socket_for_many_containers(self):
+        with patch("vantage6.cli.docker_session.unix_socket_path",
+                   return_value=self.socket):
+            session = DockerSession()
+
+        few = [container("a"), container("b")]
+        many = [container(f"node-{i}") for i in range(20)]
+
+        session.kill_all(few)
+        session.kill_all(many)
+
+        # the first two are killed by docker-py, the rest over the socket
+        for c in few:
+            c.kill.assert_called_once()
+        for c in many:
+            c.kill.assert_not_called()
+        self.assertEqual(len(self.server.requests), 20)
+        self.assertEqual(session.api_calls, 20)
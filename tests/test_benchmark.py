@@ -0,0 +1,103 @@
+import tempfile
+import unittest
+
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+from click.testing import CliRunner
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from vantage6.client.encryption import DummyCryptor
+from vantage6.cli.benchmark import (
+    percentile,
+    latency_summary,
+    container_http_latencies,
+    crypto_latencies,
+    format_crypto_table
+)
+from vantage6.cli.node import cli_node_bench_crypto
+
+
+class BenchmarkTest(unittest.TestCase):
+
+    def test_percentile(self):
+        samples = list(range(1, 101))
+        self.assertEqual(percentile(samples, 50), 50)
+        self.assertEqual(percentile(samples, 95), 95)
+        self.assertEqual(percentile(samples, 100), 100)
+        self.assertEqual(percentile([3], 99), 3)
+
+    def test_latency_summary(self):
+        summary = latency_summary([0.001, 0.002, 0.003])
+        self.assertEqual(summary["n"], 3)
+        self.assertAlmostEqual(summary["mean"], 2.0)
+        self.assertAlmostEqual(summary["p50"], 2.0)
+
+    def test_container_http_latencies(self):
+        container = MagicMock()
+        container.exec_run.return_value = MagicMock(
+            exit_code=0, output=b"some warning\n[0.1, 0.2]\n"
+        )
+        self.assertEqual(
+            container_http_latencies(container, "http://server", 2),
+            [0.1, 0.2]
+        )
+
+        container.exec_run.return_value = MagicMock(
+            exit_code=1, output=b"Traceback"
+        )
+        with self.assertRaises(RuntimeError):
+            container_http_latencies(container, "http://server", 2)
+
+    def test_crypto_latencies(self):
+        encrypt, decrypt, encoded = crypto_latencies(DummyCryptor(), "", 3000,
+                                                     3)
+        self.assertEqual((len(encrypt), len(decrypt)), (3, 3))
+        self.assertEqual(encoded, 4000)
+
+        broken = MagicMock()
+        broken.decrypt_str_to_bytes.return_value = b"something else"
+        with self.assertRaises(RuntimeError):
+            crypto_latencies(broken, "", 10, 1)
+
+    def test_format_crypto_table(self):
+        table = format_crypto_table([
+            ("base64", 1024 ** 2, "encode", latency_summary([0.5]),
+             4 * 1024 ** 2 // 3)
+        ])
+        self.assertIn("1MB", table)
+        self.assertIn("2.0", table)
+        self.assertIn("33.3%", table)
+
+    @patch("vantage6.cli.node.NodeContext")
+    def test_cli_crypto(self, context):
+        with tempfile.TemporaryDirectory() as tmp:
+            key_file = Path(tmp) / "key.pem"
+            key = rsa.generate_private_key(
+                public_exponent=65537, key_size=2048,
+                backend=default_backend()
+            )
+            key_file.write_bytes(key.private_bytes(
+                encoding=serialization.Encoding.PEM,
+                format=serialization.PrivateFormat.TraditionalOpenSSL,
+                encryption_algorithm=serialization.NoEncryption()
+            ))
+            context.config_exists.return_value = True
+            context.return_value = MagicMock(config={
+                "encryption": {"enabled": True, "private_key": str(key_file)}
+            })
+            context.return_value.get_data_file.return_value = str(key_file)
+
+            result = CliRunner().invoke(cli_node_bench_crypto, [
+                "-n", "iknl", "-s", "1k", "-s", "64k", "-r", "2"
+            ])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(result.output.count("rsa+aes"), 4)
+        self.assertEqual(result.output.count("base64"), 4)
+
+        result = CliRunner().invoke(cli_node_bench_crypto,
+                                    ["-n", "iknl", "-s", "lots"])
+        self.assertEqual(result.exit_code, 2)
@@ -0,0 +1,217 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from pathlib import Path
+from unittest.mock import patch
+
+from click._bashcomplete import get_choices
+
+from vantage6.common.globals import APPNAME
+from vantage6.cli import completion
+from vantage6.cli.completion import (
+    ENVIRONMENT_OPTIONS,
+    NAME_OPTIONS,
+    CompletionIndex,
+    bash_complete,
+    complete_configurations,
+    complete_environments,
+    configuration_folders
+)
+from vantage6.cli.context import NodeContext, ServerContext
+from vantage6.cli.node import cli_node
+from vantage6.cli.server import cli_server
+
+CONFIG = "environments:\n  prod:\n    api_key: x\n  dev:\n    api_key: y\n"
+
+
+def choices(cli, args, incomplete):
+    return [choice for choice, _ in get_choices(cli, "vnode", args,
+                                                incomplete)]
+
+
+class CompletionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = Path(self.tmp.name, "node")
+        self.folder.mkdir()
+        for name in ("iknl", "iknl2", "other"):
+            (self.folder / f"{name}.yaml").write_text(CONFIG)
+        (self.folder / "app.yaml").write_text("application:\n  port: 1\n")
+        self.index_file = Path(self.tmp.name, "completion.json")
+        patcher = patch("vantage6.cli.completion.configuration_folders",
+                        return_value=[self.folder,
+                                      Path(self.tmp.name, "missing")])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def index(self, budget=1):
+        return CompletionIndex(self.index_file, budget=budget)
+
+    def test_configurations(self):
+        self.assertEqual(
+            complete_configurations("node", "ik", self.index()),
+            ["iknl", "iknl2"]
+        )
+        self.assertEqual(
+            complete_environments("node", "iknl", "", self.index()),
+            ["dev", "prod"]
+        )
+        self.assertEqual(
+            complete_environments("node", "app", "", self.index()),
+            ["application"]
+        )
+
+    def test_files_are_only_read_when_changed(self):
+        complete_configurations("node", "", self.index())
+        with patch("vantage6.cli.completion.read_environments") as read:
+            complete_environments("node", "iknl", "", self.index())
+            read.assert_not_called()
+
+            (self.folder / "iknl.yaml").write_text("environments: {}\n")
+            read.return_value = []
+            complete_environments("node", "iknl", "", self.index())
+            read.assert_called_once()
+
+    def test_budget(self):
+        # out of time: names are still complete, environments are read
+        # on a later completion
+        index = self.index(budget=0)
+        self.assertEqual(complete_configurations("node", "", index),
+                         ["app", "iknl", "iknl2", "other"])
+        self.assertEqual(complete_environments("node", "iknl", "",
+                                               self.index(budget=0)), [])
+        self.assertEqual(complete_environments("node", "iknl", "",
+                                               self.index()), ["dev", "prod"])
+
+    @patch("docker.from_env")
+    def test_running(self, from_env):
+        from_env.return_value.api.containers.return_value = [
+            {"Names": ["/vantage6-iknl-user"], "Labels": {"name": "iknl"}}
+        ]
+        with patch("vantage6.cli.completion.index_path",
+                   return_value=self.index_file):
+            self.assertEqual(choices(cli_node, ["stop", "-n"], ""), ["iknl"])
+            # served from the cache
+            self.assertEqual(choices(cli_node, ["attach", "-n"], "ik"),
+                             ["iknl"])
+        from_env.assert_called_once()
+        cached = json.loads(self.index_file.read_text())
+        self.assertEqual(cached["containers"]["node"]["names"], ["iknl"])
+
+    def test_click_integration(self):
+        with patch("vantage6.cli.completion.index_path",
+                   return_value=self.index_file):
+            self.assertEqual(choices(cli_node, ["start", "--name"], "oth"),
+                             ["other"])
+            self.assertEqual(
+                choices(cli_node, ["start", "-n", "iknl", "-e"], "p"),
+                ["prod"]
+            )
+            self.assertEqual(
+                choices(cli_node, ["image", "pin", "-n"], "iknl2"),
+                ["iknl2"]
+            )
+            self.assertEqual(choices(cli_server, ["files", "-n"], "ot"),
+                             ["other"])
+
+    def bash(self, words, environ=None):
+        environ = dict(environ or {}, _VNODE_COMPLETE="complete",
+                       COMP_WORDS=words,
+                       COMP_CWORD=str(len(words.split(" ")) - 1))
+        with patch("vantage6.cli.completion.index_path",
+                   return_value=self.index_file), \
+                patch("sys.stdout", new_callable=io.StringIO) as stdout:
+            completed = bash_complete("vnode", "node", environ)
+        return completed, stdout.getvalue()
+
+    def test_bash_complete(self):
+        self.assertEqual(self.bash("vnode start -n ik"),
+                         (True, "iknl\niknl2\n"))
+        self.assertEqual(self.bash("vnode start --name=oth"),
+                         (True, "other\n"))
+        self.assertEqual(self.bash("vnode image pin -n iknl -e "),
+                         (True, "dev\nprod\n"))
+        self.assertEqual(self.bash("vnode start -e p"), (True, "prod\n"))
+
+        # commands and options are completed by click
+        self.assertEqual(self.bash("vnode st"), (False, ""))
+        self.assertEqual(self.bash("vnode start --"), (False, ""))
+        self.assertEqual(self.bash("vnode start -c "), (False, ""))
+        self.assertFalse(bash_complete("vnode", "node", {}))
+
+    @patch("docker.from_env")
+    def test_bash_complete_running(self, from_env):
+        from_env.return_value.api.containers.return_value = [
+            {"Labels": {"name": "iknl"}}
+        ]
+        self.assertEqual(self.bash("vnode stop -n "), (True, "iknl\n"))
+        self.assertEqual(self.bash("vnode --no-daemon attach -n i"),
+                         (True, "iknl\n"))
+
+
+class CompletionOptionsTest(unittest.TestCase):
+
+    def test_configuration_folders(self):
+        self.assertEqual(completion.APPNAME, APPNAME)
+        for type_, context in (("node", NodeContext),
+                               ("server", ServerContext)):
+            self.assertEqual(
+                configuration_folders(type_),
+                [context.instance_folders(type_, "", system)["config"]
+                 for system in (False, True)]
+            )
+
+    def test_options(self):
+        # bash_complete relies on -n and -e taking the name and environment
+        # in every command
+        def check(group):
+            for command in group.commands.values():
+                if hasattr(command, "commands"):
+                    check(command)
+                    continue
+                for param in command.params:
+                    opts = set(param.opts)
+                    self.assertEqual(param.name == "name",
+                                     opts == set(NAME_OPTIONS))
+                    self.assertEqual(param.name == "environment",
+                                     opts == set(ENVIRONMENT_OPTIONS))
+        check(cli_node)
+        check(cli_server)
+
+    def test_entry_completes_before_importing_cli(self):
+        with tempfile.TemporaryDirectory() as home:
+            folder = Path(home, "config", APPNAME, "node")
+            folder.mkdir(parents=True)
+            (folder / "iknl.yaml").write_text(CONFIG)
+            env = dict(os.environ, _VNODE_COMPLETE="complete",
+                       COMP_WORDS="vnode start -n ", COMP_CWORD="3",
+                       XDG_CONFIG_HOME=str(Path(home, "config")),
+                       XDG_CONFIG_DIRS=str(Path(home, "site")),
+                       XDG_CACHE_HOME=str(Path(home, "cache")))
+            result = subprocess.run(
+                [sys.executable, "-c",
+                 "import sys\n"
+                 "from vantage6.cli.entry import vnode\n"
+                 "sys.argv = ['vnode']\n"
+                 "try:\n"
+                 "    vnode()\n"
+                 "finally:\n"
+                 "    print(sorted(m for m in sys.modules if m in\n"
+                 "          ('click', 'docker', 'vantage6.common')),\n"
+                 "          file=sys.stderr)\n"],
+                env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                universal_newlines=True, timeout=30
+            )
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout, "iknl\n")
+        self.assertTrue(result.stderr.endswith("[]\n"), result.stderr)
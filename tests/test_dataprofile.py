@@ -0,0 +1,146 @@
+import json
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+from click.testing import CliRunner
+
+from vantage6.cli import dataprofile
+from vantage6.cli.dataprofile import (
+    ProfileCache,
+    fingerprint,
+    profile_database,
+    profile_file
+)
+from vantage6.cli.node import cli_node_data_profile
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+CSV = (
+    "age;weight;name;empty\n"
+    "42;70.5;ann;\n"
+    ";80;bob;\n"
+    "7;-1.5;\"c;d\";\n"
+    "13;nan;ann\n"
+)
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class DataProfileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name, "db.csv")
+        self.path.write_text(CSV)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_profile(self):
+        profile = profile_file(self.path)
+
+        self.assertEqual(profile["rows"], 4)
+        self.assertEqual(profile["delimiter"], ";")
+        age = profile["columns"]["age"]
+        self.assertEqual((age["type"], age["missing"], age["min"],
+                          age["max"]), ("integer", 1, 7, 42))
+        self.assertAlmostEqual(age["mean"], 62 / 3)
+        weight = profile["columns"]["weight"]
+        self.assertEqual((weight["type"], weight["min"], weight["max"]),
+                         ("float", -1.5, 80))
+        name = profile["columns"]["name"]
+        self.assertEqual((name["type"], name["distinct"],
+                          name["max_length"]), ("string", 3, 3))
+        self.assertEqual(profile["columns"]["empty"]["type"], "empty")
+
+    def test_ranges_match_single_process(self):
+        lines = ["a,b"] + [f"{i},{'x' * (i % 7)}" for i in range(5000)]
+        self.path.write_text("\n".join(lines) + "\n")
+        single = profile_file(self.path, workers=1, chunk_size=1000)
+
+        with patch("vantage6.cli.dataprofile.PARALLEL_THRESHOLD", 0):
+            parallel = profile_file(self.path, workers=3, chunk_size=1000)
+
+        self.assertEqual(parallel, single)
+        self.assertEqual(single["rows"], 5000)
+        self.assertEqual(single["columns"]["a"]["max"], 4999)
+
+    def test_column_turns_out_to_be_text(self):
+        lines = ["a,b,c"] + [f"{i},{i % 3},{i}" for i in range(3000)]
+        lines[2500] = "2499,x,"
+        self.path.write_text("\n".join(lines) + "\n")
+
+        profile = profile_file(self.path, workers=1, chunk_size=1000)
+
+        self.assertEqual(profile["rows"], 3000)
+        b = profile["columns"]["b"]
+        self.assertEqual((b["type"], b["distinct"], b["min_length"],
+                          b["max_length"]), ("string", 4, 1, 1))
+        c = profile["columns"]["c"]
+        self.assertEqual((c["type"], c["missing"], c["max"]),
+                         ("integer", 1, 2999))
+
+    def test_numpy_without_quotechar(self):
+        """Before NumPy 1.23, only quoted values need the csv module."""
+        loadtxt = numpy.loadtxt
+
+        def old_loadtxt(*args, **kwargs):
+            if "quotechar" in kwargs:
+                raise TypeError("unexpected keyword argument 'quotechar'")
+            return loadtxt(*args, **kwargs)
+
+        expected = profile_file(self.path)
+        with patch("numpy.loadtxt", old_loadtxt), \
+                patch("vantage6.cli.dataprofile._parse",
+                      wraps=dataprofile._parse) as parse:
+            self.assertEqual(profile_file(self.path), expected)
+            parse.assert_called()
+            parse.reset_mock()
+
+            self.path.write_text("a;b\n1;0.5\n2;\n")
+            profile = profile_file(self.path)
+            parse.assert_not_called()
+        self.assertEqual(profile["columns"]["a"]["max"], 2)
+
+    def test_cache(self):
+        cache = ProfileCache(Path(self.tmp.name, "profiles"))
+        profile, cached = profile_database(self.path, cache)
+        self.assertFalse(cached)
+
+        with patch("vantage6.cli.dataprofile.profile_file") as profile_file_:
+            self.assertEqual(profile_database(self.path, cache),
+                             (profile, True))
+            profile_file_.assert_not_called()
+
+        # same size and timestamp, different content
+        stat = self.path.stat()
+        self.path.write_text(CSV.replace("42", "43"))
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertIsNone(cache.get(self.path, fingerprint(self.path)))
+        profile, cached = profile_database(self.path, cache)
+        self.assertFalse(cached)
+        self.assertEqual(profile["columns"]["age"]["max"], 43)
+
+    @patch("vantage6.cli.node.NodeContext")
+    def test_cli(self, context):
+        context.config_exists.return_value = True
+        context.return_value = MagicMock(
+            data_dir=Path(self.tmp.name),
+            databases={"default": str(self.path)}
+        )
+
+        result = CliRunner().invoke(cli_node_data_profile,
+                                    ["-n", "iknl", "--json"])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(json.loads(result.output)["default"]["rows"], 4)
+
+        result = CliRunner().invoke(cli_node_data_profile,
+                                    ["-n", "iknl", "-d", "other"])
+        self.assertEqual(result.exit_code, 1)
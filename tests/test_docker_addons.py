@@ -0,0 +1,65 @@
+import unittest
+
+from unittest.mock import MagicMock
+
+from vantage6.cli.globals import APPNAME
+from vantage6.cli.docker_addons import (
+    get_or_create_network,
+    find_local_server,
+    published_ports
+)
+
+
+def container(name, ports, labels=None):
+    container = MagicMock(
+        attrs={"NetworkSettings": {"Ports": ports}},
+        labels=labels or {}
+    )
+    container.name = name
+    return container
+
+
+class DockerAddonsTest(unittest.TestCase):
+
+    def test_get_or_create_network(self):
+        client = MagicMock()
+        existing = MagicMock()
+        existing.name = "vantage6-local"
+        similar = MagicMock()
+        similar.name = "vantage6-local-2"
+
+        client.networks.list.return_value = [similar, existing]
+        self.assertIs(get_or_create_network(client, "vantage6-local"),
+                      existing)
+        client.networks.create.assert_not_called()
+
+        client.networks.list.return_value = [similar]
+        get_or_create_network(client, "vantage6-local")
+        client.networks.create.assert_called_once()
+
+    def test_published_ports(self):
+        server = container("s", {
+            "5000/tcp": [{"HostIp": "127.0.0.1", "HostPort": "5001"}],
+            "80/tcp": None
+        })
+        self.assertEqual(published_ports(server), {"5001": "5000"})
+
+    def test_find_local_server(self):
+        client = MagicMock()
+        server = container(f"{APPNAME}-iknl-system-server", {
+            "5000/tcp": [{"HostIp": "127.0.0.1", "HostPort": "5000"}]
+        })
+        database = container(f"{APPNAME}-iknl-system-server-db", {},
+                             {"vantage6-role": "database"})
+        client.containers.list.return_value = [database, server]
+
+        self.assertEqual(
+            find_local_server(client, "http://localhost", 5000),
+            (server, "5000")
+        )
+        self.assertIsNone(find_local_server(client, "http://localhost", 80))
+
+        # a remote server is never looked up
+        self.assertIsNone(
+            find_local_server(client, "https://petronas.vantage6.ai", 5000)
+        )
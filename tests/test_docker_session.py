@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+import unittest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import docker
+
+from click.testing import CliRunner
+
+from vantage6.cli.docker_session import DockerNotRunning, DockerSession
+from vantage6.cli.node import cli_node_stop
+
+
+def summary(name):
+    """Container as returned by the list endpoint of the Docker API."""
+    return {
+        "Id": f"{name}-id",
+        "Names": [f"/{name}"],
+        "Image": "node",
+        "Labels": {"vantage6-type": "node"},
+        "State": "running",
+    }
+
+
+class StubDocker(BaseHTTPRequestHandler):
+    """Minimal Docker daemon that records the requests it receives."""
+    protocol_version = "HTTP/1.1"
+    containers = []
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self.requests.append(("GET", self.path))
+        if self.path.startswith("/v1.35/containers/json"):
+            self.reply(200, [summary(n) for n in self.containers])
+        elif self.path.endswith("/json"):
+            id_ = self.path.split("/")[3]
+            name = id_[:-3] if id_.endswith("-id") else id_
+            self.reply(200, dict(summary(name), Name=f"/{name}",
+                                 Config={"Labels": {}},
+                                 State={"Status": "running"}))
+        else:
+            self.reply(404, {"message": "not found"})
+
+    def do_POST(self):
+        self.requests.append(("POST", self.path))
+        self.reply(204)
+
+
+class DockerSessionTest(unittest.TestCase):
+
+    def setUp(self):
+        StubDocker.containers = ["vantage6-a-user", "vantage6-b-user",
+                                 "vantage6-c-user"]
+        StubDocker.requests = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubDocker)
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.host = f"tcp://127.0.0.1:{self.server.server_address[1]}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_sparse_containers_are_cached(self):
+        session = DockerSession(docker.DockerClient(base_url=self.host))
+
+        containers = session.containers("node")
+        self.assertEqual([c.name for c in containers],
+                         StubDocker.containers)
+        self.assertEqual(containers[0].labels, {"vantage6-type": "node"})
+
+        # the lookup by name is served from the cache
+        self.assertIs(session.container("vantage6-b-user"), containers[1])
+        self.assertEqual(session.api_calls, 1)
+
+        session.forget("vantage6-b-user")
+        session.container("vantage6-b-user")
+        self.assertEqual(session.api_calls, 2)
+        self.assertEqual(session.calls["GET /containers/{id}/json"], 1)
+
+    def test_stop_all_round_trips(self):
+        with patch.dict(os.environ, {"DOCKER_HOST": self.host}):
+            result = CliRunner().invoke(cli_node_stop, ["--all"])
+
+        self.assertEqual(result.exit_code, 0)
+        # one list, one kill per container: no ping, inspects or lookups
+        self.assertEqual(len(StubDocker.requests), 4)
+        self.assertEqual(
+            [path.split("?")[0] for _, path in StubDocker.requests],
+            ["/v1.35/containers/json"] +
+            [f"/v1.35/containers/{n}-id/kill" for n in StubDocker.containers]
+        )
+
+    def test_docker_not_running(self):
+        self.server.shutdown()
+        self.server.server_close()
+        session = DockerSession(docker.DockerClient(base_url=self.host))
+
+        with self.assertRaises(DockerNotRunning):
+            session.containers()
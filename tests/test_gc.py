@@ -0,0 +1,125 @@
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import docker
+
+from click.testing import CliRunner
+
+from vantage6.cli.gc import DAY, MB, TaskFolder, scan, select, remove
+from vantage6.cli.node import cli_node_gc
+
+NOW = 100 * DAY
+
+
+def task_folder(name, age_days, size_mb=0):
+    return TaskFolder(name, NOW - age_days * DAY, size_mb * MB)
+
+
+class GarbageCollectorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_task(self, name, age_days, size):
+        path = self.folder / name
+        (path / "output").mkdir(parents=True)
+        (path / "input").write_bytes(b"x" * size)
+        (path / "output" / "result").write_bytes(b"y" * size)
+        mtime = NOW - age_days * DAY
+        for file_ in (path / "input", path / "output" / "result",
+                      path / "output", path):
+            os.utime(file_, (mtime, mtime))
+        return path
+
+    def test_scan(self):
+        self.make_task("task-000000001", 3, 100)
+        self.make_task("task-000000002", 1, 50)
+        (self.folder / "docker-config").mkdir()
+
+        folders = {f.path.name: f for f in scan(self.folder)}
+
+        self.assertEqual(set(folders), {"task-000000001", "task-000000002"})
+        self.assertEqual(folders["task-000000001"].size, 200)
+        self.assertEqual(folders["task-000000001"].mtime, NOW - 3 * DAY)
+        self.assertEqual(scan(self.folder / "missing"), [])
+
+    def test_scan_uses_newest_mtime(self):
+        """A file written deep inside a task folder keeps it recent."""
+        path = self.make_task("task-000000001", 3, 100)
+        recent = NOW - 60
+        os.utime(path / "output" / "result", (recent, recent))
+
+        folders = scan(self.folder)
+
+        self.assertEqual(folders[0].mtime, recent)
+        self.assertEqual(select(folders, max_age=1, now=NOW), [])
+
+    def test_select(self):
+        folders = [task_folder(f"task-{age}", age, size_mb=10)
+                   for age in range(1, 11)]
+
+        def selected(**policy):
+            return sorted(f.path.name for f in select(folders, now=NOW,
+                                                      **policy))
+
+        self.assertEqual(selected(max_age=8.5), ["task-10", "task-9"])
+        self.assertEqual(selected(max_count=8), ["task-10", "task-9"])
+        self.assertEqual(selected(max_size=75),
+                         ["task-10", "task-8", "task-9"])
+        self.assertEqual(len(selected(max_age=5, max_count=2)), 8)
+
+    def test_recent_folders_are_kept(self):
+        folders = [TaskFolder("task-running", NOW - 60, 500 * MB)]
+        self.assertEqual(select(folders, max_count=0, max_size=1, now=NOW),
+                         [])
+
+    def test_remove(self):
+        path = self.make_task("task-000000001", 3, 10)
+        errors = remove([TaskFolder(path, 0),
+                         TaskFolder(self.folder / "task-missing", 0)])
+        self.assertFalse(path.exists())
+        self.assertEqual(list(errors), [self.folder / "task-missing"])
+
+    @patch("docker.DockerClient.volumes")
+    @patch("vantage6.cli.node.NodeContext")
+    def test_cli_dry_run(self, context, volumes):
+        volumes.get.side_effect = docker.errors.NotFound("no volume")
+        self.make_task("task-000000001", 3, 10)
+        context.config_exists.return_value = True
+        context.return_value = MagicMock(data_dir=self.folder, config={
+            "retention": {"max_age": 1}
+        })
+
+        result = CliRunner().invoke(cli_node_gc, ["-n", "iknl", "--dry-run"])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn("task-000000001", result.output)
+        self.assertTrue((self.folder / "task-000000001").exists())
+
+        result = CliRunner().invoke(cli_node_gc, ["-n", "iknl"])
+        self.assertEqual(result.exit_code, 0)
+        self.assertFalse((self.folder / "task-000000001").exists())
+
+    @patch("vantage6.cli.node.NodeContext")
+    def test_cli_without_docker(self, context):
+        """The host folders are cleaned when Docker is not running."""
+        self.make_task("task-000000001", 3, 10)
+        context.config_exists.return_value = True
+        context.return_value = MagicMock(data_dir=self.folder, config={
+            "retention": {"max_age": 1}
+        })
+
+        with patch.dict(os.environ,
+                        {"DOCKER_HOST": f"unix://{self.folder}/none.sock"}):
+            result = CliRunner().invoke(cli_node_gc, ["-n", "iknl"])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertFalse((self.folder / "task-000000001").exists())
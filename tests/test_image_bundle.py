@@ -0,0 +1,151 @@
+import hashlib
+import io
+import json
+import tarfile
+import tempfile
+import unittest
+
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import docker
+
+from vantage6.cli.image_bundle import (
+    BundleError,
+    ImageIndex,
+    save_bundle,
+    load_bundle,
+    deduplication
+)
+
+SHARED_LAYER = b"layer-data" * 1000
+
+
+def archive(name):
+    """Return a `docker save` archive of a single image."""
+    id_ = name.replace(":", "-")
+    files = {
+        "manifest.json": json.dumps([{
+            "Config": f"{id_}.json",
+            "RepoTags": [name],
+            "Layers": ["shared/layer.tar", f"{id_}/layer.tar"]
+        }]).encode(),
+        "repositories": json.dumps(
+            {name.split(":")[0]: {name.split(":")[1]: id_}}).encode(),
+        f"{id_}.json": b"{}",
+        "shared/layer.tar": SHARED_LAYER,
+        f"{id_}/layer.tar": id_.encode() * 10,
+    }
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode="w") as tar:
+        for file_name, content in files.items():
+            info = tarfile.TarInfo(file_name)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    data = data.getvalue()
+    # in chunks, like docker-py returns it
+    return [data[i:i + 4000] for i in range(0, len(data), 4000)]
+
+
+def docker_client(loaded=("node:latest",)):
+    client = MagicMock()
+    client.images.get.side_effect = lambda name: MagicMock(
+        id=name if name.startswith("sha256:") else f"sha256:{name}",
+        attrs={"RepoDigests": [], "Size": 20000})
+    client.api.get_image.side_effect = lambda name, chunk_size: iter(
+        archive(name))
+    client.api.load_image.side_effect = lambda data: (
+        [{"stream": f"Loaded image: {name}\n"} for name in loaded]
+        if b"".join(data) else []
+    )
+    return client
+
+
+class ImageBundleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_save_bundle(self):
+        client = docker_client()
+
+        path, manifest = save_bundle(client, ["node:latest", "algo:1"],
+                                     self.folder)
+
+        self.assertEqual(client.api.get_image.call_count, 2)
+
+        data = path.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()
+        self.assertEqual(path, self.folder / f"{digest}.tar")
+        self.assertEqual(manifest["bundle"], f"sha256:{digest}")
+        self.assertEqual(manifest["size"], len(data))
+        self.assertEqual([i["name"] for i in manifest["images"]],
+                         ["node:latest", "algo:1"])
+        self.assertEqual(json.loads(path.with_suffix(".json").read_text()),
+                         manifest)
+
+        # one archive with both images and the shared layer stored once
+        with tarfile.open(path) as tar:
+            names = tar.getnames()
+            self.assertEqual(names.count("shared/layer.tar"), 1)
+            self.assertIn("node-latest/layer.tar", names)
+            self.assertIn("algo-1/layer.tar", names)
+            images = json.load(tar.extractfile("manifest.json"))
+            repositories = json.load(tar.extractfile("repositories"))
+        self.assertEqual([i["RepoTags"] for i in images],
+                         [["node:latest"], ["algo:1"]])
+        self.assertEqual(set(repositories), {"node", "algo"})
+        self.assertGreater(deduplication(manifest), 0)
+
+    def test_load_bundle(self):
+        client = docker_client()
+        path, _ = save_bundle(client, ["node:latest"], self.folder)
+        index = ImageIndex(self.folder / "images.json")
+
+        loaded = load_bundle(client, path, index)
+
+        self.assertEqual(loaded, ["node:latest"])
+        index = ImageIndex(self.folder / "images.json")
+        self.assertEqual(index.images["node:latest"]["id"],
+                         "sha256:node:latest")
+        self.assertTrue(index.is_loaded(client, "node:latest"))
+        self.assertFalse(index.is_loaded(client, "other:latest"))
+
+    def test_load_pinned_image(self):
+        """An image pinned to a digest is loaded without a name."""
+        pinned = "node@sha256:" + "a" * 64
+        client = docker_client(loaded=())
+        path, _ = save_bundle(client, [pinned], self.folder)
+        index = ImageIndex(self.folder / "images.json")
+
+        self.assertEqual(load_bundle(client, path, index), [pinned])
+        self.assertEqual(index.local_reference(pinned), f"sha256:{pinned}")
+        self.assertTrue(index.is_loaded(client, pinned))
+        client.images.get.assert_called_with(f"sha256:{pinned}")
+
+    def test_load_corrupt_bundle(self):
+        client = docker_client()
+        path, _ = save_bundle(client, ["node:latest"], self.folder)
+        path.write_bytes(path.read_bytes()[:-1])
+        index = ImageIndex(self.folder / "images.json")
+
+        with self.assertRaises(BundleError):
+            load_bundle(client, path, index)
+        self.assertEqual(index.images, {})
+        # nothing is loaded into Docker
+        client.api.load_image.assert_not_called()
+
+    def test_replaced_image_is_not_from_bundle(self):
+        index = ImageIndex(self.folder / "images.json")
+        index.record("node:latest", "sha256:old", "sha256:bundle")
+        client = MagicMock()
+        client.images.get.return_value = MagicMock(id="sha256:new")
+
+        self.assertFalse(index.is_loaded(client, "node:latest"))
+
+        client.images.get.side_effect = docker.errors.ImageNotFound("gone")
+        self.assertFalse(index.is_loaded(client, "node:latest"))
@@ -0,0 +1,87 @@
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+import docker
+
+from vantage6.cli.image_pin import (
+    PinError,
+    local_digest,
+    pin_image,
+    pinned_image
+)
+
+OLD = "sha256:" + "a" * 64
+NEW = "sha256:" + "b" * 64
+IMAGE = "harbor.vantage6.ai/infrastructure/node:latest"
+REPOSITORY = "harbor.vantage6.ai/infrastructure/node"
+
+
+def context(config):
+    return MagicMock(config=config, environment="application")
+
+
+class ImagePinTest(unittest.TestCase):
+
+    def test_pinned_image(self):
+        self.assertIsNone(pinned_image({}, IMAGE))
+        self.assertEqual(pinned_image({"image_digest": OLD}, IMAGE),
+                         f"{REPOSITORY}@{OLD}")
+        self.assertEqual(
+            pinned_image({"image": "localhost:5000/node:dev",
+                          "image_digest": OLD}, IMAGE),
+            f"localhost:5000/node@{OLD}"
+        )
+
+    def test_local_digest(self):
+        client = MagicMock()
+        client.images.get.return_value.attrs = {"RepoDigests": [
+            f"mirror.local/node@{NEW}", f"{REPOSITORY}@{OLD}"
+        ]}
+        self.assertEqual(local_digest(client, IMAGE), OLD)
+
+        client.images.get.side_effect = docker.errors.ImageNotFound("")
+        self.assertIsNone(local_digest(client, IMAGE))
+
+    @patch("vantage6.cli.image_pin.pull_images", return_value={})
+    def test_pin_uses_local_image(self, pull):
+        client = MagicMock()
+        client.images.get.return_value.attrs = {
+            "RepoDigests": [f"{REPOSITORY}@{OLD}"]
+        }
+        ctx = context({})
+
+        self.assertEqual(pin_image(client, ctx, IMAGE), (None, OLD))
+
+        # no registry lookup or pull was needed
+        client.images.get_registry_data.assert_not_called()
+        pull.assert_not_called()
+        self.assertEqual(ctx.config, {"image_digest": OLD})
+        ctx.config_manager.put.assert_called_once_with("application",
+                                                       ctx.config)
+        ctx.config_manager.save.assert_called_once_with(ctx.config_file)
+
+    @patch("vantage6.cli.image_pin.pull_images", return_value={})
+    def test_upgrade(self, pull):
+        client = MagicMock()
+        client.images.get.side_effect = docker.errors.ImageNotFound("")
+        client.images.get_registry_data.return_value.id = NEW
+        ctx = context({"image_digest": OLD})
+
+        self.assertEqual(pin_image(client, ctx, IMAGE, upgrade=True),
+                         (OLD, NEW))
+
+        client.images.get_registry_data.assert_called_once_with(IMAGE)
+        pull.assert_called_once_with(client, [f"{REPOSITORY}@{NEW}"])
+        self.assertEqual(ctx.config["image_digest"], NEW)
+
+    def test_unresolvable_image(self):
+        client = MagicMock()
+        client.images.get.side_effect = docker.errors.ImageNotFound("")
+        client.images.get_registry_data.side_effect = \
+            docker.errors.NotFound("manifest unknown")
+        ctx = context({})
+
+        with self.assertRaises(PinError):
+            pin_image(client, ctx, IMAGE)
+        ctx.config_manager.save.assert_not_called()
@@ -0,0 +1,131 @@
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import docker
+
+from vantage6.cli.metrics import (
+    collect,
+    render,
+    write_textfile,
+    read_cgroup_usage,
+    parse_docker_time
+)
+
+module_path = "vantage6.cli.metrics"
+
+
+def container(name, state):
+    """Container as returned by the list endpoint of the Docker API."""
+    return {
+        "Id": f"{name}-id",
+        "Names": [f"/{name}"],
+        "Image": "harbor.vantage6.ai/infrastructure/node",
+        "ImageID": "sha256:abc",
+        "Labels": {"vantage6-type": "node", "name": name},
+        "State": state,
+    }
+
+
+def inspect(id_):
+    if id_ == "gone-id":
+        raise docker.errors.NotFound("removed")
+    return {
+        "RestartCount": 2,
+        "State": {"Running": True, "StartedAt": "2020-04-21T08:00:00.5Z"},
+    }
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_parse_docker_time(self):
+        self.assertEqual(
+            parse_docker_time("2020-04-21T08:51:58.25Z"),
+            parse_docker_time("2020-04-21T10:51:58.25+02:00")
+        )
+        self.assertAlmostEqual(
+            parse_docker_time("1970-01-01T00:00:01.123456789Z"), 1.123456789
+        )
+
+    def test_read_cgroup_usage_v2(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            folder = Path(tmp) / "system.slice" / "docker-abc.scope"
+            folder.mkdir(parents=True)
+            (folder / "memory.current").write_text("1048576\n")
+            (folder / "cpu.stat").write_text("usage_usec 2500000\n"
+                                             "user_usec 2000000\n")
+
+            self.assertEqual(read_cgroup_usage("abc", Path(tmp)),
+                             (2.5, 1048576))
+            self.assertEqual(read_cgroup_usage("xyz", Path(tmp)),
+                             (None, None))
+
+    @patch(f"{module_path}.ServerContext")
+    @patch(f"{module_path}.NodeContext")
+    @patch(f"{module_path}.read_cgroup_usage")
+    def test_collect(self, cgroup, node_context, server_context):
+        cgroup.return_value = (1.5, 2048)
+        config = MagicMock(available_environments=["application"])
+        config.name = "iknl"
+        config.get.return_value = {"databases": {"default": "a.csv",
+                                                 "other": "b.csv"}}
+        node_context.available_configurations.return_value = ([config], [])
+        server_context.available_configurations.return_value = ([], [])
+
+        client = MagicMock()
+        client.api.containers.return_value = [
+            container("iknl", "running"), container("other", "exited"),
+            container("gone", "running")
+        ]
+        client.api.inspect_container.side_effect = inspect
+        client.api.inspect_image.return_value = {
+            "Metadata": {"LastTagTime": "2020-04-20T08:00:00Z"}
+        }
+
+        now = parse_docker_time("2020-04-21T08:01:00Z")
+        output = render(collect(client, now=now))
+
+        # a single, label filtered, container query. Only the running
+        # containers are inspected, a container that has been removed
+        # since is left out.
+        client.api.containers.assert_called_once_with(
+            all=True, filters={"label": "vantage6-type"})
+        client.containers.list.assert_not_called()
+        self.assertEqual(
+            [c[0][0] for c in client.api.inspect_container.call_args_list],
+            ["iknl-id", "gone-id"]
+        )
+        self.assertNotIn('container="gone"', output)
+        client.api.inspect_image.assert_called_once_with("sha256:abc")
+        cgroup.assert_called_once_with("iknl-id")
+
+        self.assertIn("# TYPE vantage6_container_up gauge", output)
+        self.assertIn('vantage6_container_up{container="iknl",'
+                      'instance="iknl",type="node"} 1', output)
+        self.assertIn('vantage6_container_up{container="other",'
+                      'instance="other",type="node"} 0', output)
+        self.assertIn('vantage6_container_uptime_seconds{container="iknl",'
+                      'instance="iknl",type="node"} 59.5', output)
+        self.assertIn('vantage6_container_memory_bytes{container="iknl",'
+                      'instance="iknl",type="node"} 2048', output)
+        self.assertIn('vantage6_configured_databases{environment='
+                      '"application",instance="iknl",scope="system"} 2',
+                      output)
+        self.assertIn('vantage6_container_restarts_total{container="iknl",'
+                      'instance="iknl",type="node"} 2', output)
+        self.assertNotIn('vantage6_container_restarts_total{container='
+                         '"other"', output)
+        self.assertIn("vantage6_image_last_pull_timestamp_seconds", output)
+
+    def test_write_textfile(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "vantage6.prom"
+            path.write_text("old")
+
+            write_textfile(path, "new\n")
+
+            self.assertEqual(path.read_text(), "new\n")
+            self.assertEqual(os.listdir(tmp), ["vantage6.prom"])
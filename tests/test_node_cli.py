@@ -8,22 +8,28 @@ from click.testing import CliRunner
 import contextlib
 from io import StringIO
 
-from vantage6.cli.globals import APPNAME
+from vantage6.cli.globals import APPNAME, SPEC_HASH_LABEL
 from vantage6.common import STRING_ENCODING
+import requests
+import docker
 from docker.errors import APIError
 from vantage6.cli.node import (
+    cli_node,
     cli_node_list,
     cli_node_new_configuration,
     cli_node_files,
     cli_node_start,
+    cli_node_restart,
+    cli_node_prefetch,
     cli_node_stop,
     cli_node_attach,
     cli_node_create_private_key,
+    cli_node_image_save,
     cli_node_clean,
     print_log_worker,
-    create_client_and_authenticate,
-    check_if_docker_deamon_is_running
+    create_client_and_authenticate
 )
+from vantage6.cli.supervisor import Daemon
 
 
 class NodeCLITest(unittest.TestCase):
@@ -33,10 +39,10 @@ class NodeCLITest(unittest.TestCase):
         logging.getLogger("docker.utils.config").setLevel(logging.WARNING)
         return super().setUpClass()
 
-    @patch("docker.DockerClient.ping")
-    def test_list_docker_not_running(self, docker_ping):
+    @patch("docker.api.client.APIClient.send")
+    def test_list_docker_not_running(self, send):
         """An error is printed when docker is not running"""
-        docker_ping.side_effect = Exception('Boom!')
+        send.side_effect = requests.exceptions.ConnectionError('Boom!')
 
         runner = CliRunner()
         result = runner.invoke(cli_node_list, [])
@@ -59,7 +65,7 @@ class NodeCLITest(unittest.TestCase):
         docker_ping.return_value = True
 
         # docker deamon returns a list of running node-containers
-        container1 = MagicMock()
+        container1 = MagicMock(labels={f"{APPNAME}-type": "node"})
         container1.name = f"{APPNAME}-iknl-user"
         containers.list.return_value = [container1]
 
@@ -203,22 +209,25 @@ class NodeCLITest(unittest.TestCase):
         # check for non zero exit-code
         self.assertNotEqual(result.exit_code, 0)
 
+    @patch("vantage6.cli.node.find_local_server")
+    @patch("docker.DockerClient.networks")
     @patch("docker.DockerClient.volumes")
-    @patch("vantage6.cli.node.pull_if_newer")
+    @patch("vantage6.cli.node.pull_images", return_value={})
     @patch("vantage6.cli.node.NodeContext")
     @patch("docker.DockerClient.containers")
-    @patch("vantage6.cli.node.check_if_docker_deamon_is_running")
-    def test_start(self, check_docker, client, context, pull, volumes):
+    def test_start(self, client, context, pull, volumes, networks,
+                   local_server):
 
         # client.containers = MagicMock(name="docker.DockerClient.containers")
         client.list.return_value = []
+        local_server.return_value = None
         volume = MagicMock()
         volume.name = "data-vol-name"
         volumes.create.return_value = volume
-        check_docker.return_value = True
         context.config_exists.return_value = True
 
         ctx = MagicMock(
+            config={},
             data_dir=Path("data"),
             log_dir=Path("logs"),
             config_dir=Path("configs")
@@ -233,13 +242,208 @@ class NodeCLITest(unittest.TestCase):
 
         self.assertEqual(result.exit_code, 0)
 
+    @patch("vantage6.cli.node.NodeConfigurationManager")
+    @patch("vantage6.cli.node.find_local_server")
+    @patch("docker.DockerClient.networks")
+    @patch("docker.DockerClient.volumes")
+    @patch("vantage6.cli.node.pull_images", return_value={})
+    @patch("vantage6.cli.node.NodeContext")
+    @patch("docker.DockerClient.containers")
+    def test_start_local_server(self, client, context, pull, volumes, networks,
+                                local_server, manager):
+        """A local server is reached through the shared network."""
+        client.list.return_value = []
+        networks.list.return_value = []
+        networks.create.return_value.name = "vantage6-local"
+        context.config_exists.return_value = True
+
+        server = MagicMock()
+        server.name = f"{APPNAME}-iknl-system-server"
+        local_server.return_value = (server, "5000")
+
+        ctx = MagicMock(
+            config={"server_url": "http://localhost", "port": 5000},
+            data_dir=Path("data"),
+            log_dir=Path("logs"),
+            config_dir=Path("configs"),
+            config_file=Path("configs/some-name.yaml")
+        )
+        ctx.get_data_file.return_value = "data.csv"
+        context.return_value = ctx
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            result = runner.invoke(cli_node_start, ['--name', 'some-name'])
+
+        self.assertEqual(result.exit_code, 0)
+
+        # the configuration points to the server container
+        config = manager.from_file.return_value.put.call_args[0][1]
+        self.assertEqual(config["server_url"],
+                         f"http://{APPNAME}-iknl-system-server")
+
+        kwargs = client.run.call_args[1]
+        self.assertEqual(kwargs["network"], "vantage6-local")
+        self.assertEqual(kwargs["volumes"][str(Path("data/docker-config"))],
+                         {"bind": "/mnt/config", "mode": "rw"})
+
+    @patch("docker.DockerClient.images")
+    @patch("vantage6.cli.node.find_local_server", return_value=None)
+    @patch("docker.DockerClient.networks")
+    @patch("docker.DockerClient.volumes")
+    @patch("vantage6.cli.node.pull_images", return_value={})
+    @patch("vantage6.cli.node.NodeContext")
     @patch("docker.DockerClient.containers")
-    @patch("vantage6.cli.node.check_if_docker_deamon_is_running")
-    def test_stop(self, check_docker, containers):
+    def test_restart(self, containers, context, pull, volumes, networks,
+                     local_server, images):
+        """A container with an unchanged spec is restarted in place."""
+        containers.list.return_value = []
+        context.config_exists.return_value = True
+        ctx = MagicMock(
+            config={},
+            data_dir=Path("data"),
+            log_dir=Path("logs"),
+            config_dir=Path("configs"),
+            config_file=Path("configs/iknl.yaml"),
+            docker_container_name=f"{APPNAME}-iknl-user"
+        )
+        ctx.get_data_file.return_value = "data.csv"
+        context.return_value = ctx
+        images.get.return_value.id = "sha256:image"
 
-        check_docker.return_value = True
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            runner.invoke(cli_node_start, ["--name", "iknl"])
+            labels = containers.run.call_args[1]["labels"]
+            containers.run.reset_mock()
+
+            existing = MagicMock(labels=labels, status="running",
+                                 attrs={"Image": "sha256:image"})
+            containers.get.return_value = existing
+            result = runner.invoke(cli_node_restart, ["--name", "iknl"])
+
+            self.assertEqual(result.exit_code, 0)
+            existing.restart.assert_called_once()
+            containers.run.assert_not_called()
+
+            # a different mount (or configuration) requires a new container
+            result = runner.invoke(cli_node_restart, [
+                "--name", "iknl", "--mount-src", "src"
+            ])
 
-        container1 = MagicMock()
+        self.assertEqual(result.exit_code, 0)
+        existing.remove.assert_called_once_with(force=True)
+        containers.run.assert_called_once()
+        self.assertNotEqual(containers.run.call_args[1]["labels"]
+                            [SPEC_HASH_LABEL], labels[SPEC_HASH_LABEL])
+        pull.assert_called_once()
+
+        # an image that is gone also requires a new container
+        existing.reset_mock()
+        containers.run.reset_mock()
+        images.get.side_effect = docker.errors.ImageNotFound("removed")
+        with runner.isolated_filesystem():
+            result = runner.invoke(cli_node_restart, ["--name", "iknl"])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        existing.restart.assert_not_called()
+        existing.remove.assert_called_once_with(force=True)
+        containers.run.assert_called_once()
+
+    @patch("docker.DockerClient.images")
+    @patch("vantage6.cli.node.find_local_server", return_value=None)
+    @patch("docker.DockerClient.networks")
+    @patch("docker.DockerClient.volumes")
+    @patch("vantage6.cli.node.pull_images", return_value={})
+    @patch("vantage6.cli.node.NodeContext")
+    @patch("docker.DockerClient.containers")
+    def test_daemon_restarts_kept_container(self, containers, context, pull,
+                                            volumes, networks, local_server,
+                                            images):
+        """The exited container of a crashed --keep node is restarted."""
+        containers.list.return_value = []
+        context.config_exists.return_value = True
+        ctx = MagicMock(
+            config={},
+            data_dir=Path("data"),
+            log_dir=Path("logs"),
+            config_dir=Path("configs"),
+            config_file=Path("configs/iknl.yaml"),
+            docker_container_name=f"{APPNAME}-iknl-user"
+        )
+        ctx.get_data_file.return_value = "data.csv"
+        context.return_value = ctx
+        images.get.return_value.id = "sha256:image"
+        args = ["--name", "iknl", "--keep"]
+
+        runner = CliRunner()
+        with runner.isolated_filesystem() as folder:
+            runner.invoke(cli_node_start, args)
+            labels = containers.run.call_args[1]["labels"]
+            containers.run.reset_mock()
+            crashed = MagicMock(labels=labels, status="exited",
+                                attrs={"Image": "sha256:image"})
+            containers.get.return_value = crashed
+
+            daemon = Daemon(cli_node, Path(folder, "daemon.sock"))
+            daemon.restart(args, folder)
+
+        crashed.start.assert_called_once()
+        containers.run.assert_not_called()
+
+    @patch("vantage6.cli.node.save_bundle")
+    @patch("vantage6.cli.node.missing_images", return_value=[])
+    @patch("vantage6.cli.node.NodeContext")
+    @patch("docker.DockerClient.images")
+    def test_image_save_pinned(self, images, context, missing, save):
+        """The bundle contains the pinned node image."""
+        digest = "sha256:" + "a" * 64
+        context.return_value = MagicMock(config={
+            "image_digest": digest, "algorithm_images": ["algo:1"]
+        })
+        save.return_value = (Path("bundle.tar"),
+                             {"size": 1, "images": [{"size": 1}]})
+
+        result = CliRunner().invoke(cli_node_image_save, ["-n", "iknl"])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(
+            save.call_args[0][1],
+            [f"harbor.vantage6.ai/infrastructure/node@{digest}", "algo:1"]
+        )
+
+    @patch("docker.DockerClient.images")
+    @patch("vantage6.cli.node.pull_images")
+    @patch("vantage6.cli.node.NodeContext")
+    def test_prefetch(self, context, pull, images):
+        """Configured and given algorithm images are pulled together."""
+        pinned = "harbor/algorithm@sha256:" + "a" * 64
+        context.config_exists.return_value = True
+        context.return_value = MagicMock(config={
+            "algorithm_images": ["harbor/summary:latest", pinned]
+        })
+        pull.return_value = {}
+
+        result = CliRunner().invoke(cli_node_prefetch, [
+            "--name", "iknl", "--image", "harbor/extra:1"
+        ])
+
+        self.assertEqual(result.exit_code, 0)
+        # the pinned image is available locally, it does not change
+        pull.assert_called_once()
+        self.assertEqual(pull.call_args[0][1],
+                         ["harbor/extra:1", "harbor/summary:latest"])
+
+        pull.return_value = {"harbor/extra:1": Exception("denied")}
+        result = CliRunner().invoke(cli_node_prefetch, [
+            "--name", "iknl", "--image", "harbor/extra:1"
+        ])
+        self.assertEqual(result.exit_code, 1)
+
+    @patch("docker.DockerClient.containers")
+    def test_stop(self, containers):
+
+        container1 = MagicMock(labels={f"{APPNAME}-type": "node"})
         container1.name = f"{APPNAME}-iknl-user"
         containers.list.return_value = [container1]
 
@@ -257,12 +461,10 @@ class NodeCLITest(unittest.TestCase):
     @patch("vantage6.cli.node.time")
     @patch("vantage6.cli.node.print_log_worker")
     @patch("docker.DockerClient.containers")
-    @patch("vantage6.cli.node.check_if_docker_deamon_is_running")
-    def test_attach(self, check_docker, containers, log_worker, time_):
+    def test_attach(self, containers, log_worker, time_):
         """Attach docker logs without errors."""
-        check_docker.return_value = True
 
-        container1 = MagicMock()
+        container1 = MagicMock(labels={f"{APPNAME}-type": "node"})
         container1.name = f"{APPNAME}-iknl-user"
         containers.list.return_value = [container1]
 
@@ -280,8 +482,7 @@ class NodeCLITest(unittest.TestCase):
 
     @patch("vantage6.cli.node.q")
     @patch("docker.DockerClient.volumes")
-    @patch("vantage6.cli.node.check_if_docker_deamon_is_running")
-    def test_clean(self, check_docker, volumes, q):
+    def test_clean(self, volumes, q):
         """Clean Docker volumes without errors."""
 
         volume1 = MagicMock()
@@ -371,8 +572,7 @@ class NodeCLITest(unittest.TestCase):
 
     @patch("vantage6.cli.node.q")
     @patch("docker.DockerClient.volumes")
-    @patch("vantage6.cli.node.check_if_docker_deamon_is_running")
-    def test_clean_docker_error(self, check_docker, volumes, q):
+    def test_clean_docker_error(self, volumes, q):
 
         volume1 = MagicMock()
         volume1.name = "some-name-tmpvol"
@@ -421,15 +621,3 @@ class NodeCLITest(unittest.TestCase):
         client.side_effect = Exception("Boom!")
         with self.assertRaises(Exception):
             create_client_and_authenticate(ctx)
-
-    @patch("vantage6.cli.node.error")
-    def test_check_docker(self, error):
-        docker = MagicMock()
-        try:
-            check_if_docker_deamon_is_running(docker)
-        except Exception:
-            self.fail("Exception raised!")
-
-        docker.ping.side_effect = Exception("Boom!")
-        with self.assertRaises(SystemExit):
-            check_if_docker_deamon_is_running(docker)
@@ -0,0 +1,87 @@
+import json
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from vantage6.cli.preload import (
+    MOUNT_PATH,
+    PRELOAD_SCRIPT,
+    preload_settings,
+    start_sidecar
+)
+
+
+class PreloadTest(unittest.TestCase):
+
+    def test_settings(self):
+        self.assertIsNone(preload_settings({}))
+        self.assertIsNone(preload_settings({"preload": {"enabled": True}},
+                                           enabled=False))
+        self.assertEqual(preload_settings({}, enabled=True),
+                         {"enabled": True})
+
+    def test_start_sidecar(self):
+        client = MagicMock()
+        client.containers.list.return_value = []
+        ctx = MagicMock(docker_container_name="vantage6-iknl-user",
+                        databases={"default": "/data/db.csv"})
+
+        volume = start_sidecar(client, ctx, "node-image",
+                               {"enabled": True, "size": "1g"})
+
+        self.assertEqual(volume, "vantage6-iknl-user-preload-vol")
+        client.volumes.create.assert_called_once_with(
+            volume, driver="local",
+            driver_opts={"type": "tmpfs", "device": "tmpfs",
+                         "o": f"size={1024 ** 3}"})
+        kwargs = client.containers.run.call_args[1]
+        self.assertEqual(kwargs["name"], "vantage6-iknl-user-preload")
+        self.assertEqual(kwargs["volumes"][volume]["bind"], MOUNT_PATH)
+        self.assertIn("/data/db.csv", kwargs["volumes"])
+
+        # a running sidecar is reused
+        running = MagicMock()
+        running.name = "vantage6-iknl-user-preload"
+        client.containers.list.return_value = [running]
+        client.containers.run.reset_mock()
+        start_sidecar(client, ctx, "node-image", {"enabled": True})
+        client.containers.run.assert_not_called()
+
+    def test_script(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source, target = Path(tmp, "source"), Path(tmp, "target")
+            source.mkdir()
+            target.mkdir()
+            (source / "default").write_text("age,name\n42,ann\n,bob\n")
+
+            process = subprocess.Popen(
+                [sys.executable, "-c", PRELOAD_SCRIPT, str(source),
+                 str(target), "60"],
+                stdout=subprocess.PIPE, universal_newlines=True
+            )
+            try:
+                self.assertIn("Preloaded default: 2 rows",
+                              process.stdout.readline())
+            finally:
+                process.kill()
+                process.wait()
+                process.stdout.close()
+
+            meta = json.loads((target / "default" / "meta.json").read_text())
+            self.assertEqual(meta["rows"], 2)
+            self.assertEqual(meta["columns"]["age"]["dtype"], "<f8")
+            self.assertEqual(meta["columns"]["name"]["dtype"], "<U3")
+
+            try:
+                import numpy
+            except ImportError:
+                return
+            age = numpy.load(target / "default" / "0000.npy", mmap_mode="r")
+            self.assertEqual(age[0], 42)
+            self.assertTrue(numpy.isnan(age[1]))
+            name = numpy.load(target / "default" / "0001.npy")
+            self.assertEqual(list(name), ["ann", "bob"])
@@ -0,0 +1,75 @@
+import unittest
+
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+from click.testing import CliRunner
+
+import docker
+
+from vantage6.cli.globals import APPNAME
+from vantage6.cli.node import cli_node
+from vantage6.cli.profiling import (
+    docker_endpoint,
+    DockerCallRecorder,
+    SamplingProfiler
+)
+
+
+class ProfilingTest(unittest.TestCase):
+
+    def test_docker_endpoint(self):
+        self.assertEqual(
+            docker_endpoint(
+                "GET", "http+docker://localhost/v1.40/containers/json?all=1"
+            ),
+            "GET /containers/json"
+        )
+        self.assertEqual(
+            docker_endpoint(
+                "POST", "http+docker://localhost/v1.40/containers/"
+                        "vantage6-iknl-user/kill"
+            ),
+            "POST /containers/{id}/kill"
+        )
+
+    def test_recorder_counts_api_calls(self):
+        client = docker.DockerClient(base_url="tcp://127.0.0.1:1")
+        with DockerCallRecorder() as recorder:
+            with self.assertRaises(Exception):
+                client.containers.list()
+
+        self.assertEqual(len(recorder), 1)
+        self.assertIn("GET /containers/json", recorder.summary())
+
+        # sending is restored afterwards
+        with self.assertRaises(Exception):
+            client.containers.list()
+        self.assertEqual(len(recorder), 1)
+
+    def test_sampling_profiler(self):
+        profiler = SamplingProfiler(interval=0.001)
+        profiler.start()
+        sum(i * i for i in range(300000))
+        profiler.stop()
+
+        self.assertTrue(profiler.samples)
+        self.assertIn("test_profiling.py", profiler.summary())
+
+    @patch("docker.DockerClient.containers")
+    @patch("vantage6.cli.node.NodeContext")
+    def test_profile_option(self, context, containers):
+        container1 = MagicMock()
+        container1.name = f"{APPNAME}-iknl-user"
+        containers.list.return_value = [container1]
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            context.instance_folders.return_value = {"log": Path("logs")}
+            result = runner.invoke(cli_node, [
+                "--profile", "cprofile", "stop", "--name", "iknl"
+            ])
+            files = sorted(p.suffix for p in Path("logs").iterdir())
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn("Profile written to", result.output)
+        self.assertEqual(files, [".prof", ".txt"])
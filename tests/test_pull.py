@@ -0,0 +1,108 @@
+import io
+import threading
+import time
+import unittest
+
+from unittest.mock import MagicMock
+
+from vantage6.cli.pull import (
+    PullError,
+    PullProgress,
+    PullStalled,
+    pull_image,
+    pull_images
+)
+
+
+def layer_events(layer, size, steps=2):
+    yield {"status": "Pulling fs layer", "id": layer}
+    for step in range(1, steps + 1):
+        yield {"status": "Downloading", "id": layer,
+               "progressDetail": {"current": size * step // steps,
+                                  "total": size}}
+    yield {"status": "Download complete", "id": layer}
+    yield {"status": "Pull complete", "id": layer}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class PullProgressTest(unittest.TestCase):
+
+    def test_aggregates_layers(self):
+        clock = FakeClock()
+        progress = PullProgress("harbor/infrastructure/node:latest",
+                                clock=clock)
+        progress.update({"status": "Pulling from infrastructure/node",
+                         "id": "latest"})
+        progress.update({"status": "Already exists", "id": "a"})
+        progress.update({"status": "Downloading", "id": "b",
+                         "progressDetail": {"current": 20e6,
+                                            "total": 100e6}})
+        progress.update({"status": "Downloading", "id": "c",
+                         "progressDetail": {"current": 20e6,
+                                            "total": 20e6}})
+        progress.update({"status": "Download complete", "id": "c"})
+        clock.now = 4
+
+        self.assertEqual(list(progress.layers), ["a", "b", "c"])
+        self.assertEqual(progress.downloaded, 40e6)
+        self.assertEqual(progress.total, 120e6)
+        self.assertEqual(progress.throughput, 10e6)
+        self.assertEqual(progress.eta, 8)
+        self.assertEqual(progress.summary(),
+                         "node:latest: 33% 40/120 MB, 2/3 layers, "
+                         "10.0 MB/s, ETA 8s")
+
+    def test_error_event(self):
+        progress = PullProgress("node")
+        with self.assertRaises(PullError):
+            progress.update({"error": "manifest unknown"})
+
+
+class PullImagesTest(unittest.TestCase):
+
+    def test_pulls_overlap(self):
+        def pull(repository, tag, stream, decode):
+            self.assertEqual(tag, "latest")
+            time.sleep(0.3)
+            yield from layer_events(repository, 10e6)
+
+        client = MagicMock()
+        client.api.pull.side_effect = pull
+
+        start = time.monotonic()
+        errors = pull_images(client, ["node", "server", "postgres"],
+                             interval=0.05, out=io.StringIO())
+
+        self.assertEqual(errors, {})
+        self.assertLess(time.monotonic() - start, 0.8)
+
+    def test_failed_pull(self):
+        client = MagicMock()
+        client.api.pull.side_effect = lambda *args, **kwargs: iter(
+            [{"error": "pull access denied"}])
+
+        errors = pull_images(client, ["private:1"], out=io.StringIO())
+
+        self.assertIsInstance(errors["private:1"], PullError)
+        self.assertIn("denied", str(errors["private:1"]))
+
+    def test_stalled_pull(self):
+        release = threading.Event()
+
+        def pull(*args, **kwargs):
+            yield {"status": "Pulling fs layer", "id": "a"}
+            release.wait()
+
+        client = MagicMock()
+        client.api.pull.side_effect = pull
+
+        with self.assertRaises(PullStalled):
+            pull_image(client, "node:1", stall_timeout=0.1)
+        release.set()
@@ -0,0 +1,71 @@
+import unittest
+import urllib.error
+
+from unittest.mock import MagicMock, patch
+
+from vantage6.cli.readiness import (
+    ContainerExited,
+    wait_until,
+    assert_running,
+    server_is_ready,
+    node_is_ready,
+    node_healthcheck,
+    NODE_READY_LOG_LINE
+)
+
+module_path = "vantage6.cli.readiness"
+
+
+class ReadinessTest(unittest.TestCase):
+
+    @patch(f"{module_path}.time")
+    def test_wait_until_backoff(self, time_):
+        time_.monotonic.return_value = 0
+        check = MagicMock(side_effect=[False, False, False, True])
+
+        wait_until(check, timeout=60, initial_delay=1, max_delay=3)
+
+        delays = [c[0][0] for c in time_.sleep.call_args_list]
+        self.assertEqual(delays, [1, 2, 3])
+
+    @patch(f"{module_path}.time")
+    def test_wait_until_timeout(self, time_):
+        time_.monotonic.side_effect = [0, 5, 11]
+
+        with self.assertRaises(TimeoutError):
+            wait_until(lambda: False, timeout=10)
+
+    def test_assert_running(self):
+        container = MagicMock(status="running")
+        assert_running(container)
+
+        container.status = "exited"
+        container.logs.return_value = b"Traceback"
+        with self.assertRaises(ContainerExited):
+            assert_running(container)
+
+    @patch(f"{module_path}.urllib.request.urlopen")
+    def test_server_is_ready(self, urlopen):
+        container = MagicMock(status="running")
+
+        urlopen.side_effect = ConnectionRefusedError()
+        self.assertFalse(server_is_ready(container, "http://server"))
+
+        # an error response still means that the server is up
+        urlopen.side_effect = urllib.error.HTTPError(
+            "http://server", 500, "Boom!", {}, None
+        )
+        self.assertTrue(server_is_ready(container, "http://server"))
+
+    def test_node_is_ready(self):
+        container = MagicMock(status="running")
+        container.logs.return_value = b"starting..."
+        self.assertFalse(node_is_ready(container))
+
+        container.logs.return_value += NODE_READY_LOG_LINE.encode()
+        self.assertTrue(node_is_ready(container))
+
+    def test_node_healthcheck(self):
+        check = node_healthcheck(5000)
+        self.assertEqual(check["test"][-1], "5000")
+        self.assertEqual(check["retries"], 3)
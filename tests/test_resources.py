@@ -0,0 +1,64 @@
+import json
+import unittest
+
+from schema import Schema
+
+from vantage6.cli.resources import (
+    VALIDATOR,
+    docker_resources,
+    host_defaults,
+    parse_size,
+    resources_environment
+)
+
+GB = 1024 ** 3
+
+
+class ResourcesTest(unittest.TestCase):
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size("512m"), 512 * 1024 ** 2)
+        self.assertEqual(parse_size("2G"), 2 * GB)
+        self.assertEqual(parse_size("1.5gb"), int(1.5 * GB))
+        self.assertEqual(parse_size(1000), 1000)
+        with self.assertRaises(ValueError):
+            parse_size("a lot")
+
+    def test_validator(self):
+        schema = Schema(VALIDATOR)
+        self.assertTrue(schema.is_valid({
+            "cpus": 2, "memory": "8g", "shm_size": "1g",
+            "ulimits": {"nofile": 1024, "nproc": {"soft": 10, "hard": 20}}
+        }))
+        self.assertFalse(schema.is_valid({"cpus": 0}))
+        self.assertFalse(schema.is_valid({"memory": "8 apples"}))
+        self.assertFalse(schema.is_valid({"ulimits": {"nofile": "many"}}))
+
+    def test_docker_resources(self):
+        settings = docker_resources({
+            "cpus": 1.5, "memory": "4g", "shm_size": "512m",
+            "tmpfs_size": "1g", "ulimits": {"nofile": 1024}
+        })
+        self.assertEqual(settings, {
+            "nano_cpus": 1500000000,
+            "mem_limit": 4 * GB,
+            "shm_size": 512 * 1024 ** 2,
+            "tmpfs": {"/tmp": f"size={GB}"},
+            "ulimits": [{"name": "nofile", "soft": 1024, "hard": 1024}],
+        })
+
+    def test_environment(self):
+        self.assertEqual(resources_environment(None), {})
+        env = resources_environment({"memory": "1g"})
+        self.assertEqual(json.loads(env["ALGORITHM_RESOURCES"]),
+                         {"mem_limit": GB})
+
+    def test_host_defaults(self):
+        defaults = host_defaults(cpu_count=8, memory=16 * GB)
+        self.assertEqual(defaults["cpus"], 7)
+        self.assertEqual(defaults["memory"], "12g")
+        self.assertEqual(defaults["shm_size"], "2g")
+        self.assertEqual(defaults["tmpfs_size"], "3g")
+        self.assertTrue(Schema(VALIDATOR).is_valid(defaults))
+
+        self.assertEqual(host_defaults(cpu_count=1, memory=GB)["cpus"], 1)
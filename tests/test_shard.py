@@ -0,0 +1,96 @@
+import csv
+import tempfile
+import unittest
+
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+from click.testing import CliRunner
+
+from vantage6.cli.node import cli_node_data_shard
+from vantage6.cli.shard import (
+    ShardError,
+    key_partition,
+    read_manifest,
+    register,
+    shard
+)
+
+
+def read_rows(path):
+    with open(path, newline="") as fp:
+        return list(csv.reader(fp))
+
+
+class ShardTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.folder = Path(self.tmp.name)
+        self.source = self.folder / "db.csv"
+        with open(self.source, "w", newline="") as fp:
+            writer = csv.writer(fp)
+            writer.writerow(["id", "site", "note"])
+            for i in range(10):
+                writer.writerow([i, f"site{i % 3}", "a,\nquoted note"])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_by_row(self):
+        output = self.folder / "shards"
+        manifest = shard(self.source, output, "default", 3)
+
+        self.assertEqual([f["rows"] for f in manifest["files"]], [4, 3, 3])
+        self.assertEqual(read_manifest(output), manifest)
+        rows = []
+        for file_ in manifest["files"]:
+            part = read_rows(file_["path"])
+            self.assertEqual(part[0], ["id", "site", "note"])
+            rows += part[1:]
+        self.assertEqual(sorted(int(r[0]) for r in rows), list(range(10)))
+        self.assertEqual(rows[0][2], "a,\nquoted note")
+
+    def test_by_key(self):
+        output = self.folder / "shards"
+        manifest = shard(self.source, output, "default", 2, key="site")
+
+        for i, file_ in enumerate(manifest["files"]):
+            for row in read_rows(file_["path"])[1:]:
+                self.assertEqual(key_partition(row[1], 2), i)
+        self.assertEqual(sum(f["rows"] for f in manifest["files"]), 10)
+
+        with self.assertRaises(ShardError):
+            shard(self.source, output, "default", 2, key="missing")
+        # the partitions of the previous run are kept
+        self.assertEqual(read_manifest(output), manifest)
+
+    def test_register(self):
+        databases = {"default": "/data/db.csv"}
+        previous = shard(self.source, self.folder / "shards", "default", 3)
+        databases = register(databases, previous)
+        self.assertEqual(set(databases), {"default", "default-part0",
+                                          "default-part1", "default-part2"})
+
+        manifest = shard(self.source, self.folder / "shards", "default", 2)
+        databases = register(databases, manifest, previous)
+        self.assertEqual(set(databases), {"default", "default-part0",
+                                          "default-part1"})
+
+    @patch("vantage6.cli.node.NodeContext")
+    def test_cli(self, context):
+        context.config_exists.return_value = True
+        ctx = MagicMock(data_dir=self.folder,
+                        databases={"default": str(self.source)})
+        ctx.config = {"databases": ctx.databases}
+        context.return_value = ctx
+
+        result = CliRunner().invoke(cli_node_data_shard,
+                                    ["-n", "iknl", "-p", "2"])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(
+            ctx.config["databases"]["default-part1"],
+            str(self.folder / "shards" / "default" / "default-part1.csv")
+        )
+        ctx.config_manager.save.assert_called_once()
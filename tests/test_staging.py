@@ -0,0 +1,199 @@
+import itertools
+import os
+import tempfile
+import unittest
+
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+from click.testing import CliRunner
+
+from vantage6.cli.node import cli_node_stage, stage_node_databases
+from vantage6.cli.staging import (
+    StagingCache,
+    StagingError,
+    chunk_digests,
+    stage_databases
+)
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+
+class StagingCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.remote = Path(self.tmp.name, "remote")
+        self.remote.mkdir()
+        self.folder = Path(self.tmp.name, "staging")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def source(self, name, data, mtime=1000):
+        path = self.remote / name
+        path.write_bytes(data)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def cache(self, **kwargs):
+        return StagingCache(self.folder, chunk_size=4, clock=Clock(),
+                            **kwargs)
+
+    def test_copy_and_fresh(self):
+        source = self.source("db.csv", b"a,b\n1,2\n")
+        staged = self.cache().stage(source)
+        self.assertEqual(staged.status, "copied")
+        self.assertEqual(staged.path.read_bytes(), b"a,b\n1,2\n")
+
+        # a new cache reads the index, the source is not read again
+        cache = self.cache()
+        with patch("vantage6.cli.staging.chunk_digests",
+                   side_effect=AssertionError):
+            staged = cache.stage(source)
+        self.assertEqual(staged.status, "fresh")
+
+    def test_delta(self):
+        source = self.source("db.csv", b"aaaabbbbcccc")
+        cache = self.cache()
+        path = cache.stage(source).path
+        inode = path.stat().st_ino
+
+        self.source("db.csv", b"aaaaXbbbcccc", mtime=2000)
+        staged = cache.stage(source)
+        self.assertEqual((staged.status, staged.changed_chunks),
+                         ("updated", 1))
+        self.assertEqual(path.read_bytes(), b"aaaaXbbbcccc")
+        # replaced, a running node keeps reading the complete old copy
+        self.assertNotEqual(path.stat().st_ino, inode)
+        self.assertEqual(list(cache.folder.glob(".*.tmp")), [])
+
+        self.source("db.csv", b"aaaaXbbb", mtime=3000)
+        self.assertEqual(cache.stage(source).status, "updated")
+        self.assertEqual(path.read_bytes(), b"aaaaXbbb")
+
+        # touched but identical, the copy is left alone
+        inode = path.stat().st_ino
+        self.source("db.csv", b"aaaaXbbb", mtime=4000)
+        self.assertEqual(cache.stage(source).status, "unchanged")
+        self.assertEqual(path.stat().st_ino, inode)
+
+    def test_unchanged_chunks_come_from_the_old_copy(self):
+        source = self.source("db.csv", b"aaaabbbbcccc")
+        cache = self.cache()
+        path = cache.stage(source).path
+        # the source is only read once, the head is copied locally
+        path.write_bytes(b"AAAAbbbbcccc")
+
+        self.source("db.csv", b"aaaabbbbXccc", mtime=2000)
+        staged = cache.stage(source)
+
+        self.assertEqual(staged.changed_chunks, 1)
+        self.assertEqual(path.read_bytes(), b"AAAAbbbbXccc")
+
+    def test_empty_source(self):
+        staged = self.cache().stage(self.source("db.csv", b""))
+        self.assertEqual(staged.status, "copied")
+        self.assertEqual(staged.path.read_bytes(), b"")
+
+    def test_failed_refresh_keeps_the_old_copy(self):
+        source = self.source("db.csv", b"aaaabbbbcccc")
+        cache = self.cache()
+        path = cache.stage(source).path
+        self.source("db.csv", b"aaaaXbbbcccc", mtime=2000)
+
+        def failing(fp, chunk_size):
+            # the first chunks are read, then the share goes away
+            yield from itertools.islice(chunk_digests(fp, chunk_size), 2)
+            raise OSError("share went away")
+
+        with patch("vantage6.cli.staging.chunk_digests", failing):
+            with self.assertRaises(StagingError):
+                cache.stage(source)
+
+        self.assertEqual(path.read_bytes(), b"aaaabbbbcccc")
+        self.assertEqual(list(cache.folder.glob(".*.tmp")), [])
+
+    def test_unreadable_source(self):
+        # e.g. a folder, a permission that is denied or a full disk
+        with self.assertRaises(StagingError):
+            self.cache().stage(self.remote)
+        with self.assertRaises(StagingError):
+            StagingCache(self.source("file", b"data") / "staging")
+
+    def test_lru_eviction(self):
+        cache = self.cache(max_size=20)
+        first = self.source("first", b"x" * 8)
+        second = self.source("second", b"y" * 8)
+        third = self.source("third", b"z" * 8)
+        cache.stage(first)
+        cache.stage(second)
+        cache.stage(first)
+
+        cache.stage(third)
+
+        self.assertEqual(set(cache.entries), {str(first), str(third)})
+        self.assertFalse(cache.path(second).exists())
+        self.assertLessEqual(cache.size, 20)
+
+        large = self.source("large", b"l" * 21)
+        self.assertEqual(cache.stage(large).status, "skipped")
+
+    def test_stale_and_missing(self):
+        source = self.source("db.csv", b"data")
+        cache = self.cache()
+        cache.stage(source)
+        source.unlink()
+        self.assertEqual(cache.stage(source).status, "stale")
+        with self.assertRaises(StagingError):
+            cache.stage(self.remote / "missing")
+
+    def test_stage_databases_keeps_own_copies(self):
+        cache = self.cache(max_size=16)
+        databases = {"default": self.source("a", b"a" * 8),
+                     "other": self.source("b", b"b" * 8)}
+        staged = stage_databases(cache, databases)
+        self.assertEqual({f.status for f in staged.values()}, {"copied"})
+
+        # growing one database does not evict the other one
+        self.source("b", b"b" * 12, mtime=2000)
+        staged = stage_databases(cache, databases)
+        self.assertEqual(staged["default"].status, "fresh")
+        self.assertEqual(staged["other"].status, "skipped")
+
+    @patch("vantage6.cli.node.NodeContext")
+    def test_cli(self, context):
+        source = self.source("db.csv", b"data")
+        context.config_exists.return_value = True
+        context.return_value = MagicMock(
+            data_dir=Path(self.tmp.name), databases={"default": str(source)},
+            config={"staging": {"enabled": True}}
+        )
+
+        result = CliRunner().invoke(cli_node_stage, ["-n", "iknl"])
+
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn("copied", result.output)
+        self.assertTrue(Path(self.tmp.name, "staging", "index.json").exists())
+
+        # an error, not a traceback
+        context.return_value.databases = {"default": str(self.remote)}
+        result = CliRunner().invoke(cli_node_stage, ["-n", "iknl"])
+        self.assertEqual(result.exit_code, 1)
+        self.assertNotIsInstance(result.exception, OSError)
+        self.assertIn("Cannot stage", result.output)
+
+    def test_start_uses_the_source_when_staging_fails(self):
+        ctx = MagicMock(data_dir=Path(self.tmp.name),
+                        databases={"default": str(self.remote)})
+
+        self.assertEqual(stage_node_databases(ctx, {"enabled": True}),
+                         ctx.databases)
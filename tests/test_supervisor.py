@@ -0,0 +1,348 @@
+import json
+import os
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import click
+import docker
+
+from click.testing import CliRunner
+
+from vantage6.common.globals import APPNAME
+from vantage6.cli import daemon_client
+from vantage6.cli.context import NodeContext
+from vantage6.cli.docker_session import DockerNotRunning, DockerSession
+from vantage6.cli.node import cli_node
+from vantage6.cli.daemon_client import (
+    daemon_socket_path,
+    forward,
+    forward_argv,
+    forwardable
+)
+from vantage6.cli.supervisor import (
+    ConfigIndex,
+    Daemon,
+    ForwardingGroup,
+    Supervisor
+)
+
+
+@click.group(cls=ForwardingGroup)
+@click.option("--no-daemon", is_flag=True)
+def fake_cli(no_daemon):
+    pass
+
+
+@fake_cli.command(name="list")
+def fake_list():
+    click.echo(f"running in {os.getcwd()}")
+
+
+@fake_cli.command(name="start")
+@click.option("-n", "--name")
+def fake_start(name):
+    print(f"started {name}")
+    if name == "broken":
+        exit(1)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class SupervisorTest(unittest.TestCase):
+
+    def test_forwardable(self):
+        self.assertTrue(forwardable("list", []))
+        self.assertTrue(forwardable("start", ["--name", "iknl"]))
+        self.assertTrue(forwardable("stop", ["--all"]))
+        # these would ask which node to use
+        self.assertFalse(forwardable("start", []))
+        self.assertFalse(forwardable("stop", ["--user"]))
+        self.assertFalse(forwardable("list", ["--help"]))
+        self.assertFalse(forwardable("clean", []))
+
+    def test_config_index(self):
+        index = ConfigIndex()
+        load = MagicMock(side_effect=[["a"], ["a", "b"]])
+        with tempfile.TemporaryDirectory() as folder:
+            (Path(folder) / "a.yaml").write_text("a")
+            self.assertEqual(index.get(folder, load), ["a"])
+            self.assertEqual(index.get(folder, load), ["a"])
+            self.assertEqual(load.call_count, 1)
+
+            (Path(folder) / "b.yaml").write_text("b")
+            self.assertEqual(index.get(folder, load), ["a", "b"])
+            self.assertEqual(load.call_count, 2)
+
+    def test_backoff_and_crash_loop(self):
+        clock = FakeClock()
+        start = MagicMock()
+        supervisor = Supervisor(start, running=lambda: [], initial_delay=1,
+                                max_delay=4, max_restarts=3, window=100,
+                                clock=clock)
+        supervisor.register("vantage6-iknl-user", ["--name", "iknl"])
+
+        restarts = []
+        for clock.now in range(60):
+            supervisor.tick()
+            if start.call_count > len(restarts):
+                restarts.append(clock.now)
+
+        # restarts 1, 2 and 4 seconds after the crash is noticed
+        self.assertEqual(restarts, [1, 4, 9])
+        start.assert_called_with(["--name", "iknl"], None)
+        node = supervisor.nodes["vantage6-iknl-user"]
+        self.assertEqual(node.state, "crash-loop")
+        self.assertIn("crash-loop", supervisor.status())
+
+    def test_forward_argv(self):
+        with patch("vantage6.cli.daemon_client.forward") as forward_:
+            forward_argv(["stop", "--name", "iknl"])
+            forward_.assert_called_once_with("stop", ["--name", "iknl"],
+                                             socket_path=None)
+            forward_.reset_mock()
+            for argv in (["--no-daemon", "list"], ["--profile", "sampling",
+                         "list"], ["stop"], ["clean"], []):
+                self.assertIsNone(forward_argv(argv))
+            forward_.assert_not_called()
+
+    def test_socket_path(self):
+        """The client finds the socket without the node context."""
+        self.assertEqual(daemon_client.APPNAME, APPNAME)
+        with patch.dict(os.environ, clear=True):
+            self.assertEqual(
+                daemon_socket_path(),
+                Path(NodeContext.type_data_folder(system_folders=False)) /
+                "daemon.sock"
+            )
+
+    def test_entry_forwards_before_importing_cli(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "daemon.sock")
+
+            class Handler(socketserver.StreamRequestHandler):
+                def handle(self):
+                    request = json.loads(self.rfile.readline())
+                    response = {"exit_code": 3,
+                                "output": f"{request['command']} done\n"}
+                    self.wfile.write(json.dumps(response).encode() + b"\n")
+
+            server = socketserver.UnixStreamServer(path, Handler)
+            threading.Thread(target=server.serve_forever,
+                             daemon=True).start()
+            try:
+                result = subprocess.run(
+                    [sys.executable, "-c",
+                     "import sys\n"
+                     "from vantage6.cli.entry import vnode\n"
+                     "sys.argv = ['vnode', 'list']\n"
+                     "try:\n"
+                     "    vnode()\n"
+                     "finally:\n"
+                     "    print(sorted(m for m in sys.modules if m in\n"
+                     "          ('docker', 'click', 'vantage6.cli.node')),\n"
+                     "          file=sys.stderr)\n"],
+                    env=dict(os.environ, VANTAGE6_DAEMON_SOCKET=path),
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                    universal_newlines=True, timeout=30
+                )
+            finally:
+                server.shutdown()
+                server.server_close()
+
+        self.assertEqual(result.returncode, 3)
+        self.assertEqual(result.stdout, "list done\n")
+        self.assertTrue(result.stderr.rstrip().endswith("[]"),
+                        result.stderr)
+
+    def test_running_node_is_left_alone(self):
+        start = MagicMock()
+        supervisor = Supervisor(start, running=lambda: ["vantage6-a-user"])
+        supervisor.register("vantage6-a-user", [])
+        supervisor.tick()
+        start.assert_not_called()
+
+    def test_crashed_node_is_restarted_in_its_directory(self):
+        start = MagicMock()
+        supervisor = Supervisor(start, running=lambda: [], initial_delay=0)
+        supervisor.register("vantage6-a-user", ["-c", "a.yaml"], "/configs")
+        supervisor.tick()
+        start.assert_called_once_with(["-c", "a.yaml"], "/configs")
+
+    def test_stopped_node_is_not_restarted(self):
+        """Each way of stopping a node emits a Docker event.
+
+        `vnode stop` kills the container, whether it runs in the daemon,
+        with --no-daemon or after asking which node to stop. `docker stop`
+        sends a kill (SIGTERM) followed by a stop event.
+        """
+        name = "vantage6-a-user"
+        paths = {
+            "vnode stop --name": ["kill"],
+            "vnode --no-daemon stop": ["kill"],
+            "vnode stop (interactive)": ["kill"],
+            "docker stop": ["kill", "stop"],
+        }
+        for path, events in paths.items():
+            with self.subTest(path):
+                start = MagicMock()
+                stops = []
+                supervisor = Supervisor(start, running=lambda: [],
+                                        stopped=lambda: stops,
+                                        initial_delay=0)
+                supervisor.register(name, ["--name", "a"])
+                stops.extend((name, int(time.time() * 10 ** 9)) for _ in events)
+
+                supervisor.tick()
+
+                start.assert_not_called()
+                self.assertNotIn(name, supervisor.nodes)
+
+    def test_earlier_stop_is_ignored(self):
+        """A stop before the node was started again is not this node's."""
+        name = "vantage6-a-user"
+        stopped_at = int(time.time() * 10 ** 9)
+        start = MagicMock()
+        supervisor = Supervisor(start, running=lambda: [],
+                                stopped=lambda: [(name, stopped_at)],
+                                initial_delay=0)
+        supervisor.register(name, ["--name", "a"])
+        supervisor.nodes[name].registered_at = stopped_at + 1
+
+        supervisor.tick()
+
+        start.assert_called_once()
+
+    @patch("docker.DockerClient.containers")
+    def test_local_stop_kills_the_container(self, containers):
+        """Stops that bypass the daemon still emit a kill event."""
+        node = MagicMock(labels={"vantage6-type": "node"})
+        node.name = "vantage6-iknl-user"
+        containers.list.return_value = [node]
+
+        for args in (["--no-daemon", "stop", "--name", "iknl"],
+                     ["stop"]):
+            with self.subTest(args), \
+                    patch("vantage6.cli.node.q") as q, \
+                    patch("vantage6.cli.node.forward") as forward_:
+                q.select.return_value.ask.return_value = node.name
+                node.kill.reset_mock()
+
+                result = CliRunner().invoke(cli_node, args)
+
+                self.assertEqual(result.exit_code, 0, result.output)
+                node.kill.assert_called_once()
+                forward_.assert_not_called()
+
+    def test_stopped_nodes(self):
+        with tempfile.TemporaryDirectory() as folder:
+            daemon = Daemon(fake_cli, Path(folder) / "daemon.sock")
+        daemon.session = MagicMock()
+        daemon.session.client.events.return_value = iter([
+            {"Action": "kill", "timeNano": 5,
+             "Actor": {"Attributes": {"name": "vantage6-a-user"}}},
+        ])
+
+        self.assertEqual(daemon.stopped_nodes(), [("vantage6-a-user", 5)])
+        kwargs = daemon.session.client.events.call_args[1]
+        self.assertEqual(kwargs["filters"]["event"], ["kill", "stop"])
+        self.assertEqual(kwargs["filters"]["label"], "vantage6-type=node")
+        # the next call continues where this one ended
+        until = kwargs["until"]
+        daemon.session.client.events.return_value = iter([])
+        daemon.stopped_nodes()
+        self.assertEqual(
+            daemon.session.client.events.call_args[1]["since"], until)
+
+    def test_docker_outage(self):
+        with tempfile.TemporaryDirectory() as folder:
+            daemon = Daemon(fake_cli, Path(folder) / "daemon.sock",
+                            poll_interval=0.01)
+            daemon.session = DockerSession(docker.DockerClient(
+                base_url=f"unix://{folder}/docker.sock"))
+        daemon.supervisor.register("vantage6-a-user", ["-n", "a"])
+
+        # neither a check nor a request stops the daemon
+        with self.assertRaises(DockerNotRunning):
+            daemon.supervisor.tick()
+        with self.assertRaises(DockerNotRunning):
+            daemon.handle({"command": "start", "args": ["-n", "a"]})
+
+        thread = threading.Thread(target=daemon.supervise, daemon=True)
+        thread.start()
+        try:
+            time.sleep(0.1)
+            self.assertTrue(thread.is_alive())
+        finally:
+            daemon._stop.set()
+            thread.join()
+
+    def test_daemon(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = Path(folder) / "daemon.sock"
+            daemon = Daemon(fake_cli, path)
+            # snapshots before and after the start command (popped)
+            running = [["vantage6-a-user"], []]
+            daemon.running_nodes = lambda: []
+
+            thread = threading.Thread(target=daemon.serve_forever,
+                                      daemon=True)
+            thread.start()
+            while not path.exists():
+                time.sleep(0.01)
+
+            try:
+                # the command runs in the working directory of the client
+                self.assertEqual(forward("list", [], path),
+                                 (0, f"running in {os.getcwd()}\n"))
+
+                daemon.running_nodes = lambda: running.pop()
+                self.assertEqual(forward("start", ["-n", "a"], path),
+                                 (0, "started a\n"))
+                self.assertIn("vantage6-a-user", daemon.supervisor.nodes)
+
+                # a stop through the daemon unregisters the node
+                running = [[], ["vantage6-a-user"]]
+                daemon.running_nodes = lambda: running.pop()
+                forward("stop", ["-n", "a"], path)
+                self.assertNotIn("vantage6-a-user", daemon.supervisor.nodes)
+
+                daemon.running_nodes = lambda: []
+                exit_code, _ = forward("start", ["-n", "broken"], path)
+                self.assertEqual(exit_code, 1)
+                self.assertEqual(forward("status", [], path)[0], 0)
+                # only the user can connect to the daemon
+                self.assertEqual(path.stat().st_mode & 0o777, 0o600)
+            finally:
+                daemon.shutdown()
+                thread.join()
+
+        self.assertIsNone(forward("list", [], path))
+
+    @patch("vantage6.cli.node.forward")
+    def test_cli_forwards_to_daemon(self, forward_):
+        forward_.return_value = (3, "from the daemon\n")
+
+        result = CliRunner().invoke(cli_node, ["stop", "--all"])
+
+        forward_.assert_called_once_with("stop", ["--all"])
+        self.assertEqual(result.output, "from the daemon\n")
+        self.assertEqual(result.exit_code, 3)
+
+    @patch("vantage6.cli.node.forward")
+    def test_cli_no_daemon(self, forward_):
+        CliRunner().invoke(cli_node, ["--no-daemon", "list"])
+        forward_.assert_not_called()
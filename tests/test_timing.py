@@ -0,0 +1,63 @@
+import json
+import unittest
+
+from unittest.mock import MagicMock, patch
+from click.testing import CliRunner
+
+from vantage6.cli.globals import APPNAME
+from vantage6.cli.node import cli_node_stop
+from vantage6.cli.timing import Timer
+
+
+class TimingTest(unittest.TestCase):
+
+    def test_phases(self):
+        timer = Timer()
+        timer.phase("first")
+        timer.phase("second")
+        with timer.span("nested"):
+            pass
+        timer.stop()
+
+        self.assertEqual([s.name for s in timer.spans],
+                         ["first", "second", "nested"])
+        self.assertEqual([s.depth for s in timer.spans], [0, 0, 1])
+        # starting a phase ends the previous one
+        self.assertTrue(all(s.end is not None for s in timer.spans))
+
+        summary = timer.summary()
+        self.assertIn("first", summary)
+        self.assertIn("  nested", summary)
+        self.assertIn("total", summary)
+
+    def test_chrome_trace(self):
+        timer = Timer()
+        timer.phase("pull image")
+        timer.stop()
+
+        events = timer.chrome_trace()["traceEvents"]
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]["name"], "pull image")
+        self.assertEqual(events[0]["ph"], "X")
+        self.assertGreaterEqual(events[0]["dur"], 0)
+
+    @patch("docker.DockerClient.containers")
+    def test_command_timings(self, containers):
+        container1 = MagicMock(labels={f"{APPNAME}-type": "node"})
+        container1.name = f"{APPNAME}-iknl-user"
+        containers.list.return_value = [container1]
+
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            result = runner.invoke(cli_node_stop, [
+                '--name', 'iknl', '--timings', '--trace-file', 'trace.json'
+            ])
+            with open("trace.json") as fp:
+                trace = json.load(fp)
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn("stop containers", result.output)
+        self.assertEqual(
+            [e["name"] for e in trace["traceEvents"]],
+            ["list running nodes", "stop containers"]
+        )
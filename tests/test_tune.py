@@ -0,0 +1,72 @@
+import json
+import tempfile
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+from click.testing import CliRunner
+from schema import Schema
+
+from vantage6.cli.node import cli_node_tune
+from vantage6.cli.tune import (
+    VALIDATOR,
+    concurrency_environment,
+    disk_throughput,
+    recommend
+)
+
+GB = 1024 ** 3
+
+
+class TuneTest(unittest.TestCase):
+
+    def test_recommend(self):
+        # 16 cores and 32 GB, with 2 GB per task memory is the limit
+        profile, limited_by = recommend(16, 32 * GB, disk_mbps=2000,
+                                        container_start=0.4)
+        self.assertEqual(profile, {"max_tasks": 12, "queue_size": 24})
+        self.assertEqual(limited_by, "memory")
+
+        profile, limited_by = recommend(16, 32 * GB, disk_mbps=120)
+        self.assertEqual(profile["max_tasks"], 2)
+        self.assertEqual(limited_by, "disk")
+
+        profile, limited_by = recommend(8, 64 * GB, resources={
+            "cpus": 3, "memory": "4g"
+        })
+        self.assertEqual(profile["max_tasks"], 2)
+        self.assertEqual(limited_by, "cores")
+
+        # a single task is always possible
+        profile, _ = recommend(1, GB)
+        self.assertEqual(profile["max_tasks"], 1)
+        self.assertTrue(Schema(VALIDATOR).is_valid(profile))
+
+    def test_environment(self):
+        env = concurrency_environment({"max_tasks": 2, "queue_size": 4,
+                                       "measured": {"cores": 4}})
+        self.assertEqual(json.loads(env["CONCURRENCY"]),
+                         {"max_tasks": 2, "queue_size": 4})
+        self.assertEqual(concurrency_environment(None), {})
+
+    def test_disk_throughput(self):
+        with tempfile.TemporaryDirectory() as folder:
+            write, read = disk_throughput(folder, size=4 * 1024 ** 2)
+            self.assertGreater(write, 0)
+            self.assertGreater(read, 0)
+
+    @patch("vantage6.cli.node.measure")
+    @patch("vantage6.cli.node.NodeContext")
+    def test_cli_writes_profile(self, context, measure):
+        measure.return_value = {"cores": 4, "memory": 16 * GB,
+                                "disk_write": 500, "disk_read": 800}
+        context.config_exists.return_value = True
+        ctx = MagicMock(config={})
+        context.return_value = ctx
+
+        result = CliRunner().invoke(cli_node_tune, ["-n", "iknl",
+                                                    "--no-docker"])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(ctx.config["concurrency"]["max_tasks"], 4)
+        ctx.config_manager.save.assert_called_once_with(ctx.config_file)
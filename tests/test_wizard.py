@@ -33,14 +33,15 @@ class WizardTest(unittest.TestCase):
 
         with patch(f"{module_path}.q") as q:
             q.prompt.side_effect = self.prompts
-            q.confirm.return_value.ask.side_effect = [True, False]
+            q.confirm.return_value.ask.side_effect = [True, False, True]
             dirs = MagicMock(data="/")
             config = node_configuration_questionaire(dirs, "iknl")
 
         keys = ["api_key", "server_url", "port", "api_path", "task_dir",
-                "databases", "logging", "encryption"]
+                "databases", "algorithm_resources", "logging", "encryption"]
         for key in keys:
             self.assertIn(key, config)
+        self.assertIsInstance(config["algorithm_resources"]["cpus"], float)
 
     def test_server_wizard(self):
 
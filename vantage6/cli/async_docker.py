@@ -0,0 +1,233 @@
+""" Asyncio client of the Docker Engine API over its Unix socket
+
+    docker-py talks to the daemon one request at a time. For operations on
+    many containers at once (stopping all nodes, removing volumes, following
+    the logs of all replicas) this client sends the requests concurrently,
+    with an upper limit on the number of requests in flight.
+
+    Only the few endpoints the CLI needs are implemented. Use it through
+    `DockerSession`, which falls back to docker-py when Docker is not
+    reachable through a local Unix socket.
+"""
+import asyncio
+import json
+import os
+import struct
+
+from collections import Counter
+from urllib.parse import urlencode
+
+import docker
+
+from vantage6.cli.profiling import docker_endpoint
+
+DEFAULT_SOCKET = "/var/run/docker.sock"
+
+# same API version as docker-py uses by default
+API_VERSION = docker.constants.DEFAULT_DOCKER_API_VERSION
+
+
+def unix_socket_path(docker_host=None):
+    """Return the path of the Docker socket, or None if there is none.
+
+    Parameters
+    ----------
+    docker_host : str, optional
+        address of the daemon, defaults to the `DOCKER_HOST` environment
+        variable (or the default socket when that is not set)
+    """
+    if docker_host is None:
+        docker_host = os.environ.get("DOCKER_HOST", "")
+
+    if not docker_host:
+        path = DEFAULT_SOCKET
+    elif docker_host.startswith("unix://"):
+        path = docker_host[len("unix://"):]
+    else:
+        # remote daemons (tcp://, ssh://) are left to docker-py
+        return None
+
+    return path if os.path.exists(path) else None
+
+
+class AsyncDockerClient:
+    """Sends Docker API requests concurrently over a Unix socket.
+
+    Parameters
+    ----------
+    socket_path : str
+        path of the Docker socket
+    max_in_flight : int, optional
+        maximum number of requests that are sent at the same time
+    calls : collections.Counter, optional
+        counter to register the requests in, per endpoint
+    """
+
+    def __init__(self, socket_path, max_in_flight=32, calls=None):
+        self.socket_path = socket_path
+        self.max_in_flight = max_in_flight
+        self.calls = calls if calls is not None else Counter()
+        self._semaphore = None
+
+    def for_each(self, items, func, key=lambda item: item.name):
+        """Run `func(item)` for all `items` concurrently.
+
+        Parameters
+        ----------
+        items : list
+            e.g. containers or volumes
+        func : callable
+            coroutine function that is called with each item
+        key : callable, optional
+            returns the key of an item in the result
+
+        Returns
+        -------
+        dict
+            the exception of every item for which `func` failed
+        """
+        async def run_all():
+            # the semaphore belongs to the event loop, so it is created here
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            return await asyncio.gather(*(func(item) for item in items),
+                                        return_exceptions=True)
+
+        loop = asyncio.new_event_loop()
+        try:
+            results = loop.run_until_complete(run_all())
+        finally:
+            loop.close()
+        return {key(item): result for item, result in zip(items, results)
+                if isinstance(result, Exception)}
+
+    async def kill(self, id_):
+        await self.request("POST", f"/containers/{id_}/kill")
+
+    async def stop(self, id_, timeout=10):
+        await self.request("POST", f"/containers/{id_}/stop",
+                           params={"t": timeout})
+
+    async def remove_volume(self, name):
+        await self.request("DELETE", f"/volumes/{name}")
+
+    async def inspect(self, id_):
+        return json.loads(await self.request("GET", f"/containers/{id_}/json"))
+
+    async def follow_logs(self, id_, callback):
+        """Call `callback` with every chunk that the container logs.
+
+        Returns when the container stops. Containers with a TTY (like the
+        node and server containers) send their output as is. Without a TTY
+        the output comes in frames with an 8-byte header, which is
+        stripped.
+        """
+        tty = (await self.inspect(id_)).get("Config", {}).get("Tty", False)
+        params = {"follow": 1, "stdout": 1, "stderr": 1}
+        buffer = b""
+        # log streams can last forever, so they are not counted as in-flight
+        async for data in self.stream("GET", f"/containers/{id_}/logs",
+                                      params=params):
+            if tty:
+                callback(data)
+                continue
+            buffer += data
+            while len(buffer) >= 8:
+                size = struct.unpack(">I", buffer[4:8])[0]
+                if len(buffer) < 8 + size:
+                    break
+                callback(buffer[8:8 + size])
+                buffer = buffer[8 + size:]
+
+    async def request(self, method, path, params=None):
+        """Send a request and return the body of the response.
+
+        Raises
+        ------
+        docker.errors.APIError
+            when the daemon responds with an error
+        OSError
+            when the daemon cannot be reached
+        """
+        async with self._semaphore:
+            body = b""
+            async for data in self.stream(method, path, params):
+                body += data
+            return body
+
+    async def stream(self, method, path, params=None):
+        """Send a request and yield the body of the response in chunks."""
+        url = f"/v{API_VERSION}{path}"
+        if params:
+            url += f"?{urlencode(params)}"
+        self.calls[docker_endpoint(method, url)] += 1
+
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        try:
+            writer.write(
+                f"{method} {url} HTTP/1.1\r\n"
+                "Host: docker\r\n"
+                "Content-Length: 0\r\n"
+                "Connection: close\r\n\r\n".encode()
+            )
+            await writer.drain()
+
+            status, reason, headers = await _read_head(reader)
+            if status >= 400:
+                body = b"".join([d async for d in _read_body(reader,
+                                                             headers)])
+                raise _api_error(status, reason, body)
+
+            async for data in _read_body(reader, headers):
+                yield data
+        finally:
+            writer.close()
+
+
+async def _read_head(reader):
+    """Read the status line and headers of an HTTP response."""
+    status_line = (await reader.readline()).decode("latin-1")
+    parts = status_line.rstrip("\r\n").split(" ", 2)
+    if len(parts) < 2:
+        raise ConnectionError(f"Invalid response from Docker: {status_line}")
+    reason = parts[2] if len(parts) > 2 else ""
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return int(parts[1]), reason, headers
+
+
+async def _read_body(reader, headers):
+    """Yield the body of an HTTP response as it comes in."""
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size = int((await reader.readline()).split(b";")[0].strip()
+                       or b"0", 16)
+            if size == 0:
+                return
+            yield await reader.readexactly(size)
+            await reader.readexactly(2)
+    elif "content-length" in headers:
+        length = int(headers["content-length"])
+        if length:
+            yield await reader.readexactly(length)
+    else:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                return
+            yield data
+
+
+def _api_error(status, reason, body):
+    """Return the docker-py exception that belongs to an error response."""
+    try:
+        explanation = json.loads(body).get("message")
+    except ValueError:
+        explanation = body.decode(errors="replace")
+    cls = docker.errors.NotFound if status == 404 else docker.errors.APIError
+    return cls(f"{status} {reason}", explanation=explanation)
@@ -0,0 +1,150 @@
+""" Helpers for the `vnode bench` commands
+"""
+import json
+import math
+import os
+import statistics
+import time
+import urllib.request
+
+# Measures the round-trip time of `n` HTTP requests. It is executed with
+# `python -c` inside the node container, so it may only use the standard
+# library.
+HTTP_LATENCY_SCRIPT = """
+import json, sys, time, urllib.request
+url, n = sys.argv[1], int(sys.argv[2])
+samples = []
+for _ in range(n):
+    start = time.perf_counter()
+    urllib.request.urlopen(url, timeout=10).read()
+    samples.append(time.perf_counter() - start)
+print(json.dumps(samples))
+"""
+
+
+def http_latencies(url, n):
+    """Return the round-trip times (in seconds) of `n` GET requests."""
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        urllib.request.urlopen(url, timeout=10).read()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def container_http_latencies(container, url, n):
+    """Same as `http_latencies`, but measured from within `container`."""
+    result = container.exec_run(
+        ["python", "-c", HTTP_LATENCY_SCRIPT, url, str(n)]
+    )
+    if result.exit_code != 0:
+        raise RuntimeError(result.output.decode(errors="replace"))
+    # only the last line contains the result
+    return json.loads(result.output.decode().strip().splitlines()[-1])
+
+
+def percentile(samples, p):
+    """Return the `p`-th percentile of `samples` (nearest rank)."""
+    ordered = sorted(samples)
+    rank = math.ceil(p / 100 * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+
+def latency_summary(samples):
+    """Return mean and percentiles (in milliseconds) of `samples`."""
+    ms = [s * 1000 for s in samples]
+    return {
+        "n": len(ms),
+        "mean": statistics.mean(ms),
+        "p50": percentile(ms, 50),
+        "p95": percentile(ms, 95),
+        "p99": percentile(ms, 99),
+    }
+
+
+def format_summary_table(rows):
+    """Format latency summaries as a table.
+
+    Parameters
+    ----------
+    rows : list of (str, dict)
+        label and the result of `latency_summary`
+    """
+    header = f"{'':28}{'n':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}"
+    lines = [header, "-" * len(header)]
+    for label, summary in rows:
+        lines.append(
+            f"{label:28}{summary['n']:>8}"
+            f"{summary['mean']:>8.2f}ms{summary['p50']:>8.2f}ms"
+            f"{summary['p95']:>8.2f}ms{summary['p99']:>8.2f}ms"
+        )
+    return "\n".join(lines)
+
+
+# payload sizes of `vnode bench crypto`, from a small input to a large result
+DEFAULT_PAYLOAD_SIZES = (1024, 64 * 1024, 1024 ** 2, 16 * 1024 ** 2)
+
+
+def crypto_latencies(cryptor, public_key, size, n):
+    """Time encrypting and decrypting a random payload of `size` bytes.
+
+    Parameters
+    ----------
+    cryptor : CryptorBase
+        the cryptor of the node, a `DummyCryptor` only base64 encodes
+    public_key : str
+        base64 encoded public key that the payload is encrypted for
+    size : int
+        payload size in bytes
+    n : int
+        number of round trips
+
+    Returns
+    -------
+    tuple
+        encrypt and decrypt times (in seconds) and the size of the
+        encrypted (base64 encoded) payload
+    """
+    payload = os.urandom(size)
+    encrypt, decrypt = [], []
+    for _ in range(n):
+        start = time.perf_counter()
+        encrypted = cryptor.encrypt_bytes_to_str(payload, public_key)
+        encrypt.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        decrypted = cryptor.decrypt_str_to_bytes(encrypted)
+        decrypt.append(time.perf_counter() - start)
+
+        if decrypted != payload:
+            raise RuntimeError("Decrypted payload differs from the original")
+    return encrypt, decrypt, len(encrypted)
+
+
+def format_crypto_table(rows):
+    """Format the results of `crypto_latencies` as a table.
+
+    Parameters
+    ----------
+    rows : list of (str, int, str, dict, int)
+        method, payload size, operation, `latency_summary` and encoded size
+    """
+    header = f"{'':12}{'size':>8}  {'':8}{'mean':>10}{'p50':>10}" \
+        f"{'p95':>10}{'p99':>10}{'MB/s':>10}{'overhead':>10}"
+    lines = [header, "-" * len(header)]
+    for method, size, operation, summary, encoded in rows:
+        mb_per_s = size / 1024 ** 2 / (summary["mean"] / 1000)
+        lines.append(
+            f"{method:12}{format_bytes(size):>8}  {operation:8}"
+            f"{summary['mean']:>8.2f}ms{summary['p50']:>8.2f}ms"
+            f"{summary['p95']:>8.2f}ms{summary['p99']:>8.2f}ms"
+            f"{mb_per_s:>10.1f}{(encoded - size) / size:>9.1%}"
+        )
+    return "\n".join(lines)
+
+
+def format_bytes(size):
+    for unit, factor in (("MB", 1024 ** 2), ("KB", 1024)):
+        if size >= factor:
+            return f"{size / factor:g}{unit}"
+    return f"{size}B"
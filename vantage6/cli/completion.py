@@ -0,0 +1,322 @@
+""" Shell completion for `vnode` and `vserver`
+
+    Completes configuration names (`--name`) and their environments
+    (`--environment`). For `stop` and `attach` only the configurations
+    that are running are completed. Enable it in bash with:
+
+        eval "$(_VNODE_COMPLETE=source_bash vnode)"
+        eval "$(_VSERVER_COMPLETE=source_bash vserver)"
+
+    Completion runs on every keypress, so it is served from an index in
+    the user cache folder instead of loading and validating every
+    configuration file:
+
+    * configuration names are the names of the files, which only requires
+      listing the configuration folders;
+    * the environments of a file are only read again when it changed, and
+      only as long as the latency budget allows. The remaining files are
+      read on the next keypress;
+    * running containers are cached for a few seconds, and Docker is only
+      asked within the latency budget.
+
+    Loading the command line interface alone takes most of a second, so the
+    `vnode` and `vserver` scripts (`vantage6.cli.entry`) complete names and
+    environments with `bash_complete`, before the CLI is imported. This
+    module therefore only imports the standard library and appdirs; yaml
+    and Docker are imported when a file has to be read or Docker has to be
+    asked. Everything else (commands, options) is completed by click.
+
+    Completion never fails: when something goes wrong, it completes less.
+"""
+import json
+import os
+import shlex
+import sys
+import time
+
+from pathlib import Path
+
+import appdirs
+
+# vantage6.common.globals.APPNAME, importing vantage6.common loads click
+APPNAME = "vantage6"
+
+# seconds that a single completion may take
+BUDGET = 0.1
+
+# seconds that the list of running containers is reused
+CONTAINER_TTL = 10
+
+INDEX_VERSION = 1
+
+# commands whose --name is a running node or server
+RUNNING_COMMANDS = ("stop", "attach")
+
+# options of every command that take a configuration name or environment
+NAME_OPTIONS = ("-n", "--name")
+ENVIRONMENT_OPTIONS = ("-e", "--environment")
+
+
+def index_path():
+    """Return the path of the completion index of this user."""
+    return Path(appdirs.user_cache_dir(APPNAME, "")) / "completion.json"
+
+
+def read_environments(path):
+    """Return the environments in the configuration file at `path`."""
+    import yaml
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    with open(path) as fp:
+        try:
+            config = yaml.load(fp, Loader=loader) or {}
+        except yaml.YAMLError:
+            return []
+    environments = [env for env, settings
+                    in (config.get("environments") or {}).items() if settings]
+    if config.get("application"):
+        environments.append("application")
+    return environments
+
+
+class CompletionIndex:
+    """Configuration and container names, cached between completions.
+
+    Parameters
+    ----------
+    path : Path, optional
+        file of the index
+    budget : float, optional
+        seconds after which no files are read and Docker is not asked
+    """
+
+    def __init__(self, path=None, budget=BUDGET):
+        self.path = Path(path or index_path())
+        self.deadline = time.perf_counter() + budget
+        self.changed = False
+        try:
+            with open(self.path) as fp:
+                self.data = json.load(fp)
+        except (OSError, ValueError):
+            self.data = {}
+        if self.data.get("version") != INDEX_VERSION:
+            self.data = {"version": INDEX_VERSION}
+
+    def in_budget(self):
+        return time.perf_counter() < self.deadline
+
+    def save(self):
+        """Write the index, if anything changed."""
+        if not self.changed:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}")
+            with open(tmp, "w") as fp:
+                json.dump(self.data, fp)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def configurations(self, folder):
+        """Return the environments of every configuration in `folder`."""
+        folders = self.data.setdefault("configs", {})
+        cached = folders.get(str(folder), {})
+        try:
+            with os.scandir(folder) as entries:
+                files = {
+                    entry.name[:-len(".yaml")]: (entry.path,
+                                                 entry.stat().st_mtime_ns)
+                    for entry in entries
+                    if entry.name.endswith(".yaml") and entry.is_file()
+                }
+        except OSError:
+            files = {}
+
+        entries = {}
+        for name, (path, mtime) in sorted(files.items()):
+            entry = cached.get(name)
+            if (not entry or entry["mtime"] != mtime) and self.in_budget():
+                try:
+                    entry = {"mtime": mtime,
+                             "environments": read_environments(path)}
+                except (OSError, AttributeError):
+                    entry = {"mtime": mtime, "environments": []}
+            elif entry and entry["mtime"] != mtime:
+                # out of time, keep the old environments and mark the
+                # file as unread
+                entry = dict(entry, mtime=None)
+            entries[name] = entry or {"mtime": None, "environments": []}
+
+        if entries != cached:
+            folders[str(folder)] = entries
+            self.changed = True
+        return {name: entry["environments"]
+                for name, entry in entries.items()}
+
+    def running(self, type_):
+        """Return the configuration names of the running `type_`s."""
+        cache = self.data.setdefault("containers", {})
+        cached = cache.get(type_)
+        if cached and time.time() - cached["time"] < CONTAINER_TTL:
+            return cached["names"]
+
+        if not self.in_budget():
+            return cached["names"] if cached else []
+        import docker
+        import requests
+        timeout = self.deadline - time.perf_counter()
+        if timeout <= 0:
+            return cached["names"] if cached else []
+        try:
+            client = docker.from_env(timeout=timeout)
+            containers = client.api.containers(
+                filters={"label": f"{APPNAME}-type={type_}"})
+        except (docker.errors.DockerException, requests.RequestException):
+            return cached["names"] if cached else []
+        names = sorted({container["Labels"].get("name")
+                        for container in containers} - {None})
+        cache[type_] = {"time": time.time(), "names": names}
+        self.changed = True
+        return names
+
+
+def configuration_folders(type_):
+    """Return the user and system configuration folders of `type_`.
+
+    These are the "config" folders of `AppContext.instance_folders`.
+    """
+    dirs = appdirs.AppDirs(APPNAME, "")
+    return [Path(dirs.user_config_dir) / type_,
+            Path(dirs.site_config_dir) / type_]
+
+
+def complete_configurations(type_, incomplete, index=None):
+    index = index or CompletionIndex()
+    names = set()
+    for folder in configuration_folders(type_):
+        names.update(index.configurations(folder))
+    index.save()
+    return sorted(n for n in names if n.startswith(incomplete))
+
+
+def complete_environments(type_, name, incomplete, index=None):
+    index = index or CompletionIndex()
+    environments = set()
+    for folder in configuration_folders(type_):
+        configurations = index.configurations(folder)
+        if name:
+            environments.update(configurations.get(name, []))
+        else:
+            for envs in configurations.values():
+                environments.update(envs)
+    index.save()
+    return sorted(e for e in environments if e.startswith(incomplete))
+
+
+def complete_running(type_, incomplete, index=None):
+    index = index or CompletionIndex()
+    names = index.running(type_)
+    index.save()
+    return [n for n in names if n.startswith(incomplete)]
+
+
+def name_completer(type_, running=False):
+    def complete(ctx, args, incomplete):
+        if running:
+            return complete_running(type_, incomplete)
+        return complete_configurations(type_, incomplete)
+    return complete
+
+
+def environment_completer(type_):
+    def complete(ctx, args, incomplete):
+        return complete_environments(type_, ctx.params.get("name"),
+                                     incomplete)
+    return complete
+
+
+def add_completion(group, type_):
+    """Complete `--name` and `--environment` of every command in `group`.
+
+    Call this after all commands have been added to the group.
+    """
+    for name, command in group.commands.items():
+        if hasattr(command, "commands"):
+            add_completion(command, type_)
+            continue
+        for param in command.params:
+            if param.name == "name":
+                param.autocompletion = name_completer(
+                    type_, running=name in RUNNING_COMMANDS)
+            elif param.name == "environment":
+                param.autocompletion = environment_completer(type_)
+
+
+def option_value(args, options):
+    """Return the value of the last of `options` in `args`, if any."""
+    value = None
+    for i, arg in enumerate(args):
+        option, _, inline = arg.partition("=")
+        if option in options and inline:
+            value = inline
+        elif arg in options and i + 1 < len(args):
+            value = args[i + 1]
+    return value
+
+
+def complete_args(type_, args, incomplete):
+    """Return the completions of `incomplete` after `args`.
+
+    Returns None when it is not the value of a name or environment, which
+    is left to click.
+    """
+    if incomplete.startswith("-") and "=" in incomplete:
+        option, _, incomplete = incomplete.partition("=")
+        args = [*args, option]
+    if not args or incomplete.startswith("-"):
+        return None
+
+    commands = []
+    for arg in args:
+        if arg.startswith("-"):
+            if commands:
+                break
+            continue
+        commands.append(arg)
+
+    if args[-1] in NAME_OPTIONS:
+        if commands and commands[-1] in RUNNING_COMMANDS:
+            return complete_running(type_, incomplete)
+        return complete_configurations(type_, incomplete)
+    if args[-1] in ENVIRONMENT_OPTIONS:
+        return complete_environments(
+            type_, option_value(args[:-1], NAME_OPTIONS), incomplete)
+    return None
+
+
+def bash_complete(prog, type_, environ=None):
+    """Complete the command line of `prog` in bash, without the CLI.
+
+    This handles the requests of the completion script of click, see
+    `click._bashcomplete.do_complete`.
+
+    Returns
+    -------
+    bool
+        True when the completions are written, False when click has to
+        complete the command line
+    """
+    environ = os.environ if environ is None else environ
+    if environ.get(f"_{prog.upper()}_COMPLETE") != "complete":
+        return False
+    try:
+        words = shlex.split(environ["COMP_WORDS"])
+        cword = int(environ["COMP_CWORD"])
+    except (KeyError, ValueError):
+        return False
+    incomplete = words[cword] if cword < len(words) else ""
+    choices = complete_args(type_, words[1:cword], incomplete)
+    if choices is None:
+        return False
+    sys.stdout.write("".join(f"{choice}\n" for choice in choices))
+    return True
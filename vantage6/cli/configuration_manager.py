@@ -1,9 +1,13 @@
-from schema import And, Or, Use, Optional
+from schema import And, Or, Use, Optional, Regex
 
 from vantage6.common.configuration_manager import (
     Configuration,
     ConfigurationManager
 )
+from vantage6.cli.resources import VALIDATOR as RESOURCES_VALIDATOR
+from vantage6.cli.tune import VALIDATOR as CONCURRENCY_VALIDATOR
+from vantage6.cli.preload import VALIDATOR as PRELOAD_VALIDATOR
+from vantage6.cli.staging import VALIDATOR as STAGING_VALIDATOR
 
 
 class ServerConfiguration(Configuration):
@@ -15,6 +19,11 @@ class ServerConfiguration(Configuration):
         "api_path": Use(str),
         "uri": Use(str),
         "allow_drop_all": Use(bool),
+        Optional("workers"): And(Use(int), lambda n: n > 0),
+        Optional("threads"): And(Use(int), lambda n: n > 0),
+        Optional("replicas"): And(Use(int), lambda n: n > 0),
+        Optional("image"): Use(str),
+        Optional("image_digest"): Regex(r"^sha256:[0-9a-f]{64}$"),
         "logging": {
             "level": And(Use(str), lambda l: l in ("DEBUG", "INFO", "WARNING",
                                                    "ERROR", "CRITICAL")),
@@ -37,6 +46,18 @@ class NodeConfiguration(Configuration):
         "task_dir": Use(str),
         "databases": {Use(str): Use(str)},
         "api_path": Use(str),
+        Optional("image"): Use(str),
+        Optional("image_digest"): Regex(r"^sha256:[0-9a-f]{64}$"),
+        Optional("algorithm_images"): [Use(str)],
+        Optional("algorithm_resources"): RESOURCES_VALIDATOR,
+        Optional("concurrency"): CONCURRENCY_VALIDATOR,
+        Optional("preload"): PRELOAD_VALIDATOR,
+        Optional("staging"): STAGING_VALIDATOR,
+        Optional("retention"): {
+            Optional("max_age"): And(Use(float), lambda d: d > 0),
+            Optional("max_count"): And(Use(int), lambda n: n >= 0),
+            Optional("max_size"): And(Use(float), lambda n: n > 0)
+        },
         "logging": {
             "level": And(Use(str), lambda l: l in ("DEBUG", "INFO", "WARNING",
                                                    "ERROR", "CRITICAL")),
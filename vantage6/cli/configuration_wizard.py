@@ -8,6 +8,7 @@ from vantage6.cli.configuration_manager import (
     NodeConfigurationManager,
     ServerConfigurationManager
 )
+from vantage6.cli.resources import host_defaults
 
 
 def node_configuration_questionaire(dirs, instance_name):
@@ -71,6 +72,38 @@ def node_configuration_questionaire(dirs, instance_name):
         config["databases"][q2.get("label")] = q2.get("path")
         i += 1
 
+    if q.confirm("Do you want to limit the resources of algorithms?").ask():
+        defaults = host_defaults()
+        resources = q.prompt([
+            {
+                "type": "text",
+                "name": "cpus",
+                "message": "Number of cores per algorithm:",
+                "default": str(defaults["cpus"])
+            },
+            {
+                "type": "text",
+                "name": "memory",
+                "message": "Memory per algorithm (e.g. 4g):",
+                "default": defaults["memory"]
+            },
+            {
+                "type": "text",
+                "name": "shm_size",
+                "message": "Size of the shared memory (/dev/shm):",
+                "default": defaults["shm_size"]
+            },
+            {
+                "type": "text",
+                "name": "tmpfs_size",
+                "message": "Size of the scratch space (/tmp):",
+                "default": defaults["tmpfs_size"]
+            }
+        ])
+        resources["cpus"] = float(resources["cpus"])
+        resources["ulimits"] = defaults["ulimits"]
+        config["algorithm_resources"] = resources
+
     res = q.select("Which level of logging would you like?",
                    choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL",
                             "NOTSET"]).ask()
@@ -78,6 +78,9 @@ class NodeContext(AppContext):
 
     running_in_docker = False
 
+    # set by the vnode daemon, see `vantage6.cli.supervisor.ConfigIndex`
+    config_index = None
+
     def __init__(self, instance_name, environment=N_ENV,
                  system_folders=N_FOL, config_file=None):
         super().__init__("node", instance_name, environment, system_folders,
@@ -99,7 +102,16 @@ class NodeContext(AppContext):
 
     @classmethod
     def available_configurations(cls, system_folders=N_FOL):
-        return super().available_configurations("node", system_folders)
+        if cls.config_index is None:
+            return super().available_configurations("node", system_folders)
+
+        # a long-running process keeps the configurations between commands
+        folder = cls.instance_folders("node", "", system_folders)["config"]
+        return cls.config_index.get(
+            folder,
+            lambda: super(NodeContext, cls).available_configurations(
+                "node", system_folders)
+        )
 
     @staticmethod
     def type_data_folder(system_folders):
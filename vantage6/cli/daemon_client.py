@@ -0,0 +1,108 @@
+""" Talking to the vnode daemon, without loading the CLI
+
+    Importing the full `vnode` command line interface (click, Docker,
+    questionary, ...) takes most of a second. A command that the daemon
+    runs does not need any of it, so this module only depends on the
+    standard library and appdirs: `vantage6.cli.entry` uses it to hand a
+    command to the daemon before anything else is imported (not even
+    `vantage6.common`).
+"""
+import json
+import os
+import socket
+
+from pathlib import Path
+
+import appdirs
+
+# vantage6.common.globals.APPNAME, importing vantage6.common loads click
+APPNAME = "vantage6"
+
+DAEMON_COMMANDS = ("list", "start", "stop", "status")
+
+
+def daemon_socket_path():
+    """Return the path of the control socket of the daemon.
+
+    This is `daemon.sock` in the user data folder of the nodes, see
+    `NodeContext.type_data_folder`.
+    """
+    path = os.environ.get("VANTAGE6_DAEMON_SOCKET")
+    if path:
+        return Path(path)
+    return Path(appdirs.user_data_dir(APPNAME, "")) / "node" / "daemon.sock"
+
+
+def forwardable(command, args):
+    """Return True when the daemon can run `command` with `args`.
+
+    The daemon cannot ask questions, so commands that would prompt for the
+    node to use are run locally.
+    """
+    if command not in DAEMON_COMMANDS or "--help" in args:
+        return False
+
+    def has(*options):
+        return any(a in options or a.split("=")[0] in options for a in args)
+
+    if command == "start":
+        return has("-n", "--name", "-c", "--config")
+    if command == "stop":
+        return has("-n", "--name", "--all")
+    return True
+
+
+def forward(command, args, socket_path=None):
+    """Let the daemon run `command`.
+
+    Returns
+    -------
+    tuple or None
+        exit code and output of the command, or None when the daemon is not
+        running
+    """
+    path = Path(socket_path or daemon_socket_path())
+    if not path.exists():
+        return None
+
+    request = {"command": command, "args": list(args), "cwd": os.getcwd()}
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(str(path))
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            with sock.makefile("rb") as fp:
+                response = json.loads(fp.readline())
+    except (ConnectionRefusedError, FileNotFoundError):
+        # stale socket of a daemon that is no longer running
+        return None
+    return response["exit_code"], response["output"]
+
+
+def split_command(argv):
+    """Split the arguments of `vnode` into the command and its arguments.
+
+    Returns
+    -------
+    tuple or None
+        the command and its arguments, or None when there is no command or
+        it is preceded by an option of `vnode` itself. All of these
+        (`--no-daemon`, `--profile` and `--help`) run the command locally.
+    """
+    if not argv or argv[0].startswith("-"):
+        return None
+    return argv[0], argv[1:]
+
+
+def forward_argv(argv, socket_path=None):
+    """Let the daemon run the `vnode` command line `argv`, if it can.
+
+    Returns
+    -------
+    tuple or None
+        exit code and output of the command, or None when it has to run
+        in this process
+    """
+    command = split_command(argv)
+    if command is None or not forwardable(*command):
+        return None
+    return forward(*command, socket_path=socket_path)
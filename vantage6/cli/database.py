@@ -0,0 +1,183 @@
+""" Bundled database for the server
+
+    Instead of a (shared) SQLite file, the server can be started together
+    with a PostgreSQL container. The data is stored in a Docker volume so
+    that it survives restarts of the server.
+"""
+import os
+import secrets
+
+from vantage6.common import info
+from vantage6.common.globals import APPNAME
+from vantage6.cli.globals import (
+    DEFAULT_POSTGRES_IMAGE,
+    GROUP_LABEL,
+    ROLE_LABEL
+)
+from vantage6.cli.readiness import wait_until
+
+POSTGRES_USER = APPNAME
+
+POSTGRES_DB = APPNAME
+
+POSTGRES_PORT = 5432
+
+
+def host_memory():
+    """Return the total amount of memory of the host in bytes."""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        # not available on all platforms, assume a modest machine
+        return 4 * 1024 ** 3
+
+
+def postgres_settings(memory, max_connections=200):
+    """Return PostgreSQL settings tuned for the available memory.
+
+    Follows the common guidelines: shared buffers at a quarter of the
+    memory, the planner assumes three quarters to be available as cache
+    and the remainder is divided over the connections for sorting.
+
+    Parameters
+    ----------
+    memory : int
+        memory available to the database in bytes
+    max_connections : int, optional
+        maximum number of client connections
+
+    Returns
+    -------
+    dict
+        setting name -> value
+    """
+    mb = memory // 1024 ** 2
+    return {
+        "max_connections": max_connections,
+        "shared_buffers": f"{min(mb // 4, 8 * 1024)}MB",
+        "effective_cache_size": f"{mb * 3 // 4}MB",
+        "maintenance_work_mem": f"{min(mb // 16, 2 * 1024)}MB",
+        "work_mem": f"{max(mb // 4 // max_connections, 4)}MB",
+        "wal_buffers": "16MB",
+        "checkpoint_completion_target": 0.9,
+        "random_page_cost": 1.1,
+    }
+
+
+def postgres_password(ctx):
+    """Return the database password of this server instance.
+
+    The password is generated once and stored in the data folder, as the
+    database volume keeps using the password it was initialized with.
+    """
+    file_ = ctx.data_dir / "postgres.secret"
+    if file_.exists():
+        return file_.read_text().strip()
+
+    ctx.data_dir.mkdir(parents=True, exist_ok=True)
+    password = secrets.token_urlsafe(24)
+    file_.touch(mode=0o600)
+    file_.write_text(password)
+    return password
+
+
+def start_postgres(docker_client, ctx, network, keep=False, timeout=60):
+    """Start (or re-use) the PostgreSQL container of a server instance.
+
+    Parameters
+    ----------
+    docker_client : docker.DockerClient
+        client connected to the Docker daemon
+    ctx : ServerContext
+        context of the server instance the database belongs to
+    network : str
+        name of the Docker network shared with the server container(s)
+    keep : bool, optional
+        keep the container after it has been stopped
+    timeout : int, optional
+        seconds to wait for the database to accept connections
+
+    Returns
+    -------
+    str
+        database URI to be used from within the network
+    """
+    group = ctx.docker_container_name
+    name = f"{group}-db"
+    password = postgres_password(ctx)
+
+    existing = [c for c in docker_client.containers.list(
+        all=True, filters={"name": name}) if c.name == name]
+
+    if existing:
+        container = existing[0]
+        if container.status != "running":
+            info(f"Starting existing database container '{name}'")
+            container.start()
+        else:
+            info(f"Using running database container '{name}'")
+    else:
+        info(f"Run database container '{name}'")
+        volume = docker_client.volumes.create(f"{name}-vol")
+        settings = postgres_settings(host_memory())
+        command = []
+        for key, value in settings.items():
+            command += ["-c", f"{key}={value}"]
+
+        container = docker_client.containers.run(
+            DEFAULT_POSTGRES_IMAGE,
+            command=command,
+            volumes={
+                volume.name: {
+                    "bind": "/var/lib/postgresql/data", "mode": "rw"
+                }
+            },
+            environment={
+                "POSTGRES_USER": POSTGRES_USER,
+                "POSTGRES_PASSWORD": password,
+                "POSTGRES_DB": POSTGRES_DB
+            },
+            labels={
+                f"{APPNAME}-type": "server",
+                "name": ctx.config_file_name,
+                GROUP_LABEL: group,
+                ROLE_LABEL: "database"
+            },
+            network=network,
+            name=name,
+            shm_size="256m",
+            detach=True,
+            auto_remove=not keep
+        )
+
+    wait_for_postgres(container, timeout)
+
+    return f"postgresql://{POSTGRES_USER}:{password}@{name}:" \
+           f"{POSTGRES_PORT}/{POSTGRES_DB}"
+
+
+def wait_for_postgres(container, timeout=60):
+    """Block until the database in `container` accepts connections.
+
+    Raises
+    ------
+    TimeoutError
+        when the database is not ready within `timeout` seconds
+    """
+    info("Waiting for the database to accept connections")
+
+    def is_ready():
+        # use TCP, as during initialization postgres only listens on the
+        # unix socket
+        result = container.exec_run([
+            "pg_isready", "-h", "127.0.0.1", "-U", POSTGRES_USER,
+            "-d", POSTGRES_DB
+        ])
+        return result.exit_code == 0
+
+    try:
+        elapsed = wait_until(is_ready, timeout)
+    except TimeoutError:
+        raise TimeoutError(f"Database in '{container.name}' did not accept "
+                           f"connections within {timeout}s") from None
+    info(f" ... ready after {elapsed:.1f}s")
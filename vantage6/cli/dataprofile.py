@@ -0,0 +1,496 @@
+""" Profiling the databases of a node
+
+    `vnode data profile` summarizes every (CSV) database of a node: the
+    number of rows and, per column, the type, the number of missing values
+    and the range of the values.
+
+    A database is read in blocks of lines, so memory use does not depend on
+    the size of the file. The C parser of NumPy parses the columns that
+    hold numbers straight to floats and only the other columns to strings,
+    which are then summarized column by column. A block that NumPy cannot
+    parse (e.g. rows with a different number of fields) is parsed by the
+    csv module instead, as are blocks with quoted values when NumPy is
+    older than 1.23. Empty values and NaN count as missing. Large files
+    are split into byte ranges that are profiled in separate processes;
+    this assumes that quoted values do not contain line breaks (use
+    `--workers 1` if they do).
+
+    The summary is cached in `<data folder>/profiles`, together with the
+    fingerprint of the database: its size, modification time and a
+    checksum of its first and last megabyte. A database that did not
+    change is not read again.
+
+    NumPy is an optional dependency: `pip install vantage6[profile]`.
+"""
+import csv
+import hashlib
+import io
+import json
+import math
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+CHUNK_SIZE = 16 * 1024 ** 2
+
+# files larger than this are profiled by several processes
+PARALLEL_THRESHOLD = 64 * 1024 ** 2
+
+# columns count at most this many distinct values
+DISTINCT_LIMIT = 1000
+
+# distinct values are first counted in a sample of this many values, a
+# column with more distinct values in the sample is not counted further
+DISTINCT_SAMPLE = 10 * DISTINCT_LIMIT
+
+# lines in which the columns that hold text are looked for, when a block
+# cannot be parsed as numbers
+TYPE_SAMPLE = 1000
+
+FINGERPRINT_BLOCK = 1024 ** 2
+
+PROFILE_VERSION = 1
+
+
+class ProfileError(Exception):
+    """A database could not be profiled."""
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ProfileError("Profiling requires NumPy, install it with "
+                           "`pip install vantage6[profile]`")
+    return numpy
+
+
+def fingerprint(path):
+    """Return the fingerprint of the file at `path`.
+
+    The size and modification time catch nearly every change, the
+    checksum of the first and last block catches a file that was replaced
+    with the same timestamp.
+    """
+    stat = os.stat(path)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as fp:
+        digest.update(fp.read(FINGERPRINT_BLOCK))
+        if stat.st_size > FINGERPRINT_BLOCK:
+            fp.seek(max(stat.st_size - FINGERPRINT_BLOCK, FINGERPRINT_BLOCK))
+            digest.update(fp.read())
+    return {
+        "version": PROFILE_VERSION,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+        "checksum": digest.hexdigest(),
+    }
+
+
+class ColumnSummary:
+    """Running summary of the values of a single column."""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.missing = 0
+        self.numeric = True
+        self.integer = True
+        self.minimum = None
+        self.maximum = None
+        self.total = 0.0
+        self.squares = 0.0
+        self.min_length = None
+        self.max_length = None
+        self.distinct = set()
+        self.distinct_overflow = False
+
+    def update(self, values):
+        """Add a chunk of values (a NumPy array of strings)."""
+        np = _numpy()
+        if self.numeric:
+            numbers = _numbers(values)
+            if numbers is not None:
+                self.update_numbers(numbers)
+                return
+            self.to_text()
+
+        self.count += len(values)
+        present = values[values != ""]
+        self.missing += len(values) - len(present)
+        if not len(present):
+            return
+        self._count_distinct(present)
+        lengths = np.char.str_len(present)
+        self._range("min_length", "max_length", int(lengths.min()),
+                    int(lengths.max()))
+
+    def update_numbers(self, numbers):
+        """Add a chunk of numbers (a NumPy array, NaN if missing)."""
+        np = _numpy()
+        self.count += len(numbers)
+        present = numbers[~np.isnan(numbers)]
+        self.missing += len(numbers) - len(present)
+        if not len(present):
+            return
+        self._count_distinct(present)
+        finite = present[np.isfinite(present)]
+        if len(finite):
+            self.integer = self.integer and bool(
+                np.all(np.floor(finite) == finite))
+            self._range("minimum", "maximum", float(finite.min()),
+                        float(finite.max()))
+            self.total += float(finite.sum())
+            self.squares += float(np.square(finite).sum())
+
+    def _count_distinct(self, present):
+        if self.distinct_overflow:
+            return
+        np = _numpy()
+        unique = np.unique(present[:DISTINCT_SAMPLE])
+        if len(unique) <= DISTINCT_LIMIT and len(present) > DISTINCT_SAMPLE:
+            unique = np.unique(present)
+        self.distinct.update(unique.tolist())
+        if len(self.distinct) > DISTINCT_LIMIT:
+            self.distinct = set()
+            self.distinct_overflow = True
+
+    def to_text(self):
+        """Count the numbers seen so far as text, the column holds text.
+
+        The numbers themselves are not kept, so the lengths are those of
+        the distinct numbers (or the minimum and maximum when there were
+        too many to count).
+        """
+        self.numeric = False
+        self.distinct = {_number_text(v) for v in self.distinct}
+        for text in self.distinct | {_number_text(v) for v in
+                                     (self.minimum, self.maximum)
+                                     if v is not None}:
+            self._range("min_length", "max_length", len(text), len(text))
+
+    def _range(self, low, high, minimum, maximum):
+        current = getattr(self, low)
+        setattr(self, low, minimum if current is None
+                else min(current, minimum))
+        current = getattr(self, high)
+        setattr(self, high, maximum if current is None
+                else max(current, maximum))
+
+    def merge(self, other):
+        """Add the summary of another chunk of the same column."""
+        self.count += other.count
+        self.missing += other.missing
+        if other.min_length is not None:
+            self._range("min_length", "max_length", other.min_length,
+                        other.max_length)
+        if self.numeric and not other.numeric:
+            self.to_text()
+        elif other.numeric and not self.numeric:
+            other.to_text()
+        self.distinct_overflow = self.distinct_overflow or \
+            other.distinct_overflow
+        if not self.distinct_overflow:
+            self.distinct |= other.distinct
+            if len(self.distinct) > DISTINCT_LIMIT:
+                self.distinct_overflow = True
+        if self.distinct_overflow:
+            self.distinct = set()
+
+        self.numeric = self.numeric and other.numeric
+        self.integer = self.integer and other.integer
+        if other.minimum is not None:
+            self._range("minimum", "maximum", other.minimum, other.maximum)
+        self.total += other.total
+        self.squares += other.squares
+
+    def as_dict(self):
+        present = self.count - self.missing
+        summary = {
+            "missing": self.missing,
+            "distinct": None if self.distinct_overflow
+            else len(self.distinct),
+        }
+        if not present:
+            summary["type"] = "empty"
+        elif self.numeric:
+            summary["type"] = "integer" if self.integer else "float"
+            summary["min"] = self.minimum
+            summary["max"] = self.maximum
+            if self.minimum is not None:
+                mean = self.total / present
+                summary["mean"] = mean
+                summary["std"] = math.sqrt(
+                    max(self.squares / present - mean ** 2, 0))
+        else:
+            summary["type"] = "string"
+            summary["min_length"] = self.min_length
+            summary["max_length"] = self.max_length
+        return summary
+
+
+def _numbers(values):
+    """Return the strings `values` as floats (NaN if empty).
+
+    Returns None if they are not all numbers.
+    """
+    np = _numpy()
+    try:
+        return np.where(values == "", "nan", values).astype(np.float64)
+    except ValueError:
+        return None
+
+
+def _number_text(number):
+    return str(int(number)) if float(number).is_integer() else repr(number)
+
+
+def _fill_missing(text, delimiter):
+    """Return `text` with "nan" in every empty field."""
+    d = delimiter
+    if d + d not in text and f"\n{d}" not in text and f"{d}\n" not in text \
+            and f"{d}\r" not in text and not text.startswith(d) \
+            and not text.endswith(d):
+        return text
+    text = f"\n{text}\n"
+    # twice, as replacements do not overlap
+    text = text.replace(d + d, f"{d}nan{d}").replace(d + d, f"{d}nan{d}")
+    text = text.replace(f"\n{d}", f"\nnan{d}").replace(f"{d}\n", f"{d}nan\n")
+    text = text.replace(f"{d}\r", f"{d}nan\r")
+    return text[1:-1]
+
+
+def _load(lines, delimiter, dtype, columns, quoted):
+    # `quotechar` needs NumPy 1.23, it is only passed for quoted values
+    kwargs = {"quotechar": '"'} if quoted else {}
+    return _numpy().loadtxt(lines, delimiter=delimiter, dtype=dtype,
+                            usecols=columns, comments=None, ndmin=2,
+                            **kwargs)
+
+
+def _parse(text, delimiter, width):
+    """Return the lines in `text` as a 2D NumPy array of strings."""
+    np = _numpy()
+    try:
+        table = _load(io.StringIO(text), delimiter, str, None, '"' in text)
+    except (TypeError, ValueError):
+        # NumPy < 1.23, or rows with a different number of fields
+        table = None
+    if table is not None and table.shape[1] == width:
+        return table
+
+    rows = [row for row in csv.reader(io.StringIO(text), delimiter=delimiter)
+            if row]
+    # pad short rows and drop extra fields, so that every column is filled
+    rows = [row[:width] + [""] * (width - len(row)) for row in rows]
+    return np.array(rows, dtype=str).reshape(len(rows), width)
+
+
+def _summarize_columns(text, lines, delimiter, columns):
+    np = _numpy()
+    numeric = [i for i, c in enumerate(columns) if c.numeric]
+    textual = [i for i, c in enumerate(columns) if not c.numeric]
+    quoted = '"' in text
+    if numeric:
+        try:
+            numbers = _load(lines, delimiter, np.float64, numeric, quoted)
+        except ValueError:
+            # empty values, which NumPy only parses as "nan"
+            filled = _fill_missing(text, delimiter)
+            if filled is text:
+                raise
+            numbers = _load(filled.splitlines(), delimiter, np.float64,
+                            numeric, quoted)
+    if textual:
+        strings = _load(lines, delimiter, str, textual, quoted)
+    if numeric and textual and len(numbers) != len(strings):
+        raise ValueError("Columns have a different number of rows")
+
+    for j, i in enumerate(numeric):
+        columns[i].update_numbers(numbers[:, j])
+    for j, i in enumerate(textual):
+        columns[i].update(strings[:, j])
+    return len(numbers) if numeric else len(strings)
+
+
+def _summarize(text, names, delimiter, columns):
+    if not text.strip():
+        return 0
+    lines = text.splitlines()
+    try:
+        return _summarize_columns(text, lines, delimiter, columns)
+    except (TypeError, ValueError):
+        pass
+
+    # text in a column of numbers, which usually shows in the first lines
+    sample = _parse("\n".join(lines[:TYPE_SAMPLE]), delimiter, len(names))
+    found = False
+    for i, summary in enumerate(columns):
+        if summary.numeric and _numbers(sample[:, i]) is None:
+            summary.to_text()
+            found = True
+    if found:
+        try:
+            return _summarize_columns(text, lines, delimiter, columns)
+        except (TypeError, ValueError):
+            pass
+
+    # a different number of fields, text further down, ...
+    table = _parse(text, delimiter, len(names))
+    for i, summary in enumerate(columns):
+        summary.update(table[:, i])
+    return len(table)
+
+
+def profile_range(path, start, end, names, delimiter,
+                  chunk_size=CHUNK_SIZE):
+    """Profile the lines of `path` that start in the byte range.
+
+    Returns
+    -------
+    tuple
+        the number of rows and a `ColumnSummary` per column
+    """
+    columns = [ColumnSummary(name) for name in names]
+    rows = 0
+    with open(path, "rb") as fp:
+        if start > 0:
+            # skip the line that started in the previous range
+            fp.seek(start - 1)
+            fp.readline()
+        position = fp.tell()
+        while position < end:
+            # a block of whole lines, the last one starts before `end`
+            block = fp.read(min(chunk_size, end - position))
+            if not block:
+                break
+            if not block.endswith(b"\n"):
+                block += fp.readline()
+            position += len(block)
+            rows += _summarize(block.decode("utf-8", errors="replace"),
+                               names, delimiter, columns)
+    return rows, columns
+
+
+def read_header(path):
+    """Return the column names, the delimiter and the size of the header."""
+    with open(path, "rb") as fp:
+        line = fp.readline()
+    text = line.decode("utf-8-sig", errors="replace")
+    if not text.strip():
+        raise ProfileError(f"{path} is empty")
+    try:
+        delimiter = csv.Sniffer().sniff(text, delimiters=",;\t|").delimiter
+    except csv.Error:
+        delimiter = ","
+    names = next(csv.reader(io.StringIO(text), delimiter=delimiter))
+    return names, delimiter, len(line)
+
+
+def profile_file(path, workers=None, chunk_size=CHUNK_SIZE):
+    """Profile the CSV file at `path`.
+
+    Parameters
+    ----------
+    workers : int, optional
+        number of processes, by default one per core for large files
+    """
+    _numpy()
+    names, delimiter, start = read_header(path)
+    size = os.path.getsize(path)
+    workers = workers or (os.cpu_count() or 1)
+    if size < PARALLEL_THRESHOLD:
+        workers = 1
+
+    if workers == 1:
+        results = [profile_range(path, start, size, names, delimiter,
+                                 chunk_size)]
+    else:
+        # a few ranges per process, so that a slow range does not stall
+        # the others
+        n = workers * 4
+        bounds = [start + (size - start) * i // n for i in range(n + 1)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(
+                profile_range,
+                *zip(*[(path, low, high, names, delimiter, chunk_size)
+                       for low, high in zip(bounds, bounds[1:])])
+            ))
+
+    rows, columns = results[0]
+    for more_rows, more_columns in results[1:]:
+        rows += more_rows
+        for summary, other in zip(columns, more_columns):
+            summary.merge(other)
+    return {
+        "rows": rows,
+        "delimiter": delimiter,
+        "columns": {c.name: c.as_dict() for c in columns},
+    }
+
+
+class ProfileCache:
+    """Summaries of databases, stored next to their fingerprint."""
+
+    def __init__(self, folder):
+        self.folder = Path(folder)
+
+    def _file(self, path):
+        key = hashlib.sha1(str(path).encode()).hexdigest()[:16]
+        return self.folder / f"{key}.json"
+
+    def get(self, path, fingerprint_):
+        try:
+            with open(self._file(path)) as fp:
+                cached = json.load(fp)
+        except (OSError, ValueError):
+            return None
+        if cached.get("fingerprint") != fingerprint_:
+            return None
+        return cached["profile"]
+
+    def put(self, path, fingerprint_, profile):
+        self.folder.mkdir(parents=True, exist_ok=True)
+        file_ = self._file(path)
+        tmp = file_.with_suffix(".tmp")
+        with open(tmp, "w") as fp:
+            json.dump({"path": str(path), "fingerprint": fingerprint_,
+                       "profile": profile}, fp, indent=2)
+        os.replace(tmp, file_)
+
+
+def profile_database(path, cache=None, force=False, workers=None):
+    """Return the profile of the database at `path` and if it was cached."""
+    fingerprint_ = fingerprint(path)
+    if cache and not force:
+        profile = cache.get(path, fingerprint_)
+        if profile is not None:
+            return profile, True
+    profile = profile_file(path, workers)
+    if cache:
+        cache.put(path, fingerprint_, profile)
+    return profile, False
+
+
+def report(label, path, profile):
+    """Return the profile of a database as a table."""
+    header = f"{'Column':24}{'Type':>9}{'Missing':>9}{'Distinct':>10}" \
+        f"  Range"
+    lines = [f"{label}: {path}, {profile['rows']} rows", header,
+             "-" * len(header)]
+    for name, column in profile["columns"].items():
+        if column["type"] in ("integer", "float") \
+                and column.get("min") is not None:
+            range_ = f"{column['min']:g} .. {column['max']:g} " \
+                f"(mean {column['mean']:g})"
+        elif column["type"] == "string":
+            range_ = f"length {column['min_length']} .. " \
+                f"{column['max_length']}"
+        else:
+            range_ = ""
+        distinct = column["distinct"]
+        distinct = f">{DISTINCT_LIMIT}" if distinct is None else distinct
+        lines.append(f"{name[:23]:24}{column['type']:>9}"
+                     f"{column['missing']:>9}{distinct:>10}  {range_}")
+    return "\n".join(lines)
@@ -0,0 +1,107 @@
+""" Docker helpers shared by the node and server commands
+"""
+import hashlib
+import json
+
+from pathlib import Path
+from urllib.parse import urlparse
+
+from vantage6.common.globals import APPNAME
+from vantage6.cli.globals import ROLE_LABEL
+
+LOCAL_HOSTNAMES = ("localhost", "127.0.0.1", "0.0.0.0")
+
+
+def get_or_create_network(docker_client, name):
+    """Return the Docker network `name`, create it when it does not exist."""
+    networks = docker_client.networks.list(names=[name])
+    # `names` filters on a substring, so we need to check for an exact match
+    for network in networks:
+        if network.name == name:
+            return network
+    return docker_client.networks.create(name, driver="bridge")
+
+
+def connect_to_network(network, container, aliases=None):
+    """Connect `container` to `network` unless it is already connected."""
+    container.reload()
+    connected = container.attrs.get("NetworkSettings", {}).get("Networks", {})
+    if network.name not in connected:
+        network.connect(container, aliases=aliases)
+
+
+def published_ports(container):
+    """Return the host ports of `container` mapped to its internal ports.
+
+    Returns
+    -------
+    dict
+        host port (str) -> internal port (str)
+    """
+    ports = container.attrs.get("NetworkSettings", {}).get("Ports") or {}
+    mapping = {}
+    for internal, bindings in ports.items():
+        for binding in bindings or []:
+            mapping[binding.get("HostPort")] = internal.split("/")[0]
+    return mapping
+
+
+def find_local_server(docker_client, server_url, port):
+    """Find the server container that `server_url` and `port` point to.
+
+    A node that is configured to use a server on this machine (localhost)
+    reaches it through the port the server container publishes on the host.
+    This looks up that container so the node can use it directly.
+
+    Parameters
+    ----------
+    docker_client : docker.DockerClient
+        client connected to the Docker daemon
+    server_url : str
+        base-URL of the server as in the node configuration
+    port : int or str
+        port of the server as in the node configuration
+
+    Returns
+    -------
+    tuple or None
+        (container, internal port) of the server, or None when the server
+        is not running in a container on this machine
+    """
+    if urlparse(server_url).hostname not in LOCAL_HOSTNAMES:
+        return None
+
+    servers = docker_client.containers.list(
+        filters={"label": f"{APPNAME}-type=server"})
+    for server in servers:
+        if server.labels.get(ROLE_LABEL) in ("replica", "database"):
+            continue
+        internal = published_ports(server).get(str(port))
+        if internal:
+            return server, internal
+
+    return None
+
+
+def container_spec_hash(image, spec, files=()):
+    """Return a hash of the spec a container is created from.
+
+    Parameters
+    ----------
+    image : str
+        image of the container
+    spec : dict
+        keyword arguments for `containers.run`
+    files : list of Path, optional
+        files (e.g. the configuration) of which the contents are part of
+        the spec
+    """
+    sha256 = hashlib.sha256()
+    sha256.update(json.dumps([image, spec], sort_keys=True,
+                             default=str).encode())
+    for path in files:
+        try:
+            sha256.update(Path(path).read_bytes())
+        except OSError:
+            pass
+    return sha256.hexdigest()
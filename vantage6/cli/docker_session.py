@@ -0,0 +1,222 @@
+""" A single Docker connection for the duration of a command
+
+    Commands used to create a client, ping the daemon, list the containers
+    (which makes docker-py inspect every one of them) and then look each
+    container up again by name. The `DockerSession` removes these extra
+    round trips:
+
+    * the client is created once, on first use, and its connection pool is
+      shared by everything the command does;
+    * there is no separate ping: when the first real API call cannot reach
+      the daemon, `DockerNotRunning` is raised, which click turns into an
+      error and exit code 1 (a long-running process such as the vnode
+      daemon handles it like any other exception);
+    * containers are listed without inspecting them, and the result is
+      cached so that later lookups by name do not hit the daemon;
+    * every API call is counted per endpoint.
+
+    Operations on many containers or volumes at once are sent concurrently
+    through the `AsyncDockerClient` when the daemon is local.
+"""
+import threading
+
+from collections import Counter
+
+import click
+import docker
+import requests
+
+from vantage6.common import error
+from vantage6.common.globals import APPNAME
+from vantage6.cli.profiling import docker_endpoint
+from vantage6.cli.async_docker import AsyncDockerClient, unix_socket_path
+
+DOCKER_NOT_RUNNING = \
+    "Docker socket can not be found. Make sure Docker is running."
+
+# below this number of containers, sending the requests one by one is fast
+# enough and not worth starting an event loop for
+FLEET_THRESHOLD = 4
+
+
+class DockerNotRunning(click.ClickException):
+    """The Docker daemon cannot be reached."""
+
+    def __init__(self, message=DOCKER_NOT_RUNNING):
+        super().__init__(message)
+
+    def show(self, file=None):
+        error(self.message)
+
+
+class DockerSession:
+    """Lazily created Docker client with a container lookup cache.
+
+    Parameters
+    ----------
+    client : docker.DockerClient, optional
+        client to use instead of one created from the environment
+    max_in_flight : int, optional
+        maximum number of concurrent requests of bulk operations
+    """
+
+    # a long-running process (the vnode daemon) shares one client between
+    # all the sessions that it creates
+    shared_client = None
+
+    def __init__(self, client=None, max_in_flight=32):
+        self._client = None
+        self._containers = {}
+        self.calls = Counter()
+        if client is not None:
+            self._instrument(client)
+
+        # bulk operations only bypass docker-py for a daemon on this machine
+        # that is also the one the client (from the environment) talks to
+        socket_path = unix_socket_path() if client is None else None
+        self._fleet = AsyncDockerClient(socket_path, max_in_flight,
+                                        self.calls) if socket_path else None
+
+    @property
+    def client(self):
+        """The `docker.DockerClient` of this session."""
+        if self._client is None:
+            try:
+                client = DockerSession.shared_client or docker.from_env()
+            except docker.errors.DockerException as e:
+                # e.g. an invalid DOCKER_HOST
+                raise DockerNotRunning(f"{DOCKER_NOT_RUNNING} ({e})") from e
+            self._instrument(client)
+        return self._client
+
+    @property
+    def api_calls(self):
+        """Number of requests sent to the Docker daemon so far."""
+        return sum(self.calls.values())
+
+    def _instrument(self, client):
+        """Count the requests of `client`, raise when Docker is down."""
+        api = client.api
+        session = self
+
+        def send(request, **kwargs):
+            session.calls[docker_endpoint(request.method, request.url)] += 1
+            try:
+                # looked up on every call, so that the profiler's recorder
+                # (which replaces the class attribute) keeps working
+                return type(api).send(api, request, **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                raise DockerNotRunning() from e
+
+        api.send = send
+        self._client = client
+
+    def containers(self, type_=None, all=False):
+        """List the vantage6 containers, optionally of a single type.
+
+        The containers are not inspected: only the name, labels, status and
+        image are available. Use `container.reload()` to get everything.
+        """
+        label = f"{APPNAME}-type={type_}" if type_ else f"{APPNAME}-type"
+        containers = self.client.containers.list(
+            all=all, filters={"label": label}, sparse=True)
+        for container in containers:
+            _complete_sparse(container)
+            self._containers[container.name] = container
+        return containers
+
+    def container(self, name):
+        """Return the container `name`, from the cache when possible.
+
+        Raises
+        ------
+        docker.errors.NotFound
+            when there is no such container
+        """
+        if name not in self._containers:
+            self._containers[name] = self.client.containers.get(name)
+        return self._containers[name]
+
+    def forget(self, name):
+        """Remove `name` from the cache, e.g. after removing it."""
+        self._containers.pop(name, None)
+
+    def kill_all(self, containers):
+        """Kill all `containers`.
+
+        Returns
+        -------
+        dict
+            the `docker.errors.APIError` per container name that failed
+        """
+        return self._for_each(containers, lambda c: c.kill(),
+                              lambda fleet, c: fleet.kill(c.id))
+
+    def stop_all(self, containers, timeout=10):
+        """Stop all `containers`, giving them `timeout` seconds each."""
+        return self._for_each(containers, lambda c: c.stop(timeout=timeout),
+                              lambda fleet, c: fleet.stop(c.id, timeout))
+
+    def remove_volumes(self, volumes):
+        """Remove all `volumes`, see `kill_all` for the return value."""
+        return self._for_each(volumes, lambda v: v.remove(),
+                              lambda fleet, v: fleet.remove_volume(v.name))
+
+    def follow_logs(self, containers, callback):
+        """Call `callback` with the log output of all `containers`.
+
+        The output of containers with a TTY is passed on as is, that of
+        other containers without the headers of the multiplexed stream
+        (docker-py inspects the container for this as well).
+
+        This blocks until all containers have stopped, so it is usually run
+        in a (daemon) thread.
+        """
+        if self._use_fleet(containers):
+            self._for_each(containers, None,
+                           lambda fleet, c: fleet.follow_logs(c.id, callback))
+            return
+
+        def follow(container):
+            for log in container.attach(stream=True, logs=True):
+                callback(log)
+
+        threads = [threading.Thread(target=follow, args=(c,), daemon=True)
+                   for c in containers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _use_fleet(self, items):
+        return self._fleet is not None and len(items) >= FLEET_THRESHOLD
+
+    def _for_each(self, items, sync, concurrent):
+        """Apply an operation to all `items`, concurrently if possible."""
+        if self._use_fleet(items):
+            errors = self._fleet.for_each(
+                items, lambda item: concurrent(self._fleet, item))
+            if any(isinstance(e, OSError) for e in errors.values()):
+                raise DockerNotRunning()
+            return errors
+
+        errors = {}
+        for item in items:
+            try:
+                sync(item)
+            except docker.errors.APIError as e:
+                errors[item.name] = e
+        return errors
+
+
+def _complete_sparse(container):
+    """Make the name and labels of a sparse container available.
+
+    docker-py reads these from the attributes of an inspected container,
+    while the list endpoint returns them under different keys.
+    """
+    attrs = container.attrs
+    if "Names" in attrs and "Name" not in attrs:
+        attrs["Name"] = attrs["Names"][0]
+    if "Labels" in attrs and "Config" not in attrs:
+        attrs["Config"] = {"Labels": attrs["Labels"]}
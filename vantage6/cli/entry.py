@@ -0,0 +1,33 @@
+""" Console scripts
+
+    The `vnode` script first tries to hand the command to the vnode daemon
+    and only imports the full command line interface when it has to run
+    the command itself. Both scripts complete configuration names and
+    environments before the command line interface is imported.
+"""
+import sys
+
+from vantage6.cli.completion import bash_complete
+from vantage6.cli.daemon_client import forward_argv
+
+
+def vnode():
+    if bash_complete("vnode", "node"):
+        sys.exit(0)
+
+    response = forward_argv(sys.argv[1:])
+    if response is not None:
+        exit_code, output = response
+        sys.stdout.write(output)
+        sys.exit(exit_code)
+
+    from vantage6.cli.node import cli_node
+    cli_node(prog_name="vnode")
+
+
+def vserver():
+    if bash_complete("vserver", "server"):
+        sys.exit(0)
+
+    from vantage6.cli.server import cli_server
+    cli_server(prog_name="vserver")
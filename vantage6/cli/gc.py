@@ -0,0 +1,173 @@
+""" Retention of the task data of a node
+
+    The node stores the input and output of every task in a folder of its
+    own (`task-<run id>`) in its data folder, task directory and data
+    volume. These folders are never removed. The garbage collector removes
+    the oldest task folders according to a retention policy:
+
+    * max_age: remove folders older than this many days
+    * max_count: keep at most this many folders
+    * max_size: keep at most this many megabytes of task data
+
+    Folders in which anything was modified recently (e.g. of a task that is
+    still running) are never removed.
+"""
+import fnmatch
+import os
+import shutil
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# task folders that were modified less than this many seconds ago are kept
+MIN_AGE = 3600
+
+DEFAULT_PATTERN = "task-*"
+
+DAY = 24 * 3600
+
+MB = 1024 * 1024
+
+
+class TaskFolder:
+    """A folder with the data of a single task."""
+
+    def __init__(self, path, mtime, size=0):
+        self.path = Path(path)
+        self.mtime = mtime
+        self.size = size
+        self.reason = None
+
+    def age(self, now):
+        return now - self.mtime
+
+
+def folder_usage(path):
+    """Return the total size of the files in `path` and the newest mtime.
+
+    Both are taken over the whole tree: a task that is still running
+    writes its files in subfolders (e.g. `output`), which does not change
+    the modification time of the task folder itself.
+    """
+    total = 0
+    newest = 0
+    stack = [path]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                    newest = max(newest, stat.st_mtime)
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        total += stat.st_size
+                except OSError:
+                    # removed while we were scanning
+                    pass
+    return total, newest
+
+
+def scan(folder, pattern=DEFAULT_PATTERN, workers=8):
+    """Return the task folders in `folder`, with their sizes.
+
+    The modification time of a task folder is the newest of all files and
+    folders in it.
+    """
+    try:
+        with os.scandir(folder) as entries:
+            folders = [
+                TaskFolder(entry.path, entry.stat().st_mtime)
+                for entry in entries
+                if entry.is_dir(follow_symlinks=False)
+                and fnmatch.fnmatch(entry.name, pattern)
+            ]
+    except FileNotFoundError:
+        return []
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        usages = executor.map(folder_usage, [f.path for f in folders])
+        for task_folder, (size, newest) in zip(folders, usages):
+            task_folder.size = size
+            task_folder.mtime = max(task_folder.mtime, newest)
+    return folders
+
+
+def select(folders, max_age=None, max_count=None, max_size=None, now=None,
+           min_age=MIN_AGE):
+    """Return the folders that the retention policy removes.
+
+    Parameters
+    ----------
+    folders : list of TaskFolder
+        task folders of a node
+    max_age : float, optional
+        maximum age in days
+    max_count : int, optional
+        maximum number of folders to keep
+    max_size : float, optional
+        maximum total size in megabytes
+    """
+    now = now if now is not None else time.time()
+    expired = []
+    kept_count = 0
+    kept_size = 0
+    for task_folder in sorted(folders, key=lambda f: f.mtime, reverse=True):
+        if task_folder.age(now) < min_age:
+            kept_count += 1
+            kept_size += task_folder.size
+            continue
+
+        if max_age is not None and task_folder.age(now) > max_age * DAY:
+            task_folder.reason = f"older than {max_age:g} days"
+        elif max_count is not None and kept_count >= max_count:
+            task_folder.reason = f"more than {max_count} folders"
+        elif max_size is not None and \
+                kept_size + task_folder.size > max_size * MB:
+            task_folder.reason = f"more than {max_size:g} MB"
+        else:
+            kept_count += 1
+            kept_size += task_folder.size
+            continue
+        expired.append(task_folder)
+    return expired
+
+
+def remove(folders, workers=8):
+    """Remove `folders` in parallel.
+
+    Returns
+    -------
+    dict
+        the exception for every folder that could not be removed
+    """
+    def remove_one(task_folder):
+        try:
+            shutil.rmtree(task_folder.path)
+        except OSError as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(remove_one, folders)
+        return {f.path: e for f, e in zip(folders, results) if e}
+
+
+def report(folders, now=None):
+    """Return a table of the folders that are (or would be) removed."""
+    now = now if now is not None else time.time()
+    header = f"{'Folder':50}{'Age':>10}{'Size':>12}  Reason"
+    lines = [header, "-" * len(header)]
+    for task_folder in folders:
+        lines.append(f"{str(task_folder.path):50}"
+                     f"{task_folder.age(now) / DAY:>9.1f}d"
+                     f"{task_folder.size / MB:>9.1f} MB  "
+                     f"{task_folder.reason}")
+    lines.append("-" * len(header))
+    total = sum(f.size for f in folders)
+    lines.append(f"{len(folders)} folder(s), {total / MB:.1f} MB")
+    return "\n".join(lines)
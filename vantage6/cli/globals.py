@@ -1,3 +1,6 @@
+import math
+import os
+
 from pathlib import Path
 from vantage6.common.globals import (
     APPNAME,
@@ -11,6 +14,59 @@ DEFAULT_SERVER_SYSTEM_FOLDERS = True
 
 DEFAULT_SERVER_ENVIRONMENT = "prod"
 
+# worker processes and threads per worker for the server inside the
+# container. The number of workers follows the usual 2 * cores + 1 rule.
+CPU_COUNT = os.cpu_count() or 1
+
+DEFAULT_SERVER_WORKERS = 2 * CPU_COUNT + 1
+
+# requests are mostly waiting on the database, so all workers together
+# handle up to 4 requests per core (the upper end of the 2-4 per core that
+# gunicorn recommends for workers * threads). With the default number of
+# workers that is 2 threads each, fewer workers get more threads.
+SERVER_REQUESTS_PER_CORE = 4
+
+
+def server_threads(workers):
+    """Return the default number of threads for `workers` processes."""
+    return max(2, math.ceil(SERVER_REQUESTS_PER_CORE * CPU_COUNT / workers))
+
+
+DEFAULT_SERVER_THREADS = server_threads(DEFAULT_SERVER_WORKERS)
+
+# images of the node and server, unless configured otherwise
+DEFAULT_NODE_IMAGE = "harbor.vantage6.ai/infrastructure/node:latest"
+
+DEFAULT_SERVER_IMAGE = "harbor.vantage6.ai/infrastructure/server:latest"
+
+# image used to balance the load over multiple server replicas
+DEFAULT_LOAD_BALANCER_IMAGE = "nginx:stable-alpine"
+
+# image used for the database that can be bundled with the server
+DEFAULT_POSTGRES_IMAGE = "postgres:13-alpine"
+
+#
+#   DOCKER SETTINGS
+#
+# user-defined network that is shared by all node and server containers on
+# this machine, so that they can reach each other by container name.
+# Note that this is not `NodeContext.docker_network_name`, which is the
+# isolated network the node creates for its algorithm containers.
+LOCAL_NETWORK_NAME = f"{APPNAME}-local"
+
+#
+#   DOCKER LABELS
+#
+# containers that together make up a single server instance (e.g. replicas
+# and their load balancer) share the same group label
+GROUP_LABEL = f"{APPNAME}-group"
+
+ROLE_LABEL = f"{APPNAME}-role"
+
+# hash of the spec (image, configuration, mounts, ...) a container was
+# created from, to decide whether it can be reused on a restart
+SPEC_HASH_LABEL = f"{APPNAME}-spec-hash"
+
 #
 #   NODE SETTINGS
 #
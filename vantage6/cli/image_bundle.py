@@ -0,0 +1,291 @@
+""" Offline image bundles
+
+    Sites without (fast) access to the registry can receive their images as
+    a bundle instead: a single `docker save` archive that contains the node
+    image and algorithm images. Docker stores the layers that these images
+    share only once in such an archive.
+
+    The bundle is named after its sha256 digest and comes with a manifest
+    (`<digest>.json`) that lists the images it contains. Loading a bundle
+    verifies the digest and records the images in an index, which the start
+    commands use to skip pulling an image that came from a bundle.
+"""
+import datetime
+import hashlib
+import io
+import json
+import os
+import re
+import tarfile
+
+from pathlib import Path
+
+import docker
+
+from vantage6.cli.context import NodeContext
+
+CHUNK_SIZE = 1024 * 1024
+
+# files of a `docker save` archive that describe all images in it, these
+# are merged when the archives of several images are combined. All other
+# files (layers, image configurations) are named after their content.
+INDEX_FILES = ("manifest.json", "repositories", "index.json")
+
+
+class BundleError(Exception):
+    """The bundle is corrupt or could not be loaded."""
+
+
+def image_index_path(system_folders):
+    """Return the path of the index of images loaded from bundles."""
+    return Path(NodeContext.type_data_folder(system_folders)).parent / \
+        "images.json"
+
+
+class ImageIndex:
+    """Images that were loaded from a bundle, by name."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        try:
+            with open(self.path) as fp:
+                self.images = json.load(fp)
+        except FileNotFoundError:
+            self.images = {}
+
+    def record(self, name, image_id, bundle):
+        self.images[name] = {"id": image_id, "bundle": bundle}
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w") as fp:
+            json.dump(self.images, fp, indent=2)
+
+    def is_loaded(self, docker_client, name):
+        """Return True if `name` is (still) the image from the bundle."""
+        entry = self.images.get(name)
+        if not entry:
+            return False
+        try:
+            return docker_client.images.get(
+                self.local_reference(name)).id == entry["id"]
+        except docker.errors.ImageNotFound:
+            return False
+
+    def local_reference(self, name):
+        """Return the reference of the loaded image `name` in Docker.
+
+        Docker does not keep the digest of an image that is pinned to one
+        (`repository@sha256:...`) when it is loaded, so such an image is
+        referred to by its id.
+        """
+        return self.images[name]["id"] if "@" in name else name
+
+
+def save_bundle(docker_client, images, folder):
+    """Export `images` into a bundle in `folder`.
+
+    The images need to be available locally.
+
+    Returns
+    -------
+    tuple
+        path of the bundle and its manifest
+    """
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+
+    entries = []
+    for name in images:
+        image = docker_client.images.get(name)
+        entries.append({
+            "name": name,
+            "id": image.id,
+            "repo_digests": image.attrs.get("RepoDigests", []),
+            "size": image.attrs.get("Size", 0),
+        })
+
+    tmp = folder / f".bundle-{os.getpid()}.tmp"
+    with open(tmp, "wb") as fp:
+        writer = _HashingWriter(fp)
+        # exported by name, so that the images are tagged when loaded
+        _combine_archives((docker_client.api.get_image(name, CHUNK_SIZE)
+                           for name in images), writer)
+    sha256, size = writer.sha256, writer.size
+
+    digest = sha256.hexdigest()
+    path = folder / f"{digest}.tar"
+    os.replace(tmp, path)
+
+    manifest = {
+        "bundle": f"sha256:{digest}",
+        "size": size,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "images": entries,
+    }
+    with open(path.with_suffix(".json"), "w") as fp:
+        json.dump(manifest, fp, indent=2)
+
+    return path, manifest
+
+
+class _ChunkReader(io.RawIOBase):
+    """File-like object that reads from an iterator of chunks."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.buffer:
+            self.buffer = next(self.chunks, None)
+            if self.buffer is None:
+                self.buffer = b""
+                return 0
+        n = min(len(b), len(self.buffer))
+        b[:n] = self.buffer[:n]
+        self.buffer = self.buffer[n:]
+        return n
+
+
+class _HashingWriter:
+    """Writes to `fp` while computing the sha256 and size."""
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.fp.write(data)
+
+
+def _combine_archives(archives, fp):
+    """Combine the `docker save` archives of single images into one.
+
+    docker-py can only export a single image. The archives are streamed
+    into one, in which the layers that images share are stored once, as in
+    an archive that Docker exports for several images at once.
+
+    Parameters
+    ----------
+    archives : iterable
+        iterators over the chunks of each archive
+    fp : file-like
+        where the combined archive is written
+    """
+    written = set()
+    indexes = {}
+    with tarfile.open(fileobj=fp, mode="w|") as combined:
+        for chunks in archives:
+            with tarfile.open(fileobj=_ChunkReader(chunks),
+                              mode="r|") as archive:
+                for member in archive:
+                    if member.name in INDEX_FILES:
+                        _merge_index(indexes, member.name, json.load(
+                            archive.extractfile(member)))
+                    elif member.name not in written:
+                        written.add(member.name)
+                        combined.addfile(member, archive.extractfile(member)
+                                         if member.isfile() else None)
+
+        for name, content in indexes.items():
+            data = json.dumps(content).encode()
+            member = tarfile.TarInfo(name)
+            member.size = len(data)
+            combined.addfile(member, io.BytesIO(data))
+
+
+def _merge_index(indexes, name, content):
+    if name not in indexes:
+        indexes[name] = content
+    elif name == "manifest.json":
+        indexes[name] += content
+    elif name == "repositories":
+        for repository, tags in content.items():
+            indexes[name].setdefault(repository, {}).update(tags)
+    else:
+        indexes[name]["manifests"] += content.get("manifests", [])
+
+
+def bundle_digest(path):
+    """Return the sha256 digest of the file at `path`."""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return f"sha256:{sha256.hexdigest()}"
+
+
+def load_bundle(docker_client, path, index):
+    """Load the bundle at `path` into Docker and record it in `index`.
+
+    The digest of the bundle is verified before it is loaded, so that a
+    corrupt bundle does not leave any images behind.
+
+    Returns
+    -------
+    list of str
+        names of the loaded images
+
+    Raises
+    ------
+    BundleError
+        when Docker could not load the bundle or its digest does not match
+    """
+    path = Path(path)
+    digest = bundle_digest(path)
+    manifest_path = path.with_suffix(".json")
+    manifest = {}
+    expected = None
+    if manifest_path.exists():
+        with open(manifest_path) as fp:
+            manifest = json.load(fp)
+        expected = manifest["bundle"]
+    elif re.fullmatch("[0-9a-f]{64}", path.stem):
+        expected = f"sha256:{path.stem}"
+    if expected and digest != expected:
+        raise BundleError(f"Digest {digest} of {path} does not match "
+                          f"{expected}, the bundle is corrupt")
+
+    def chunks():
+        with open(path, "rb") as fp:
+            yield from iter(lambda: fp.read(CHUNK_SIZE), b"")
+
+    loaded = []
+    try:
+        for line in docker_client.api.load_image(chunks()):
+            if "error" in line:
+                raise BundleError(line["error"])
+            message = line.get("stream", "")
+            if message.startswith("Loaded image: "):
+                loaded.append(message[len("Loaded image: "):].strip())
+    except docker.errors.APIError as e:
+        raise BundleError(str(e))
+
+    for name in loaded:
+        index.record(name, docker_client.images.get(name).id, digest)
+
+    # images that are pinned to a digest are loaded without a name
+    for entry in manifest.get("images", []):
+        if "@" not in entry["name"] or entry["name"] in loaded:
+            continue
+        try:
+            docker_client.images.get(entry["id"])
+        except docker.errors.ImageNotFound:
+            continue
+        index.record(entry["name"], entry["id"], digest)
+        loaded.append(entry["name"])
+    index.save()
+    return loaded
+
+
+def deduplication(manifest):
+    """Return the bytes saved by storing shared layers once."""
+    return max(0, sum(image["size"] for image in manifest["images"]) -
+               manifest["size"])
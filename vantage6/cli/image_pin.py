@@ -0,0 +1,112 @@
+""" Pinning the node and server images to a digest
+
+    A tag like `latest` can point to a different image at every start, and
+    resolving it takes a registry lookup. A configuration can therefore pin
+    its image to a digest (`image_digest`). The start commands then use
+    `<repository>@<digest>`, straight from the local image store when it is
+    available, and the pin only moves with an explicit upgrade.
+"""
+import re
+
+import docker
+
+from docker.utils import parse_repository_tag
+
+from vantage6.cli.pull import pull_images
+
+DIGEST_PATTERN = re.compile(r"sha256:[0-9a-f]{64}")
+
+
+class PinError(Exception):
+    """The image could not be pinned."""
+
+
+def repository(image):
+    """Return `image` without its tag or digest."""
+    return parse_repository_tag(image)[0]
+
+
+def pinned_image(config, default):
+    """Return the pinned image reference of `config`, or None."""
+    digest = config.get("image_digest")
+    if not digest:
+        return None
+    return f"{repository(config.get('image', default))}@{digest}"
+
+
+def is_available(docker_client, image):
+    """Return True if `image` is in the local image store."""
+    try:
+        docker_client.images.get(image)
+    except docker.errors.ImageNotFound:
+        return False
+    return True
+
+
+def local_digest(docker_client, image):
+    """Return the digest of the local `image`, or None when unknown."""
+    try:
+        repo_digests = docker_client.images.get(image).attrs.get(
+            "RepoDigests", [])
+    except docker.errors.ImageNotFound:
+        return None
+    for repo_digest in repo_digests:
+        repo, digest = repo_digest.split("@", 1)
+        if repo == repository(image):
+            return digest
+    return None
+
+
+def remote_digest(docker_client, image):
+    """Return the digest that `image` currently refers to in the registry.
+
+    Only the manifest is inspected, nothing is pulled.
+    """
+    try:
+        return docker_client.images.get_registry_data(image).id
+    except docker.errors.APIError as e:
+        raise PinError(f"Could not resolve '{image}': "
+                       f"{e.explanation or e}")
+
+
+def pin_image(docker_client, ctx, default, image=None, upgrade=False):
+    """Pin the image of the configuration in `ctx` to a digest.
+
+    Without `upgrade` the digest of the local image is used, if there is
+    one. Otherwise the tag is resolved in the registry, and the image with
+    that digest is pulled. The pin is stored in the configuration file.
+
+    Parameters
+    ----------
+    ctx : AppContext
+        context of the node or server configuration
+    default : str
+        image that is used when the configuration does not specify one
+    image : str, optional
+        image to pin, replaces the image in the configuration
+
+    Returns
+    -------
+    tuple
+        the previous digest (or None) and the pinned digest
+    """
+    image = image or ctx.config.get("image", default)
+    previous = ctx.config.get("image_digest")
+
+    digest = None if upgrade else local_digest(docker_client, image)
+    if digest is None:
+        digest = remote_digest(docker_client, image)
+
+    reference = f"{repository(image)}@{digest}"
+    if not is_available(docker_client, reference):
+        failed = pull_images(docker_client, [reference])
+        if failed:
+            raise PinError(f"Could not pull '{reference}': "
+                           f"{failed[reference]}")
+
+    if image != ctx.config.get("image", default):
+        ctx.config["image"] = image
+    ctx.config["image_digest"] = digest
+    ctx.config_manager.put(ctx.environment, ctx.config)
+    ctx.config_manager.save(ctx.config_file)
+    return previous, digest
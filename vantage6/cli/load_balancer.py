@@ -0,0 +1,93 @@
+""" Load balancer for horizontally scaled servers
+
+    When a server is started with multiple replicas, an nginx container is
+    put in front of them. This module renders the nginx configuration for
+    that container.
+"""
+
+
+def nginx_config(upstreams, port):
+    """Create the nginx configuration for a group of server replicas.
+
+    Regular API calls are distributed over the replicas using the least
+    connections strategy and re-use upstream connections (keep-alive).
+    Websocket (socket.io) connections are pinned to a single replica, as a
+    socket.io session only lives on the replica that created it. The
+    client address alone does not tell clients apart: behind the Docker
+    port proxy every request comes from the same address. Sessions are
+    therefore hashed on the access token of the client, which it sends
+    with the handshake and every request after it (unlike the session id,
+    which the replica only hands out in its response to the handshake).
+    Forwarded and client addresses are used for clients without a token.
+
+    Parameters
+    ----------
+    upstreams : list of str
+        `host:port` of each of the server replicas
+    port : int or str
+        port on which the load balancer listens
+
+    Returns
+    -------
+    str
+        contents for `/etc/nginx/nginx.conf`
+    """
+    servers = "\n".join(
+        f"        server {upstream};" for upstream in upstreams
+    )
+
+    return f"""worker_processes auto;
+
+events {{
+    worker_connections 4096;
+}}
+
+http {{
+    gzip on;
+    gzip_proxied any;
+    gzip_min_length 1024;
+    gzip_types application/json text/plain text/css application/javascript;
+
+    client_max_body_size 0;
+
+    upstream vantage6_api {{
+        least_conn;
+{servers}
+        keepalive 64;
+    }}
+
+    upstream vantage6_websocket {{
+        hash "$http_authorization$http_x_forwarded_for$remote_addr" consistent;
+{servers}
+    }}
+
+    map $http_upgrade $connection_upgrade {{
+        default upgrade;
+        ''      close;
+    }}
+
+    server {{
+        listen {port};
+
+        proxy_set_header Host $http_host;
+        proxy_set_header X-Real-IP $remote_addr;
+        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;
+        proxy_set_header X-Forwarded-Proto $scheme;
+
+        location /socket.io {{
+            proxy_pass http://vantage6_websocket;
+            proxy_http_version 1.1;
+            proxy_set_header Upgrade $http_upgrade;
+            proxy_set_header Connection $connection_upgrade;
+            proxy_read_timeout 1h;
+            proxy_buffering off;
+        }}
+
+        location / {{
+            proxy_pass http://vantage6_api;
+            proxy_http_version 1.1;
+            proxy_set_header Connection "";
+        }}
+    }}
+}}
+"""
@@ -0,0 +1,230 @@
+""" Prometheus metrics of the vantage6 containers on this machine
+
+    The metrics are written in the Prometheus text exposition format, to
+    be picked up by the textfile collector of the node_exporter.
+
+    Containers are found with a single label-filtered Docker query, which
+    does not inspect them. Only the containers that are running (or being
+    restarted) are inspected, for their start time and restart count,
+    which the list does not contain. CPU and memory usage are read from
+    the cgroup files of the containers rather than the Docker stats API,
+    which takes a second per container.
+"""
+import os
+import re
+import time
+
+from datetime import datetime, timezone
+from pathlib import Path
+
+import docker
+
+from vantage6.common.globals import APPNAME
+from vantage6.cli.context import NodeContext, ServerContext
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+
+# Docker timestamps have nanosecond precision, e.g.
+# 2020-04-21T08:51:58.123456789Z
+_DOCKER_TIME = re.compile(
+    r"^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(?:\.(\d+))?"
+    r"(Z|[+-]\d{2}:\d{2})$"
+)
+
+
+class Metric:
+    """A metric family: name, type, help text and labelled samples."""
+
+    def __init__(self, name, type_, help_):
+        self.name = f"{APPNAME}_{name}"
+        self.type = type_
+        self.help = help_
+        self.samples = []
+
+    def add(self, value, **labels):
+        self.samples.append((labels, value))
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} {self.type}"]
+        for labels, value in self.samples:
+            label_str = ",".join(
+                f'{key}="{escape_label(str(val))}"'
+                for key, val in sorted(labels.items())
+            )
+            lines.append(f"{self.name}{{{label_str}}} {format_value(value)}")
+        return "\n".join(lines)
+
+
+def escape_label(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n") \
+        .replace('"', '\\"')
+
+
+def format_value(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def parse_docker_time(value):
+    """Return the unix timestamp of a Docker timestamp string."""
+    match = _DOCKER_TIME.match(value)
+    if not match:
+        raise ValueError(f"Not a Docker timestamp: {value}")
+    seconds, fraction, zone = match.groups()
+    moment = datetime.strptime(seconds, "%Y-%m-%dT%H:%M:%S")
+    offset = timezone.utc if zone == "Z" else \
+        datetime.strptime(zone.replace(":", ""), "%z").tzinfo
+    fraction = float(f"0.{fraction}") if fraction else 0.0
+    return moment.replace(tzinfo=offset).timestamp() + fraction
+
+
+def read_cgroup_usage(container_id, root=CGROUP_ROOT):
+    """Return (cpu seconds, memory bytes) of a container from its cgroup.
+
+    Both cgroup v2 and v1 are supported, with either the systemd or the
+    cgroupfs driver of Docker. Returns (None, None) when the cgroup files
+    cannot be read (e.g. Docker runs in a VM).
+    """
+    for folder in (root / "system.slice" / f"docker-{container_id}.scope",
+                   root / "docker" / container_id):
+        try:
+            memory = int((folder / "memory.current").read_text())
+            cpu_stat = (folder / "cpu.stat").read_text().split()
+            usec = int(cpu_stat[cpu_stat.index("usage_usec") + 1])
+            return usec / 1e6, memory
+        except (OSError, ValueError):
+            continue
+
+    for parent in ("docker", "system.slice"):
+        name = container_id if parent == "docker" \
+            else f"docker-{container_id}.scope"
+        try:
+            memory = int((root / "memory" / parent / name /
+                          "memory.usage_in_bytes").read_text())
+            nsec = int((root / "cpuacct" / parent / name /
+                        "cpuacct.usage").read_text())
+            return nsec / 1e9, memory
+        except (OSError, ValueError):
+            continue
+
+    return None, None
+
+
+def collect(docker_client, now=None):
+    """Collect the metrics of all vantage6 containers and configurations.
+
+    Returns
+    -------
+    list of Metric
+    """
+    now = now or time.time()
+
+    up = Metric("container_up", "gauge",
+                "Whether the container is running (1) or not (0).")
+    started = Metric("container_start_time_seconds", "gauge",
+                     "Start time of the container since unix epoch.")
+    uptime = Metric("container_uptime_seconds", "gauge",
+                    "Seconds since the container was started.")
+    restarts = Metric("container_restarts_total", "counter",
+                      "Number of times Docker restarted the (running) "
+                      "container.")
+    cpu = Metric("container_cpu_seconds_total", "counter",
+                 "CPU time consumed by the container.")
+    memory = Metric("container_memory_bytes", "gauge",
+                    "Memory used by the container.")
+    pulled = Metric("image_last_pull_timestamp_seconds", "gauge",
+                    "Time the image was last pulled or tagged.")
+    databases = Metric("configured_databases", "gauge",
+                       "Number of databases in the node configuration.")
+    configured = Metric("configured_instances", "gauge",
+                        "Number of node and server configurations.")
+
+    # all containers that carry the vantage6 type label, in a single query
+    containers = docker_client.api.containers(
+        all=True, filters={"label": f"{APPNAME}-type"})
+
+    images = {}
+    for summary in containers:
+        state = summary.get("State")
+        attrs = None
+        if state in ("running", "restarting"):
+            try:
+                attrs = docker_client.api.inspect_container(summary["Id"])
+            except docker.errors.NotFound:
+                # removed (e.g. automatically) since it was listed
+                continue
+
+        container_labels = summary.get("Labels") or {}
+        names = summary.get("Names") or [summary["Id"][:12]]
+        labels = {
+            "container": names[0].lstrip("/"),
+            "type": container_labels.get(f"{APPNAME}-type", ""),
+            "instance": container_labels.get("name", ""),
+        }
+        running = state == "running"
+        up.add(running, **labels)
+        if attrs is not None:
+            restarts.add(attrs.get("RestartCount", 0), **labels)
+
+        if running:
+            start = parse_docker_time(attrs["State"]["StartedAt"])
+            started.add(start, **labels)
+            uptime.add(round(now - start, 3), **labels)
+
+            cpu_seconds, memory_bytes = read_cgroup_usage(summary["Id"])
+            if cpu_seconds is not None:
+                cpu.add(cpu_seconds, **labels)
+                memory.add(memory_bytes, **labels)
+
+        images.setdefault(summary.get("ImageID"), summary.get("Image"))
+
+    for image_id, image_name in images.items():
+        if not image_id:
+            continue
+        try:
+            attrs = docker_client.api.inspect_image(image_id)
+        except Exception:
+            continue
+        last_tag = attrs.get("Metadata", {}).get("LastTagTime")
+        if last_tag and not last_tag.startswith("0001"):
+            pulled.add(parse_docker_time(last_tag), image=image_name)
+
+    for type_, context in (("node", NodeContext), ("server", ServerContext)):
+        for system_folders in (True, False):
+            scope = "system" if system_folders else "user"
+            configs, _ = context.available_configurations(system_folders)
+            configured.add(len(configs), type=type_, scope=scope)
+            if type_ != "node":
+                continue
+            for config in configs:
+                for env in config.available_environments:
+                    count = len(config.get(env).get("databases") or {})
+                    databases.add(count, instance=config.name,
+                                  environment=env, scope=scope)
+
+    return [up, started, uptime, restarts, cpu, memory, pulled, databases,
+            configured]
+
+
+def render(metrics):
+    """Return the metrics in the Prometheus text exposition format."""
+    return "\n".join(m.render() for m in metrics if m.samples) + "\n"
+
+
+def write_textfile(path, content):
+    """Atomically replace the file at `path` with `content`.
+
+    The collector must never see a partially written file, so the content
+    is written to a temporary file in the same folder first.
+    """
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w") as fp:
+        fp.write(content)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(tmp, path)
@@ -13,9 +13,12 @@
     * node attach
 """
 import click
+import json
+import logging
 import sys
 import questionary as q
 import docker
+import requests
 import time
 import os.path
 
@@ -28,26 +31,140 @@ from vantage6.common import (
     bytes_to_base64s, check_config_write_permissions
 )
 from vantage6.common.globals import (STRING_ENCODING, APPNAME)
-from vantage6.common.docker_addons import pull_if_newer
 from vantage6.client import Client
-from vantage6.client.encryption import RSACryptor
+from vantage6.client.encryption import DummyCryptor, RSACryptor
 
 
 from vantage6.cli.context import NodeContext
 from vantage6.cli.globals import (
     DEFAULT_NODE_ENVIRONMENT as N_ENV,
-    DEFAULT_NODE_SYSTEM_FOLDERS as N_FOL
+    DEFAULT_NODE_SYSTEM_FOLDERS as N_FOL,
+    DEFAULT_NODE_IMAGE,
+    LOCAL_NETWORK_NAME,
+    SPEC_HASH_LABEL
 )
+from vantage6.cli.configuration_manager import NodeConfigurationManager
+from vantage6.cli.docker_addons import (
+    get_or_create_network,
+    find_local_server,
+    container_spec_hash
+)
+from vantage6.cli.readiness import (
+    ContainerExited,
+    wait_until,
+    node_is_ready,
+    node_healthcheck
+)
+from vantage6.cli.timing import click_timings
+from vantage6.cli.profiling import PROFILERS, start_profiling
+from vantage6.cli.metrics import collect, render, write_textfile
+from vantage6.cli.docker_session import DockerNotRunning, DockerSession
+from vantage6.cli.dataprofile import (
+    ProfileCache,
+    ProfileError,
+    profile_database,
+    report as profile_report
+)
+from vantage6.cli.gc import (
+    DEFAULT_PATTERN,
+    scan,
+    select,
+    remove,
+    report as gc_report
+)
+from vantage6.cli.image_pin import (
+    PinError,
+    is_available,
+    pin_image,
+    pinned_image
+)
+from vantage6.cli.resources import parse_size, resources_environment
+from vantage6.cli.preload import (
+    MOUNT_PATH as PRELOAD_PATH,
+    preload_environment,
+    preload_settings,
+    start_sidecar
+)
+from vantage6.cli.shard import (
+    ShardError,
+    read_manifest,
+    register,
+    shard
+)
+from vantage6.cli.staging import (
+    StagingError,
+    stage_databases,
+    staging_cache,
+    staging_settings
+)
+from vantage6.cli.tune import (
+    concurrency_environment,
+    measure,
+    recommend
+)
+from vantage6.cli.pull import (
+    DEFAULT_STALL_TIMEOUT,
+    missing_images,
+    pull_images,
+    use_local_image
+)
+from vantage6.cli.image_bundle import (
+    BundleError,
+    ImageIndex,
+    image_index_path,
+    save_bundle,
+    load_bundle,
+    deduplication
+)
+from vantage6.cli.supervisor import Daemon, ForwardingGroup, SUBCOMMAND_ARGS
+from vantage6.cli.daemon_client import (
+    daemon_socket_path,
+    forward,
+    forwardable
+)
+from vantage6.cli.benchmark import (
+    DEFAULT_PAYLOAD_SIZES,
+    http_latencies,
+    container_http_latencies,
+    crypto_latencies,
+    latency_summary,
+    format_bytes,
+    format_crypto_table,
+    format_summary_table
+)
+from vantage6.cli.completion import add_completion
 from vantage6.cli.configuration_wizard import (
     configuration_wizard,
     select_configuration_questionaire
 )
 
 
-@click.group(name="node")
-def cli_node():
+@click.group(name="node", cls=ForwardingGroup)
+@click.option('--profile', type=click.Choice(PROFILERS), default=None,
+              help="run the command under a deterministic (cprofile) or "
+                   "sampling profiler, results are written to the log "
+                   "folder")
+@click.option('--no-daemon', is_flag=True, default=False,
+              help="run the command in this process, even when the vnode "
+                   "daemon is running")
+@click.pass_context
+def cli_node(click_ctx, profile, no_daemon):
     """Subcommand `vnode`."""
-    pass
+    if profile:
+        start_profiling(click_ctx, profile, NodeContext, [
+            NodeContext.instance_folders("node", "", N_FOL)["log"],
+            NodeContext.instance_folders("node", "", not N_FOL)["log"]
+        ])
+        return
+
+    command = click_ctx.invoked_subcommand
+    args = click_ctx.meta.get(SUBCOMMAND_ARGS, [])
+    if not no_daemon and forwardable(command, args):
+        response = forward(command, args)
+        if response is not None:
+            exit_code, output = response
+            click.echo(output, nl=False)
+            click_ctx.exit(exit_code)
 
 #
 #   list
@@ -56,11 +173,8 @@ def cli_node():
 def cli_node_list():
     """Lists all nodes in the default configuration directory."""
 
-    client = docker.from_env()
-    check_if_docker_deamon_is_running(client)
-
-    running_nodes = client.containers.list(
-        filters={"label": f"{APPNAME}-type=node"})
+    session = DockerSession()
+    running_nodes = session.containers("node")
 
     running_node_names = []
     for node in running_nodes:
@@ -207,19 +321,44 @@ help_ = {
     'config': 'absolute path to configuration-file; overrides NAME',
     'environment': 'configuration environment to use',
 }
+def node_start_options(func):
+    """Add the options of `vnode start` (and `vnode restart`) to `func`."""
+    options = [
+        click.option("-n", "--name", default=None, help="configuration name"),
+        click.option("-c", "--config", default=None, help=help_['config']),
+        click.option('-e', '--environment', default=N_ENV,
+                     help=help_['environment']),
+        click.option('--system', 'system_folders', flag_value=True),
+        click.option('--user', 'system_folders', flag_value=False,
+                     default=N_FOL),
+        click.option('-i', '--image', default=None,
+                     help="Node Docker image to use"),
+        click.option('--keep/--auto-remove', default=False,
+                     help="Keep image after finishing"),
+        click.option('--mount-src', default='',
+                     help="mount vantage6-master package source"),
+        click.option('--wait', is_flag=True, default=False,
+                     help="wait until the node is connected to the server"),
+        click.option('--wait-timeout', default=120,
+                     type=click.IntRange(min=1),
+                     help="seconds to wait for the node (with --wait)"),
+        click.option('--stall-timeout', default=DEFAULT_STALL_TIMEOUT,
+                     type=click.IntRange(min=1),
+                     help="seconds without progress after which pulling the "
+                          "image is aborted"),
+        click.option('--preload/--no-preload', default=None,
+                     help="preload the databases into shared memory, "
+                          "overrides `preload.enabled` of the configuration"),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
 @cli_node.command(name='start')
-@click.option("-n", "--name", default=None, help="configuration name")
-@click.option("-c", "--config", default=None, help=help_['config'])
-@click.option('-e', '--environment', default=N_ENV, help=help_['environment'])
-@click.option('--system', 'system_folders', flag_value=True)
-@click.option('--user', 'system_folders', flag_value=False, default=N_FOL)
-@click.option('-i', '--image', default=None, help="Node Docker image to use")
-@click.option('--keep/--auto-remove', default=False,
-              help="Keep image after finishing")
-@click.option('--mount-src', default='',
-              help="mount vantage6-master package source")
-def cli_node_start(name, config, environment, system_folders, image, keep,
-                   mount_src):
+@node_start_options
+@click_timings
+def cli_node_start(**kwargs):
     """Start the node instance.
 
         If no name or config is specified the default.yaml configuation is
@@ -228,11 +367,35 @@ def cli_node_start(name, config, environment, system_folders, image, keep,
         specify specific environments for the configuration (e.g. test,
         prod, acc).
     """
+    start_node(**kwargs)
+
+
+#
+#   restart
+#
+@cli_node.command(name='restart')
+@node_start_options
+@click_timings
+def cli_node_restart(**kwargs):
+    """Restart the node, reusing its container when possible.
+
+        The existing container is restarted in place when it was created
+        from the same configuration, image and mounts. Otherwise it is
+        replaced by a new one. Unlike `vnode start`, the image is only
+        pulled when it is not available locally.
+    """
+    start_node(restart=True, **kwargs)
+
+
+def start_node(name, config, environment, system_folders, image, keep,
+               mount_src, wait, wait_timeout, stall_timeout, preload, timer,
+               restart=False):
+    """Start the node, or restart it when `restart` is set."""
     info("Starting node...")
-    info("Finding Docker deamon")
-    docker_client = docker.from_env()
-    check_if_docker_deamon_is_running(docker_client)
+    session = DockerSession()
+    docker_client = session.client
 
+    timer.phase("load configuration")
     NodeContext.LOGGING_ENABLED = False
     if config:
         name = Path(config).stem
@@ -261,50 +424,75 @@ def cli_node_start(name, config, environment, system_folders, image, keep,
         ctx = NodeContext(name, environment, system_folders)
 
     # check that this node is not already running
-    running_nodes = docker_client.containers.list(
-        filters={"label": f"{APPNAME}-type=node"}
-    )
+    timer.phase("check running nodes")
+    running_nodes = session.containers("node")
 
     suffix = "system" if system_folders else "user"
     for node in running_nodes:
-        if node.name == f"{APPNAME}-{name}-{suffix}":
+        if node.name == f"{APPNAME}-{name}-{suffix}" and not restart:
             error(f"Node {Fore.RED}{name}{Style.RESET_ALL} is already running")
             exit(1)
 
     # make sure the (host)-task and -log dir exists
     info("Checking that data and log dirs exist")
+    timer.phase("create directories")
     ctx.data_dir.mkdir(parents=True, exist_ok=True)
     ctx.log_dir.mkdir(parents=True, exist_ok=True)
 
+    pinned = None
     if image is None:
-        image = ctx.config.get(
-            "image",
-            "harbor.vantage6.ai/infrastructure/node:latest"
-        )
-
-    info(f"Pulling latest node image '{image}'")
-    try:
-        # docker_client.images.pull(image)
-        pull_if_newer(image)
-
-    except Exception:
-        warning(' ... alas, no dice!')
+        pinned = pinned_image(ctx.config, DEFAULT_NODE_IMAGE)
+        image = pinned or ctx.config.get("image", DEFAULT_NODE_IMAGE)
+
+    timer.phase("pull image")
+    image_index = ImageIndex(image_index_path(system_folders))
+    if pinned and is_available(docker_client, pinned):
+        info(f"Using pinned node image '{pinned}'")
+    elif restart and is_available(docker_client, image):
+        info(f"Using local node image '{image}'")
+    elif image_index.is_loaded(docker_client, image):
+        info(f"Using node image '{image}' from an offline bundle")
+        image = image_index.local_reference(image)
     else:
-        info(" ... success!")
-
-    info("Creating Docker data volume")
-    data_volume = docker_client.volumes.create(
-        f"{ctx.docker_container_name}-vol")
+        info(f"Pulling latest node image '{image}'")
+        failed = pull_images(docker_client, [image], stall_timeout)
+        if image in failed:
+            use_local_image(docker_client, image, failed[image])
+
+    data_volume_name = f"{ctx.docker_container_name}-vol"
+
+    # A server that runs on this machine is reached directly through the
+    # shared network by its container name, rather than through the port it
+    # publishes on the host.
+    timer.phase("server discovery")
+    config_dir = ctx.config_dir
+    server_port = ctx.config.get("port")
+    local_server = find_local_server(docker_client,
+                                     ctx.config.get("server_url", ""),
+                                     server_port)
+    if local_server:
+        server, server_port = local_server
+        info(f"Using local server container '{server.name}'")
+        config_dir = local_server_config_dir(ctx, environment,
+                                             f"http://{server.name}",
+                                             server_port)
+
+    databases = ctx.databases
+    staging = staging_settings(ctx.config)
+    if staging:
+        timer.phase("stage databases")
+        databases = stage_node_databases(ctx, staging)
 
     info("Creating file & folder mounts")
+    timer.phase("assemble mounts")
     # FIXME: should only mount /mnt/database.csv if it is a file!
     # FIXME: should obtain mount points from DockerNodeContext
     mounts = [
         # (target, source)
-        ("/mnt/database.csv", str(ctx.databases["default"])),
+        ("/mnt/database.csv", str(databases["default"])),
         ("/mnt/log", str(ctx.log_dir)),
-        ("/mnt/data", data_volume.name),
-        ("/mnt/config", str(ctx.config_dir)),
+        ("/mnt/data", data_volume_name),
+        ("/mnt/config", str(config_dir)),
         ("/var/run/docker.sock", "/var/run/docker.sock"),
     ]
 
@@ -313,20 +501,7 @@ def cli_node_start(name, config, environment, system_folders, image, keep,
         mount_src = os.path.abspath(mount_src)
         mounts.append(('/vantage6', mount_src))
 
-    # FIXME: Code duplication: Node.__init__() (vantage6/node/__init__.py)
-    #   uses a lot of the same logic. Suggest moving this to
-    #   ctx.get_private_key()
-    filename = ctx.config.get("encryption", {}).get("private_key")
-
-    # filename may be set to an empty string
-    if not filename:
-        filename = 'private_key.pem'
-
-    # Location may be overridden by the environment
-    filename = os.environ.get('PRIVATE_KEY', filename)
-
-    # If ctx.get_data_file() receives an absolute path, it is returned as-is
-    fullpath = Path(ctx.get_data_file(filename))
+    fullpath = private_key_path(ctx)
 
     if fullpath:
         if Path(fullpath).exists():
@@ -342,10 +517,22 @@ def cli_node_start(name, config, environment, system_folders, image, keep,
     # Be careful not to use 'environment' as it would override the function
     # argument ;-).
     env = {
-        "DATA_VOLUME_NAME": data_volume.name,
+        "DATA_VOLUME_NAME": data_volume_name,
         "DATABASE_URI": "/mnt/database.csv",
         "PRIVATE_KEY": "/mnt/private_key.pem"
     }
+    # limits for the algorithm containers, which the node creates
+    env.update(resources_environment(
+        ctx.config.get("algorithm_resources")))
+    env.update(concurrency_environment(ctx.config.get("concurrency")))
+
+    preload_ = preload_settings(ctx.config, preload)
+    if preload_:
+        timer.phase("start preload sidecar")
+        preload_volume = start_sidecar(docker_client, ctx, image, preload_,
+                                       databases)
+        volumes[preload_volume] = {"bind": PRELOAD_PATH, "mode": "ro"}
+        env.update(preload_environment(preload_volume))
 
     system_folders_option = "--system" if system_folders else "--user"
     cmd = f'vnode-local start -c /mnt/config/{name}.yaml -n {name} -e '\
@@ -356,24 +543,118 @@ def cli_node_start(name, config, environment, system_folders, image, keep,
     # debug(f"  with mounts: {volumes}")
     # debug(f"  with environment: {env}")
 
-    container = docker_client.containers.run(
-        image,
+    # the healthcheck needs to know to which port the node connects
+    healthcheck = None
+    if wait and server_port:
+        healthcheck = node_healthcheck(server_port)
+
+    spec = dict(
         command=cmd,
         volumes=volumes,
-        detach=True,
         labels={
             f"{APPNAME}-type": "node",
             "system": str(system_folders),
             "name": ctx.config_file_name
         },
         environment=env,
+        network=LOCAL_NETWORK_NAME,
         name=ctx.docker_container_name,
         auto_remove=not keep,
+        healthcheck=healthcheck,
         tty=True
     )
+    spec_hash = container_spec_hash(image, spec, [ctx.config_file])
+    spec["labels"][SPEC_HASH_LABEL] = spec_hash
+
+    timer.phase("run container")
+    started_at = time.monotonic()
+    container = None
+    if restart:
+        container = reuse_container(session, ctx.docker_container_name,
+                                    spec_hash, image)
+
+    if container is None:
+        info("Creating Docker data volume")
+        docker_client.volumes.create(data_volume_name)
+        info(f"Connecting to network '{LOCAL_NETWORK_NAME}'")
+        get_or_create_network(docker_client, LOCAL_NETWORK_NAME)
+        container = docker_client.containers.run(image, detach=True, **spec)
 
     info(f"Success! container id = {container}")
 
+    if wait:
+        info("Waiting for the node to connect to the server")
+        timer.phase("wait until ready")
+        try:
+            wait_until(lambda: node_is_ready(container), wait_timeout)
+        except ContainerExited as e:
+            error(f"The node stopped before it was ready! {e}")
+            exit(1)
+        except TimeoutError:
+            error(f"The node was not ready within {wait_timeout} seconds")
+            exit(1)
+        info(f"Node is ready after {time.monotonic() - started_at:.1f}s")
+
+
+def private_key_path(ctx):
+    """Return the path of the private key of the node in `ctx`."""
+    # FIXME: Code duplication: Node.__init__() (vantage6/node/__init__.py)
+    #   uses a lot of the same logic. Suggest moving this to
+    #   ctx.get_private_key()
+    filename = ctx.config.get("encryption", {}).get("private_key")
+
+    # filename may be set to an empty string
+    if not filename:
+        filename = 'private_key.pem'
+
+    # Location may be overridden by the environment
+    filename = os.environ.get('PRIVATE_KEY', filename)
+
+    # If ctx.get_data_file() receives an absolute path, it is returned as-is
+    return Path(ctx.get_data_file(filename))
+
+
+def reuse_container(session, name, spec_hash, image):
+    """Restart the container `name` in place if its spec is unchanged.
+
+    A container that was created from a different spec or image, or whose
+    image is no longer available, is removed.
+
+    Returns
+    -------
+    Container or None
+        the restarted container, or None when a new one needs to be created
+    """
+    try:
+        container = session.container(name)
+    except docker.errors.NotFound:
+        return None
+
+    try:
+        image_id = session.client.images.get(image).id
+    except docker.errors.ImageNotFound:
+        # removed or re-tagged since the container was created
+        image_id = None
+    attrs = container.attrs
+    if image_id and container.labels.get(SPEC_HASH_LABEL) == spec_hash and \
+            attrs.get("ImageID", attrs.get("Image")) == image_id:
+        info("Restarting the existing container")
+        if container.status == "running":
+            container.restart()
+        else:
+            container.start()
+        return container
+
+    info("The configuration, image or mounts have changed, re-creating the "
+         "container")
+    try:
+        container.remove(force=True)
+    except docker.errors.NotFound:
+        # removed automatically once it stopped
+        pass
+    session.forget(name)
+    return None
+
 
 #
 #   stop
@@ -383,14 +664,19 @@ def cli_node_start(name, config, environment, system_folders, image, keep,
 @click.option('--system', 'system_folders', flag_value=True)
 @click.option('--user', 'system_folders', flag_value=False, default=N_FOL)
 @click.option('--all', 'all_nodes', flag_value=True)
-def cli_node_stop(name, system_folders, all_nodes):
+@click_timings
+def cli_node_stop(name, system_folders, all_nodes, timer):
     """Stop a running container. """
 
-    client = docker.from_env()
-    check_if_docker_deamon_is_running(client)
+    session = DockerSession()
 
-    running_nodes = client.containers.list(
-        filters={"label": f"{APPNAME}-type=node"})
+    timer.phase("list running nodes")
+    # a single request for the nodes and their preload sidecars
+    running = session.containers()
+    running_nodes = [c for c in running
+                     if c.labels.get(f"{APPNAME}-type") == "node"]
+    sidecars = {c.labels.get("node"): c for c in running
+                if c.labels.get(f"{APPNAME}-type") == "preload"}
 
     if not running_nodes:
         warning("No nodes are currently running.")
@@ -398,11 +684,16 @@ def cli_node_stop(name, system_folders, all_nodes):
 
     running_node_names = [node.name for node in running_nodes]
 
+    timer.phase("stop containers")
     if all_nodes:
+        failed = session.kill_all(running_nodes + list(sidecars.values()))
         for name in running_node_names:
-            container = client.containers.get(name)
-            container.kill()
-            info(f"Stopped the {Fore.GREEN}{name}{Style.RESET_ALL} Node.")
+            if name in failed:
+                error(f"Failed to stop the {Fore.RED}{name}{Style.RESET_ALL}"
+                      " Node.")
+                debug(failed[name])
+            else:
+                info(f"Stopped the {Fore.GREEN}{name}{Style.RESET_ALL} Node.")
     else:
         if not name:
             name = q.select("Select the node you wish to stop:",
@@ -413,8 +704,10 @@ def cli_node_stop(name, system_folders, all_nodes):
             name = f"{APPNAME}-{name}-{post_fix}"
 
         if name in running_node_names:
-            container = client.containers.get(name)
+            container = session.container(name)
             container.kill()
+            if name in sidecars:
+                sidecars[name].kill()
             info(f"Stopped the {Fore.GREEN}{name}{Style.RESET_ALL} Node.")
         else:
             error(f"{Fore.RED}{name}{Style.RESET_ALL} is not running?")
@@ -430,11 +723,8 @@ def cli_node_stop(name, system_folders, all_nodes):
 def cli_node_attach(name, system_folders):
     """Attach the logs from the docker container to the terminal."""
 
-    client = docker.from_env()
-    check_if_docker_deamon_is_running(client)
-
-    running_nodes = client.containers.list(
-        filters={"label": f"{APPNAME}-type=node"})
+    session = DockerSession()
+    running_nodes = session.containers("node")
     running_node_names = [node.name for node in running_nodes]
 
     if not name:
@@ -445,7 +735,7 @@ def cli_node_attach(name, system_folders):
         name = f"{APPNAME}-{name}-{post_fix}"
 
     if name in running_node_names:
-        container = client.containers.get(name)
+        container = session.container(name)
         logs = container.attach(stream=True, logs=True)
         Thread(target=print_log_worker, args=(logs,), daemon=True).start()
         while True:
@@ -576,13 +866,14 @@ def cli_node_create_private_key(name, environment, system_folders, upload,
 #   clean
 #
 @cli_node.command(name='clean')
-def cli_node_clean():
+@click_timings
+def cli_node_clean(timer):
     """ This command erases docker volumes"""
-    client = docker.from_env()
-    check_if_docker_deamon_is_running(client)
+    session = DockerSession()
 
     # retrieve all volumes
-    volumes = client.volumes.list()
+    timer.phase("list volumes")
+    volumes = session.client.volumes.list()
     canditates = []
     msg = "This would remove the following volumes: "
     for volume in volumes:
@@ -591,32 +882,769 @@ def cli_node_clean():
             msg += volume.name + ","
     info(msg)
 
+    timer.phase("confirm")
     confirm = q.confirm(f"Are you sure?")
     if confirm.ask():
-        for volume in canditates:
-            try:
-                volume.remove()
-                # info(volume.name)
-            except docker.errors.APIError as e:
-                error(f"Failed to remove volume {Fore.RED}'{volume.name}'"
-                      f"{Style.RESET_ALL}. Is it still in use?")
-                debug(e)
-                exit(1)
+        timer.phase("remove volumes")
+        failed = session.remove_volumes(canditates)
+        for name, e in failed.items():
+            error(f"Failed to remove volume {Fore.RED}'{name}'"
+                  f"{Style.RESET_ALL}. Is it still in use?")
+            debug(e)
+        if failed:
+            exit(1)
     info("Done!")
 
 
-def print_log_worker(logs_stream):
-    for log in logs_stream:
-        print(log.decode(STRING_ENCODING), end="")
+#
+#   gc
+#
+def task_data_folders(ctx, session):
+    """Return the folders in which the node stores the data of tasks.
 
+    The data volume of the node is looked up through the `DockerSession`
+    `session`.
+    """
+    folders = [Path(ctx.data_dir)]
+    task_dir = ctx.config.get("task_dir")
+    if task_dir and Path(task_dir) not in folders:
+        folders.append(Path(task_dir))
 
-def check_if_docker_deamon_is_running(docker_client):
+    # Docker is optional here, the host folders can be cleaned without it
     try:
-        docker_client.ping()
-    except Exception:
-        error("Docker socket can not be found. Make sure Docker is running.")
+        volume = session.client.volumes.get(
+            f"{ctx.docker_container_name}-vol")
+    except (DockerNotRunning, docker.errors.DockerException,
+            requests.RequestException):
+        return folders
+    mountpoint = Path(volume.attrs.get("Mountpoint", ""))
+    if os.access(mountpoint, os.R_OK | os.W_OK | os.X_OK):
+        folders.append(mountpoint)
+    else:
+        warning(f"Skipping volume {volume.name}, no access to {mountpoint}")
+    return folders
+
+
+@cli_node.command(name="gc")
+@click.option("-n", "--name", default=None, help="configuration name")
+@click.option('-e', '--environment', default=N_ENV,
+              help='configuration environment to use')
+@click.option('--system', 'system_folders', flag_value=True)
+@click.option('--user', 'system_folders', flag_value=False, default=N_FOL)
+@click.option("--max-age", default=None, type=click.FloatRange(min=0),
+              help="remove task folders older than this many days")
+@click.option("--max-count", default=None, type=click.IntRange(min=0),
+              help="keep at most this many task folders")
+@click.option("--max-size", default=None, type=click.FloatRange(min=0),
+              help="keep at most this many megabytes of task data")
+@click.option("--pattern", default=DEFAULT_PATTERN,
+              help="names of the task folders")
+@click.option("--dry-run", is_flag=True, default=False,
+              help="only report what would be removed")
+def cli_node_gc(name, environment, system_folders, max_age, max_count,
+                max_size, pattern, dry_run):
+    """Remove old task data of a node.
+
+    The retention policy is taken from `retention` in the configuration
+    (max_age, max_count and max_size), the options override it. The policy
+    applies to each task data folder of the node separately.
+    """
+    ctx = node_context(name, environment, system_folders)
+    policy = dict(ctx.config.get("retention", {}))
+    for key, value in (("max_age", max_age), ("max_count", max_count),
+                       ("max_size", max_size)):
+        if value is not None:
+            policy[key] = value
+    if not policy:
+        error("No retention policy, configure `retention` or use --max-age, "
+              "--max-count or --max-size")
+        exit(1)
+
+    failed = {}
+    for folder in task_data_folders(ctx, DockerSession()):
+        expired = select(scan(folder, pattern), **policy)
+        if not expired:
+            info(f"Nothing to remove in {folder}")
+            continue
+        action = "Would remove" if dry_run else "Removing"
+        info(f"{action} from {folder}:")
+        click.echo(gc_report(expired))
+        if not dry_run:
+            failed.update(remove(expired))
+
+    for path, e in failed.items():
+        error(f"Could not remove {path}: {e}")
+    if failed:
+        exit(1)
+
+
+#
+#   stage
+#
+def stage_node_databases(ctx, settings):
+    """Stage the databases of the node and return the paths to mount.
+
+    A database that cannot be staged is mounted from its source.
+    """
+    try:
+        staged = stage_databases(staging_cache(ctx, settings), ctx.databases)
+    except StagingError as e:
+        warning(f"Could not stage the databases: {e}")
+        return ctx.databases
+
+    for label, file_ in staged.items():
+        if file_.status == "skipped":
+            warning(f"Database '{label}' does not fit in the staging cache, "
+                    "using the source")
+        elif file_.status == "stale":
+            warning(f"Source of database '{label}' is unreachable, using "
+                    "the last staged copy")
+        else:
+            debug(f"Database '{label}' {file_.status} "
+                  f"({file_.changed_chunks} chunk(s) written)")
+    return {label: str(file_.path) for label, file_ in staged.items()}
+
+
+@cli_node.command(name="stage")
+@click.option("-n", "--name", default=None, help="configuration name")
+@click.option('-e', '--environment', default=N_ENV,
+              help='configuration environment to use')
+@click.option('--system', 'system_folders', flag_value=True)
+@click.option('--user', 'system_folders', flag_value=False, default=N_FOL)
+def cli_node_stage(name, environment, system_folders):
+    """Copy the databases of a node to the local staging cache.
+
+    Uses the `staging` section of the configuration. A copy is only
+    refreshed when its source changed, and then only the chunks that
+    differ are written. `vnode start` does the same when staging is
+    enabled. A running node uses the refreshed copies after it is
+    restarted.
+    """
+    ctx = node_context(name, environment, system_folders)
+    settings = staging_settings(ctx.config)
+    if not settings:
+        error("Staging is not enabled, set `staging.enabled` in the "
+              "configuration")
         exit(1)
 
+    try:
+        cache = staging_cache(ctx, settings)
+        staged = stage_databases(cache, ctx.databases)
+    except StagingError as e:
+        error(str(e))
+        exit(1)
+
+    for label, file_ in staged.items():
+        info(f"{label:15} {file_.status:10} {file_.path}")
+    if any(file_.status == "updated" for file_ in staged.values()):
+        info("A running node uses the updated copies after it is "
+             "restarted")
+    info(f"Staging cache {cache.folder} holds {cache.size / 1024 ** 2:.1f} "
+         "MB")
+
+
+#
+#   daemon
+#
+@cli_node.command(name="daemon")
+@click.option("--poll-interval", default=5, type=click.IntRange(min=1),
+              help="seconds between two checks of the supervised nodes")
+def cli_node_daemon(poll_interval):
+    """Run the vnode daemon in the foreground.
+
+    While the daemon is running, `vnode list`, `start`, `stop` and `status`
+    are executed by the daemon, which keeps the configurations and the
+    Docker connection loaded. Nodes started through the daemon are
+    restarted when they crash.
+    """
+    Daemon(cli_node, daemon_socket_path(), poll_interval).serve_forever()
+
+
+#
+#   status
+#
+@cli_node.command(name="status")
+def cli_node_status():
+    """Show the nodes that are supervised by the vnode daemon."""
+    # this only runs when the daemon could not be reached
+    warning("The vnode daemon is not running, no nodes are supervised.")
+    for container in DockerSession().containers("node", all=True):
+        click.echo(f"{container.name:40}{container.status}")
+
+
+#
+#   metrics
+#
+@cli_node.command(name="metrics")
+@click.option("--textfile", default=None,
+              type=click.Path(dir_okay=False, writable=True),
+              help="write the metrics to this file instead of stdout")
+@click.option("--interval", default=None, type=click.IntRange(min=1),
+              help="keep writing the metrics every INTERVAL seconds")
+def cli_node_metrics(textfile, interval):
+    """Export the state of the vantage6 containers as Prometheus metrics.
+
+    The output can be picked up by the textfile collector of the
+    Prometheus node_exporter. The file is replaced atomically, so it is
+    safe to run this command from cron.
+    """
+    client = DockerSession().client
+
+    while True:
+        content = render(collect(client))
+        if textfile:
+            write_textfile(textfile, content)
+        else:
+            click.echo(content, nl=False)
+
+        if not interval:
+            break
+        try:
+            time.sleep(interval)
+        except KeyboardInterrupt:
+            break
+
+
+#
+#   image
+#
+@cli_node.group(name="image")
+def cli_node_image():
+    """Move the node and algorithm images to hosts without a registry."""
+    pass
+
+
+@cli_node_image.command(name="save")
+@click.option("-n", "--name", default=None,
+              help="configuration name, to use the node and algorithm images "
+                   "it specifies")
+@click.option('-e', '--environment', default=N_ENV,
+              help='configuration environment to use')
+@click.option('--system', 'system_folders', flag_value=True)
+@click.option('--user', 'system_folders', flag_value=False, default=N_FOL)
+@click.option("-i", "--image", "images", multiple=True,
+              help="algorithm image to include, can be repeated")
+@click.option("-o", "--output", default=".",
+              type=click.Path(file_okay=False, writable=True),
+              help="folder to write the bundle to")
+def cli_node_image_save(name, environment, system_folders, images, output):
+    """Export the node image and algorithm images into a single bundle.
+
+    Layers that are shared between the images are stored only once. The
+    bundle is named after its sha256 digest and comes with a manifest.
+    """
+    node_image = DEFAULT_NODE_IMAGE
+    if name:
+        NodeContext.LOGGING_ENABLED = False
+        ctx = NodeContext(name, environment, system_folders)
+        node_image = pinned_image(ctx.config, DEFAULT_NODE_IMAGE) or \
+            ctx.config.get("image", DEFAULT_NODE_IMAGE)
+        images += tuple(ctx.config.get("algorithm_images", []))
+
+    client = DockerSession().client
+    images = list(dict.fromkeys((node_image,) + images))
+    missing = missing_images(client, images)
+    if missing:
+        info(f"Pulling {', '.join(missing)}")
+        for image, e in pull_images(client, missing).items():
+            error(f"Could not pull '{image}': {e}")
+            exit(1)
+
+    info(f"Exporting {len(images)} image(s)")
+    path, manifest = save_bundle(client, images, output)
+    info(f"Bundle written to {Fore.GREEN}{path}{Style.RESET_ALL} "
+         f"({manifest['size'] / 1e6:.0f} MB, "
+         f"{deduplication(manifest) / 1e6:.0f} MB saved by shared layers)")
+
+
+@cli_node_image.command(name="load")
+@click.argument("bundle", type=click.Path(exists=True, dir_okay=False))
+@click.option('--system', 'system_folders', flag_value=True)
+@click.option('--user', 'system_folders', flag_value=False, default=N_FOL)
+def cli_node_image_load(bundle, system_folders):
+    """Load a bundle into Docker.
+
+    `vnode start` uses the loaded node image instead of pulling it, as long
+    as it has not been replaced.
+    """
+    client = DockerSession().client
+    index = ImageIndex(image_index_path(system_folders))
+
+    info(f"Loading {bundle}")
+    try:
+        loaded = load_bundle(client, bundle, index)
+    except BundleError as e:
+        error(f"Could not load {Fore.RED}{bundle}{Style.RESET_ALL}: {e}")
+        exit(1)
+
+    for image in loaded:
+        info(f"Loaded {Fore.GREEN}{image}{Style.RESET_ALL}")
+
+
+def node_context(name, environment, system_folders):
+    """Return the context of an existing node configuration."""
+    name, environment = (name, environment) if name else \
+        select_configuration_questionaire("node", system_folders)
+
+    NodeContext.LOGGING_ENABLED = False
+    if not NodeContext.config_exists(name, environment, system_folders):
+        error(
+            f"The configuration {Fore.RED}{name}{Style.RESET_ALL} with "
+            f"environment {Fore.RED}{environment}{Style.RESET_ALL} could "
+            f"not be found."
+        )
+        exit(1)
+    return NodeContext(name, environment, system_folders)
+
+
+@cli_node_image.command(name="pin")
+@click.option("-n", "--name", default=None, help="configuration name")
+@click.option('-e', '--environment', default=N_ENV,
+              help='configuration environment to use')
+@click.option('--system', 'system_folders', flag_value=True)
+@click.option('--user', 'system_folders', flag_value=False, default=N_FOL)
+@click.option("-i", "--image", default=None,
+              help="image to pin, replaces the configured image")
+def cli_node_image_pin(name, environment, system_folders, image):
+    """Pin the node image to a digest.
+
+    The digest of the local image is used when it is available, otherwise
+    the tag is resolved in the registry. `vnode start` uses the pinned
+    image until it is moved with `vnode image upgrade`.
+    """
+    ctx = node_context(name, environment, system_folders)
+    try:
+        _, digest = pin_image(DockerSession().client, ctx, DEFAULT_NODE_IMAGE,
+                              image)
+    except PinError as e:
+        error(str(e))
+        exit(1)
+    info(f"Pinned the node image of {Fore.GREEN}{ctx.name}{Style.RESET_ALL} "
+         f"to {digest}")
+
+
+@cli_node_image.command(name="upgrade")
+@click.option("-n", "--name", default=None, help="configuration name")
+@click.option('-e', '--environment', default=N_ENV,
+              help='configuration environment to use')
+@click.option('--system', 'system_folders', flag_value=True)
+@click.option('--user', 'system_folders', flag_value=False, default=N_FOL)
+def cli_node_image_upgrade(name, environment, system_folders):
+    """Move the pinned node image to the digest its tag now refers to."""
+    ctx = node_context(name, environment, system_folders)
+    try:
+        previous, digest = pin_image(DockerSession().client, ctx,
+                                     DEFAULT_NODE_IMAGE, upgrade=True)
+    except PinError as e:
+        error(str(e))
+        exit(1)
+    if previous == digest:
+        info(f"The node image is up to date ({digest})")
+    else:
+        info(f"Upgraded the node image from {previous} to {digest}")
+        info("Restart the node to use it")
+
+
+#
+#   prefetch
+#
+@cli_node.command(name="prefetch")
+@click.option("-n", "--name", default=None, help="configuration name")
+@click.option('-e', '--environment', default=N_ENV,
+              help='configuration environment to use')
+@click.option('--system', 'system_folders', flag_value=True)
+@click.option('--user', 'system_folders', flag_value=False, default=N_FOL)
+@click.option("-i", "--image", "images", multiple=True,
+              help="algorithm image to pull in addition to the configured "
+                   "algorithm_images, can be repeated")
+@click.option("--interval", default=None, type=click.IntRange(min=1),
+              help="keep refreshing the images every INTERVAL seconds")
+@click.option('--stall-timeout', default=DEFAULT_STALL_TIMEOUT,
+              type=click.IntRange(min=1),
+              help="seconds without progress after which a pull is aborted")
+def cli_node_prefetch(name, environment, system_folders, images, interval,
+                      stall_timeout):
+    """Pull algorithm images before a task needs them.
+
+    The node runs algorithms through the Docker daemon of this machine, so
+    images pulled here are used by the node directly. With `--interval`
+    the images are refreshed periodically, so new versions of a tag are
+    pulled before the first task that uses them arrives.
+    """
+    images = list(images)
+    if name or not images:
+        ctx = node_context(name, environment, system_folders)
+        images += [image for image in ctx.config.get("algorithm_images", [])
+                   if image not in images]
+    if not images:
+        warning("No algorithm images to prefetch, add them to "
+                "algorithm_images in the configuration or use --image")
+        return
+
+    client = DockerSession().client
+    while True:
+        # images that are pinned to a digest do not change once pulled
+        pending = [image for image in images if "@" not in image]
+        pending += missing_images(client,
+                                  [image for image in images if "@" in image])
+        info(f"Prefetching {len(pending)} algorithm image(s)")
+        failed = pull_images(client, pending, stall_timeout)
+        for image, e in failed.items():
+            warning(f"Could not pull '{image}': {e}")
+
+        if not interval:
+            if failed:
+                exit(1)
+            break
+        try:
+            time.sleep(interval)
+        except KeyboardInterrupt:
+            break
+
+
+#
+#   tune
+#
+@cli_node.command(name="tune")
+@click.option("-n", "--name", default=None, help="configuration name")
+@click.option('-e', '--environment', default=N_ENV,
+              help='configuration environment to use')
+@click.option('--system', 'system_folders', flag_value=True)
+@click.option('--user', 'system_folders', flag_value=False, default=N_FOL)
+@click.option("--no-docker", is_flag=True, default=False,
+              help="do not measure the overhead of starting a container")
+@click.option("--dry-run", is_flag=True, default=False,
+              help="only print the recommended profile")
+def cli_node_tune(name, environment, system_folders, no_docker, dry_run):
+    """Measure this host and recommend the concurrency of the node.
+
+    The cores, memory, disk throughput of the data folder and the time to
+    start a container determine how many algorithms the node runs at once
+    and how many tasks it queues. The profile is written to `concurrency`
+    in the configuration and passed to the node when it starts.
+    """
+    ctx = node_context(name, environment, system_folders)
+    ctx.data_dir.mkdir(parents=True, exist_ok=True)
+
+    docker_client = image = None
+    if not no_docker:
+        docker_client = DockerSession().client
+        image = pinned_image(ctx.config, DEFAULT_NODE_IMAGE) or \
+            ctx.config.get("image", DEFAULT_NODE_IMAGE)
+        if not is_available(docker_client, image):
+            warning(f"Image '{image}' is not available locally, skipping "
+                    "the container overhead")
+            docker_client = None
+
+    info("Measuring the host, this takes a few seconds")
+    measured = measure(ctx.data_dir, docker_client, image)
+    profile, limited_by = recommend(
+        measured["cores"], measured["memory"], measured["disk_read"],
+        measured.get("container_start"),
+        ctx.config.get("algorithm_resources")
+    )
+
+    info(f"cores              = {measured['cores']}")
+    info(f"memory             = {measured['memory'] / 1024 ** 3:.1f} GB")
+    info(f"disk write / read  = {measured['disk_write']:.0f} / "
+         f"{measured['disk_read']:.0f} MB/s")
+    if "container_start" in measured:
+        info(f"container start    = {measured['container_start']:.2f}s")
+    info(f"Recommended: {Fore.GREEN}{profile['max_tasks']}{Style.RESET_ALL} "
+         f"concurrent task(s), limited by {limited_by}, and a queue of "
+         f"{profile['queue_size']}")
+
+    if dry_run:
+        return
+    profile["measured"] = measured
+    ctx.config["concurrency"] = profile
+    ctx.config_manager.put(ctx.environment, ctx.config)
+    ctx.config_manager.save(ctx.config_file)
+    info("Profile written to the configuration, restart the node to use it")
+
+
+#
+#   data
+#
+@cli_node.group(name="data")
+def cli_node_data():
+    """Inspect and prepare the databases of a node."""
+    pass
+
+
+@cli_node_data.command(name="profile")
+@click.option("-n", "--name", default=None, help="configuration name")
+@click.option('-e', '--environment', default=N_ENV,
+              help='configuration environment to use')
+@click.option('--system', 'system_folders', flag_value=True)
+@click.option('--user', 'system_folders', flag_value=False, default=N_FOL)
+@click.option("-d", "--database", "labels", multiple=True,
+              help="label of the database to profile, all by default")
+@click.option("--workers", default=None, type=click.IntRange(min=1),
+              help="processes per database, one per core by default")
+@click.option("--force", is_flag=True, default=False,
+              help="profile databases that did not change as well")
+@click.option("--json", "as_json", is_flag=True, default=False,
+              help="print the profiles as JSON")
+def cli_node_data_profile(name, environment, system_folders, labels, workers,
+                          force, as_json):
+    """Summarize the databases of a node.
+
+    Prints the number of rows and, per column, the type, missing values,
+    distinct values and the range. Summaries are cached in the data folder
+    of the node and reused until the database changes.
+    """
+    ctx = node_context(name, environment, system_folders)
+    databases = ctx.databases
+    unknown = set(labels) - set(databases)
+    if unknown:
+        error(f"Unknown database(s): {', '.join(sorted(unknown))}")
+        exit(1)
+
+    cache = ProfileCache(Path(ctx.data_dir) / "profiles")
+    profiles = {}
+    failed = False
+    for label, path in databases.items():
+        if labels and label not in labels:
+            continue
+        if not Path(path).is_file():
+            warning(f"Skipping database '{label}', {path} is not a file")
+            continue
+        start = time.perf_counter()
+        try:
+            profile, cached = profile_database(path, cache, force, workers)
+        except (OSError, ProfileError) as e:
+            error(f"Could not profile database '{label}': {e}")
+            failed = True
+            continue
+        profiles[label] = profile
+        if as_json:
+            continue
+        if cached:
+            debug(f"Database '{label}' did not change, using its profile")
+        else:
+            debug(f"Profiled database '{label}' in "
+                  f"{time.perf_counter() - start:.1f}s")
+        click.echo(profile_report(label, path, profile))
+
+    if as_json:
+        click.echo(json.dumps(profiles, indent=2))
+    if failed:
+        exit(1)
+
+
+@cli_node_data.command(name="shard")
+@click.option("-n", "--name", default=None, help="configuration name")
+@click.option('-e', '--environment', default=N_ENV,
+              help='configuration environment to use')
+@click.option('--system', 'system_folders', flag_value=True)
+@click.option('--user', 'system_folders', flag_value=False, default=N_FOL)
+@click.option("-d", "--database", "label", default="default",
+              help="label of the database to split")
+@click.option("-p", "--partitions", required=True,
+              type=click.IntRange(min=2), help="number of partitions")
+@click.option("-k", "--key", default=None,
+              help="column to partition on, rows are dealt out in turn "
+                   "when omitted")
+@click.option("-o", "--output", default=None, type=click.Path(),
+              help="folder of the partitions, default: "
+                   "<data folder>/shards/<label>")
+@click.option("--no-register", is_flag=True, default=False,
+              help="do not add the partitions to the configuration")
+def cli_node_data_shard(name, environment, system_folders, label, partitions,
+                        key, output, no_register):
+    """Split a database of a node into partitions.
+
+    The partitions are registered as the databases `<label>-part<i>`, so
+    that an algorithm can process them in parallel. With --key, all rows
+    with the same value of the key column end up in the same partition.
+    """
+    ctx = node_context(name, environment, system_folders)
+    if label not in ctx.databases:
+        error(f"Database '{label}' does not exist")
+        exit(1)
+    source = ctx.databases[label]
+    output = Path(output or Path(ctx.data_dir) / "shards" / label).absolute()
+    previous = read_manifest(output)
+
+    info(f"Splitting database '{label}' into {partitions} partitions")
+    start = time.perf_counter()
+    try:
+        manifest = shard(source, output, label, partitions, key)
+    except (OSError, ShardError) as e:
+        error(f"Could not split database '{label}': {e}")
+        exit(1)
+    for file_ in manifest["files"]:
+        info(f"{file_['label']:20} {file_['rows']:>10} rows  "
+             f"{file_['path']}")
+    info(f"Done in {time.perf_counter() - start:.1f}s, manifest written to "
+         f"{output / 'manifest.json'}")
+
+    if no_register:
+        return
+    ctx.config["databases"] = register(ctx.databases, manifest, previous)
+    ctx.config_manager.put(ctx.environment, ctx.config)
+    ctx.config_manager.save(ctx.config_file)
+    info("Partitions registered as databases, restart the node to use them")
+
+
+#
+#   bench
+#
+@cli_node.group(name="bench")
+def cli_node_bench():
+    """Benchmarks for the node and the machine it runs on."""
+    pass
+
+
+@cli_node_bench.command(name="network")
+@click.option("-n", "--name", default=None, help="configuration name")
+@click.option('-e', '--environment', default=N_ENV,
+              help='configuration environment to use')
+@click.option('--system', 'system_folders', flag_value=True)
+@click.option('--user', 'system_folders', flag_value=False, default=N_FOL)
+@click.option('-r', '--requests', 'n', default=100,
+              type=click.IntRange(min=1), help="number of requests per path")
+def cli_node_bench_network(name, environment, system_folders, n):
+    """Compare the latency to a local server via the host and the network.
+
+    Both the node and the server need to be running on this machine. The
+    first measurement is done from the host through the port the server
+    publishes, the second from within the node container through the
+    shared Docker network.
+    """
+    name, environment = (name, environment) if name else \
+        select_configuration_questionaire("node", system_folders)
+
+    NodeContext.LOGGING_ENABLED = False
+    if not NodeContext.config_exists(name, environment, system_folders):
+        error(
+            f"The configuration {Fore.RED}{name}{Style.RESET_ALL} with "
+            f"environment {Fore.RED}{environment}{Style.RESET_ALL} could "
+            f"not be found."
+        )
+        exit(1)
+
+    ctx = NodeContext(name, environment, system_folders)
+
+    session = DockerSession()
+    client = session.client
+
+    running_nodes = session.containers("node")
+    node = [c for c in running_nodes if c.name == ctx.docker_container_name]
+    if not node:
+        error(f"Node {Fore.RED}{name}{Style.RESET_ALL} is not running")
+        exit(1)
+
+    local_server = find_local_server(client, ctx.config["server_url"],
+                                     ctx.config["port"])
+    if not local_server:
+        error(f"No server container found for {ctx.config['server_url']}:"
+              f"{ctx.config['port']}")
+        exit(1)
+    server, server_port = local_server
+
+    api_path = ctx.config.get("api_path", "")
+    host_url = f"http://127.0.0.1:{ctx.config['port']}{api_path}/version"
+    network_url = f"http://{server.name}:{server_port}{api_path}/version"
+
+    info(f"Measuring {n} requests to {host_url}")
+    host = latency_summary(http_latencies(host_url, n))
+
+    info(f"Measuring {n} requests to {network_url} from the node")
+    network = latency_summary(container_http_latencies(node[0], network_url,
+                                                       n))
+
+    click.echo(format_summary_table([
+        ("host port", host),
+        (LOCAL_NETWORK_NAME, network)
+    ]))
+
+
+def parse_payload_sizes(click_ctx, param, value):
+    try:
+        return [parse_size(size) for size in value] or DEFAULT_PAYLOAD_SIZES
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+@cli_node_bench.command(name="crypto")
+@click.option("-n", "--name", default=None, help="configuration name")
+@click.option('-e', '--environment', default=N_ENV,
+              help='configuration environment to use')
+@click.option('--system', 'system_folders', flag_value=True)
+@click.option('--user', 'system_folders', flag_value=False, default=N_FOL)
+@click.option("-s", "--size", "sizes", multiple=True,
+              callback=parse_payload_sizes,
+              help="payload size, e.g. 64k or 16m (repeatable), default: "
+                   "1k, 64k, 1m and 16m")
+@click.option('-r', '--repeat', 'n', default=10,
+              type=click.IntRange(min=1), help="round trips per size")
+def cli_node_bench_crypto(name, environment, system_folders, sizes, n):
+    """Measure what encrypting task input and results costs.
+
+    Random payloads are encrypted for, and decrypted with, the private key
+    of the node, like the node does when `encryption.enabled` is set.
+    Without encryption, payloads are only base64 encoded, which is
+    measured as the baseline. The overhead is the growth of the payload.
+    """
+    ctx = node_context(name, environment, system_folders)
+    key_file = private_key_path(ctx)
+    if not key_file.exists():
+        error(f"Private key {key_file} not found, create one with "
+              "`vnode create-private-key`")
+        exit(1)
+    if not ctx.config.get("encryption", {}).get("enabled"):
+        warning("Encryption is disabled for this node, measuring what "
+                "enabling it would cost")
+
+    cryptor = RSACryptor(key_file)
+    # decrypting logs the shared key, which does not belong in the output
+    cryptor.log.setLevel(logging.WARNING)
+    public_key = cryptor.public_key_str
+
+    rows = []
+    for size in sizes:
+        info(f"Measuring {n} round trips of {format_bytes(size)}")
+        for method, operations, cryptor_ in (
+                ("rsa+aes", ("encrypt", "decrypt"), cryptor),
+                ("base64", ("encode", "decode"), DummyCryptor())):
+            *samples, encoded = crypto_latencies(cryptor_, public_key, size,
+                                                 n)
+            for operation, times in zip(operations, samples):
+                rows.append((method, size, operation,
+                             latency_summary(times), encoded))
+
+    click.echo(format_crypto_table(rows))
+
+
+def local_server_config_dir(ctx, environment, server_url, port):
+    """Write a copy of the configuration that points to a local server.
+
+    The copy is stored in the data folder and mounted in the node container
+    instead of the original configuration folder.
+
+    Returns
+    -------
+    Path
+        folder that contains the modified configuration file
+    """
+    config = dict(ctx.config)
+    config["server_url"] = server_url
+    config["port"] = port
+
+    config_manager = NodeConfigurationManager.from_file(ctx.config_file)
+    config_manager.put(environment, config)
+
+    config_dir = ctx.data_dir / "docker-config"
+    config_manager.save(config_dir / f"{ctx.config_file.stem}.yaml")
+    return config_dir
+
+
+def print_log_worker(logs_stream):
+    for log in logs_stream:
+        print(log.decode(STRING_ENCODING), end="")
+
 
 def create_client_and_authenticate(ctx):
     """Create a client and authenticate."""
@@ -639,3 +1667,7 @@ def create_client_and_authenticate(ctx):
         exit(1)
 
     return client
+
+
+# after all commands have been defined
+add_completion(cli_node, "node")
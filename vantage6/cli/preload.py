@@ -0,0 +1,202 @@
+""" Preloading the databases of a node into shared memory
+
+    Every algorithm container reads and parses the database of the node
+    again. With preloading enabled, `vnode start` runs a sidecar container
+    next to the node that parses every (CSV) database once and stores it
+    in a tmpfs volume, one `.npy` file per column:
+
+        /mnt/preloaded/<database label>/meta.json
+        /mnt/preloaded/<database label>/<column>.npy
+
+    The node mounts the volume read-only and receives its name in the
+    `PRELOADED_DATA_VOLUME` environment variable, so that it can give its
+    algorithm containers access. These can memory-map the columns with
+    `numpy.load(path, mmap_mode="r")`, which does not copy or parse the
+    data. The sidecar reloads a database when its file changes.
+
+    The sidecar also keeps the tmpfs mounted: Docker unmounts (and empties)
+    a tmpfs volume once no container uses it.
+"""
+from schema import And, Use, Optional
+
+from vantage6.common import info
+from vantage6.common.globals import APPNAME
+from vantage6.cli.resources import SIZE, parse_size
+
+# where the preloaded data is mounted in the sidecar, node and algorithms
+MOUNT_PATH = "/mnt/preloaded"
+
+SOURCE_PATH = "/mnt/databases"
+
+DEFAULT_INTERVAL = 30
+
+VALIDATOR = {
+    Optional("enabled"): bool,
+    Optional("size"): SIZE,
+    Optional("interval"): And(Use(int), lambda n: n > 0),
+}
+
+# Runs with `python -c` in the sidecar, which uses the node image. It only
+# uses the standard library and writes the columns in the NumPy (.npy)
+# format: float64 for numeric columns, fixed width unicode otherwise.
+PRELOAD_SCRIPT = r"""
+import csv, json, math, os, shutil, struct, sys, time
+from array import array
+
+source, target, interval = sys.argv[1], sys.argv[2], float(sys.argv[3])
+
+
+def write_npy(path, descr, length, data):
+    header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" \
+        % (descr, length)
+    header += " " * (63 - (10 + len(header)) % 64) + "\n"
+    with open(path, "wb") as fp:
+        fp.write(b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)))
+        fp.write(header.encode("latin1"))
+        fp.write(data)
+
+
+def to_float(value):
+    return float(value) if value.strip() else math.nan
+
+
+def preload(label, path):
+    with open(path, newline="") as fp:
+        reader = csv.reader(fp)
+        names = next(reader)
+        columns = [[] for _ in names]
+        for row in reader:
+            for column, value in zip(columns, row):
+                column.append(value)
+
+    tmp = os.path.join(target, f".{label}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    meta = {"source": path, "rows": len(columns[0]) if columns else 0,
+            "columns": {}}
+    for i, (name, values) in enumerate(zip(names, columns)):
+        file_ = f"{i:04d}.npy"
+        try:
+            data = array("d", map(to_float, values)).tobytes()
+            descr = "<f8"
+        except ValueError:
+            width = max([len(v) for v in values] + [1])
+            data = b"".join(v.ljust(width, "\0").encode("utf-32-le")
+                            for v in values)
+            descr = f"<U{width}"
+        write_npy(os.path.join(tmp, file_), descr, len(values), data)
+        meta["columns"][name] = {"file": file_, "dtype": descr}
+    with open(os.path.join(tmp, "meta.json"), "w") as fp:
+        json.dump(meta, fp)
+
+    # swap in the new version, readers keep the files they have opened
+    final = os.path.join(target, label)
+    old = os.path.join(target, f".{label}.old")
+    if os.path.exists(final):
+        os.rename(final, old)
+    os.rename(tmp, final)
+    shutil.rmtree(old, ignore_errors=True)
+    return meta["rows"]
+
+
+loaded = {}
+while True:
+    for label in sorted(os.listdir(source)):
+        path = os.path.join(source, label)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        version = (stat.st_mtime, stat.st_size)
+        if loaded.get(label) == version:
+            continue
+        start = time.time()
+        try:
+            rows = preload(label, path)
+        except Exception as e:
+            print(f"Could not preload {label}: {e}", flush=True)
+        else:
+            print(f"Preloaded {label}: {rows} rows in "
+                  f"{time.time() - start:.1f}s", flush=True)
+        loaded[label] = version
+    time.sleep(interval)
+"""
+
+
+def preload_settings(config, enabled=None):
+    """Return the preload settings of a node, or None when disabled.
+
+    Parameters
+    ----------
+    config : dict
+        the node configuration
+    enabled : bool, optional
+        overrides `preload.enabled` of the configuration
+    """
+    settings = dict(config.get("preload") or {})
+    if enabled is not None:
+        settings["enabled"] = enabled
+    if not settings.get("enabled"):
+        return None
+    return settings
+
+
+def sidecar_name(node_container_name):
+    return f"{node_container_name}-preload"
+
+
+def volume_name(node_container_name):
+    return f"{node_container_name}-preload-vol"
+
+
+def start_sidecar(docker_client, ctx, image, settings, databases=None):
+    """Start the preload sidecar of the node in `ctx`.
+
+    A sidecar that is already running is left alone. The sidecar reads
+    `databases` (label and path) when given, e.g. the staged copies, and
+    the databases of the node otherwise.
+
+    Returns
+    -------
+    str
+        name of the tmpfs volume with the preloaded data
+    """
+    node_name = ctx.docker_container_name
+    volume = volume_name(node_name)
+    for container in docker_client.containers.list(
+            filters={"name": sidecar_name(node_name)}):
+        if container.name == sidecar_name(node_name):
+            return volume
+
+    options = {"type": "tmpfs", "device": "tmpfs"}
+    if settings.get("size"):
+        options["o"] = f"size={parse_size(settings['size'])}"
+    docker_client.volumes.create(volume, driver="local", driver_opts=options)
+
+    volumes = {volume: {"bind": MOUNT_PATH, "mode": "rw"}}
+    for label, path in (databases or ctx.databases).items():
+        volumes[str(path)] = {"bind": f"{SOURCE_PATH}/{label}", "mode": "ro"}
+
+    info(f"Starting the preload sidecar '{sidecar_name(node_name)}'")
+    docker_client.containers.run(
+        image,
+        command=["python", "-c", PRELOAD_SCRIPT, SOURCE_PATH, MOUNT_PATH,
+                 str(settings.get("interval", DEFAULT_INTERVAL))],
+        volumes=volumes,
+        detach=True,
+        auto_remove=True,
+        labels={
+            f"{APPNAME}-type": "preload",
+            "node": node_name
+        },
+        name=sidecar_name(node_name)
+    )
+    return volume
+
+
+def preload_environment(volume):
+    """Return the environment variables that tell the node about `volume`."""
+    return {
+        "PRELOADED_DATA_VOLUME": volume,
+        "PRELOADED_DATA_PATH": MOUNT_PATH,
+    }
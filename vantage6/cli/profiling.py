@@ -0,0 +1,266 @@
+""" Profiling of `vnode` and `vserver` commands
+
+    With the `--profile` option of the `vnode` and `vserver` groups, any
+    subcommand runs under a profiler. Next to the profile itself, every
+    call made to the Docker API is recorded with its latency. The results
+    are written to the log folder of the instance.
+"""
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+
+from collections import Counter, defaultdict
+from pathlib import Path
+from urllib.parse import urlparse
+
+from docker.api.client import APIClient
+
+from vantage6.common import info, warning, Singleton
+
+PROFILERS = ("cprofile", "sample")
+
+# parts of a Docker API path that identify a single object
+_DOCKER_OBJECT = re.compile(
+    r"^/(containers|images|volumes|networks|exec)/(?!json$|create$|prune$)"
+    r"[^/]+"
+)
+_DOCKER_VERSION = re.compile(r"^/v\d+\.\d+")
+
+
+def docker_endpoint(method, url):
+    """Return the endpoint of a Docker API call, e.g. `GET /containers/{id}`.
+
+    The API version and the names or ids of objects are left out so that
+    calls to the same endpoint are counted together.
+    """
+    path = _DOCKER_VERSION.sub("", urlparse(url).path)
+    path = _DOCKER_OBJECT.sub(r"/\1/{id}", path)
+    return f"{method} {path}"
+
+
+class DockerCallRecorder:
+    """Records all requests that the Docker client sends to the daemon.
+
+    This applies to every `docker.DockerClient` in the process, including
+    the ones created before recording started.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+        self._original = None
+
+    def start(self):
+        self._original = APIClient.__dict__.get("send")
+        send = APIClient.send
+        recorder = self
+
+        def recorded_send(client, request, **kwargs):
+            start = time.perf_counter()
+            try:
+                return send(client, request, **kwargs)
+            finally:
+                recorder.record(request.method, request.url,
+                                time.perf_counter() - start)
+
+        APIClient.send = recorded_send
+        return self
+
+    def stop(self):
+        if self._original is None:
+            del APIClient.send
+        else:
+            APIClient.send = self._original
+
+    def record(self, method, url, duration):
+        with self._lock:
+            self.calls.append((docker_endpoint(method, url), duration))
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def __len__(self):
+        return len(self.calls)
+
+    def summary(self):
+        """Return a table with the number and latency of calls per endpoint.
+        """
+        durations = defaultdict(list)
+        for endpoint, duration in self.calls:
+            durations[endpoint].append(duration)
+
+        header = f"{'Docker API call':50}{'count':>7}{'total':>11}" \
+                 f"{'mean':>11}{'max':>11}"
+        lines = [header, "-" * len(header)]
+        for endpoint, values in sorted(durations.items(),
+                                       key=lambda item: -sum(item[1])):
+            lines.append(
+                f"{endpoint[:49]:50}{len(values):>7}"
+                f"{sum(values) * 1000:>9.1f}ms"
+                f"{sum(values) / len(values) * 1000:>9.1f}ms"
+                f"{max(values) * 1000:>9.1f}ms"
+            )
+        lines.append("-" * len(header))
+        total = sum(duration for _, duration in self.calls)
+        lines.append(f"{'total':50}{len(self.calls):>7}{total * 1000:>9.1f}ms")
+        return "\n".join(lines)
+
+
+class SamplingProfiler:
+    """Samples the stack of a thread at a fixed interval.
+
+    The result is written in the collapsed stack format that is used by
+    flame graph tools (flamegraph.pl, speedscope).
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, args=(target,),
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self, target):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} "
+                             f"({os.path.basename(code.co_filename)}:"
+                             f"{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, "w") as fp:
+            for stack, count in self.samples.most_common():
+                fp.write(f"{stack} {count}\n")
+
+    def summary(self, limit=30):
+        """Return the functions that were most often on top of the stack."""
+        total = sum(self.samples.values()) or 1
+        own = Counter()
+        for stack, count in self.samples.items():
+            own[stack.rsplit(";", 1)[-1]] += count
+        lines = [f"{'samples':>8}{'%':>8}  function"]
+        for function, count in own.most_common(limit):
+            lines.append(f"{count:>8}{100 * count / total:>7.1f}%  "
+                         f"{function}")
+        return "\n".join(lines)
+
+
+class ProfileSession:
+    """Profiles a command and records its Docker API calls."""
+
+    def __init__(self, kind):
+        assert kind in PROFILERS
+        self.kind = kind
+        self.profiler = cProfile.Profile() if kind == "cprofile" \
+            else SamplingProfiler()
+        self.recorder = DockerCallRecorder()
+
+    def start(self):
+        self.started = time.time()
+        self.recorder.start()
+        if self.kind == "cprofile":
+            self.profiler.enable()
+        else:
+            self.profiler.start()
+
+    def stop(self):
+        if self.kind == "cprofile":
+            self.profiler.disable()
+        else:
+            self.profiler.stop()
+        self.recorder.stop()
+
+    def write(self, folder, command):
+        """Write the results to `folder`.
+
+        Returns
+        -------
+        list of Path
+            the report and the raw profile
+        """
+        folder = Path(folder)
+        folder.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+        base = folder / f"profile-{command}-{stamp}"
+
+        if self.kind == "cprofile":
+            raw = base.with_suffix(".prof")
+            self.profiler.dump_stats(str(raw))
+            stream = io.StringIO()
+            stats = pstats.Stats(self.profiler, stream=stream)
+            stats.sort_stats("cumulative").print_stats(40)
+            profile = stream.getvalue()
+        else:
+            raw = base.with_suffix(".folded")
+            self.profiler.write(raw)
+            profile = self.profiler.summary()
+
+        report = base.with_suffix(".txt")
+        with open(report, "w") as fp:
+            fp.write(f"command: {command}\nprofiler: {self.kind}\n\n")
+            fp.write(self.recorder.summary())
+            fp.write("\n\n")
+            fp.write(profile)
+
+        return [report, raw]
+
+
+def start_profiling(click_ctx, kind, context_class, log_dirs):
+    """Profile the subcommand that `click_ctx` is about to invoke.
+
+    Parameters
+    ----------
+    click_ctx : click.Context
+        context of the `vnode` or `vserver` group
+    kind : str
+        one of `PROFILERS`
+    context_class : type
+        `NodeContext` or `ServerContext`. When the command loaded an instance
+        of this context, the results are written to its log folder.
+    log_dirs : list of Path
+        folders to try (in order) when no instance was loaded
+    """
+    session = ProfileSession(kind)
+
+    def finish():
+        session.stop()
+
+        instance = Singleton._instances.get(context_class)
+        folders = ([instance.log_dir] if instance else []) + list(log_dirs)
+        command = click_ctx.invoked_subcommand or "none"
+        for folder in folders:
+            try:
+                files = session.write(folder, command)
+            except OSError:
+                continue
+            info(f"Profile written to {files[0]} "
+                 f"({len(session.recorder)} Docker API calls)")
+            return
+        warning("Could not write the profile to any of: "
+                f"{', '.join(str(f) for f in folders)}")
+
+    click_ctx.call_on_close(finish)
+    session.start()
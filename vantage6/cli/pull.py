@@ -0,0 +1,248 @@
+""" Pulling images with progress reporting
+
+    `docker pull` reports the progress of every layer as a stream of JSON
+    events. A `PullProgress` aggregates these events into the progress of
+    the image as a whole (bytes downloaded, throughput and an estimate of
+    the remaining time), which `pull_images` prints while it pulls one or
+    more images concurrently.
+
+    A pull that does not report anything for `stall_timeout` seconds is
+    considered to be stalled and fails, rather than blocking the command
+    forever.
+"""
+import queue
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import docker
+
+from docker.utils import parse_repository_tag
+
+from vantage6.common import info, warning, error
+
+# seconds without any progress after which a pull is aborted
+DEFAULT_STALL_TIMEOUT = 120
+
+# statuses of a layer of which the download has finished
+DOWNLOADED = ("Download complete", "Verifying Checksum", "Extracting",
+              "Pull complete")
+
+_DONE = object()
+
+
+class PullError(Exception):
+    """The image could not be pulled."""
+
+
+class PullStalled(PullError):
+    """The pull did not make progress within the stall timeout."""
+
+
+class PullProgress:
+    """Aggregated progress of the layers of a single image."""
+
+    def __init__(self, image, clock=time.monotonic):
+        self.image = image
+        self.clock = clock
+        self.started = clock()
+        self.finished = None
+        # layer id -> [downloaded bytes, total bytes, status]
+        self.layers = {}
+        self.status = "Waiting"
+
+    def update(self, event):
+        if "error" in event:
+            raise PullError(event["error"])
+
+        status = event.get("status", "")
+        layer_id = event.get("id")
+        detail = event.get("progressDetail") or {}
+
+        if not layer_id or status.startswith("Pulling from"):
+            # messages about the image as a whole, like the digest
+            self.status = status
+            return
+
+        layer = self.layers.setdefault(layer_id, [0, 0, status])
+        layer[2] = status
+        if status == "Downloading":
+            layer[0] = detail.get("current", layer[0])
+            layer[1] = detail.get("total", layer[1])
+        elif status in DOWNLOADED:
+            layer[0] = layer[1]
+
+    def finish(self):
+        self.finished = self.clock()
+
+    @property
+    def downloaded(self):
+        return sum(layer[0] for layer in self.layers.values())
+
+    @property
+    def total(self):
+        """Bytes to download, as far as the sizes of the layers are known."""
+        return sum(layer[1] for layer in self.layers.values())
+
+    @property
+    def elapsed(self):
+        return (self.finished or self.clock()) - self.started
+
+    @property
+    def throughput(self):
+        """Bytes per second."""
+        return self.downloaded / self.elapsed if self.elapsed > 0 else 0
+
+    @property
+    def eta(self):
+        """Estimated seconds until all (known) layers are downloaded."""
+        if not self.throughput:
+            return None
+        return (self.total - self.downloaded) / self.throughput
+
+    def summary(self):
+        name = self.image.rsplit("/", 1)[-1]
+        if self.finished:
+            return f"{name}: done ({self.downloaded / 1e6:.0f} MB in " \
+                f"{self.elapsed:.0f}s)"
+        if not self.total:
+            return f"{name}: {self.status.lower()}"
+
+        done = sum(layer[2] in DOWNLOADED or layer[2] == "Already exists"
+                   for layer in self.layers.values())
+        eta = self.eta
+        return (f"{name}: {100 * self.downloaded / self.total:.0f}% "
+                f"{self.downloaded / 1e6:.0f}/{self.total / 1e6:.0f} MB, "
+                f"{done}/{len(self.layers)} layers, "
+                f"{self.throughput / 1e6:.1f} MB/s"
+                + (f", ETA {eta:.0f}s" if eta is not None else ""))
+
+
+def pull_events(docker_client, image, stall_timeout=DEFAULT_STALL_TIMEOUT):
+    """Generate the progress events of pulling `image`.
+
+    The stream is read in a separate thread, so that a stalled pull can be
+    detected.
+
+    Raises
+    ------
+    PullStalled
+        when no event arrives within `stall_timeout` seconds
+    """
+    repository, tag = parse_repository_tag(image)
+    events = queue.Queue()
+
+    def read():
+        try:
+            # without a tag, the API pulls every tag of the repository
+            for event in docker_client.api.pull(repository, tag or "latest",
+                                                stream=True, decode=True):
+                events.put(event)
+        except Exception as e:
+            events.put(e)
+        finally:
+            events.put(_DONE)
+
+    threading.Thread(target=read, daemon=True).start()
+
+    while True:
+        try:
+            event = events.get(timeout=stall_timeout)
+        except queue.Empty:
+            raise PullStalled(f"No progress in {stall_timeout} seconds")
+        if event is _DONE:
+            return
+        if isinstance(event, docker.errors.APIError):
+            raise PullError(event.explanation or str(event))
+        if isinstance(event, Exception):
+            raise PullError(str(event))
+        yield event
+
+
+def pull_image(docker_client, image, progress=None,
+               stall_timeout=DEFAULT_STALL_TIMEOUT):
+    """Pull `image`, recording its progress in `progress`."""
+    progress = progress or PullProgress(image)
+    for event in pull_events(docker_client, image, stall_timeout):
+        progress.update(event)
+    progress.finish()
+    return progress
+
+
+def pull_images(docker_client, images, stall_timeout=DEFAULT_STALL_TIMEOUT,
+                interval=None, out=None):
+    """Pull `images` concurrently while reporting their progress.
+
+    On a terminal the progress is updated in place every second, otherwise
+    a line is printed every ten seconds.
+
+    Returns
+    -------
+    dict
+        the exception for every image that could not be pulled
+    """
+    out = out or sys.stdout
+    tty = out.isatty()
+    if interval is None:
+        interval = 1 if tty else 10
+
+    progresses = {image: PullProgress(image) for image in images}
+    errors = {}
+    if not images:
+        return errors
+
+    with ThreadPoolExecutor(max_workers=len(images)) as executor:
+        futures = {
+            executor.submit(pull_image, docker_client, image, progress,
+                            stall_timeout): image
+            for image, progress in progresses.items()
+        }
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=interval)
+            for future in done:
+                if future.exception():
+                    errors[futures[future]] = future.exception()
+            line = " | ".join(p.summary() for p in progresses.values()
+                              if p.image not in errors)
+            if tty:
+                out.write(f"\r\033[K{line}")
+                out.flush()
+            elif pending and line:
+                info(line)
+
+    if tty:
+        out.write("\r\033[K")
+        out.flush()
+    for image, progress in progresses.items():
+        if image not in errors:
+            info(f"Pulled '{image}' ({progress.downloaded / 1e6:.0f} MB in "
+                 f"{progress.elapsed:.1f}s)")
+    return errors
+
+
+def missing_images(docker_client, images):
+    """Return the `images` that are not available locally."""
+    missing = []
+    for image in images:
+        try:
+            docker_client.images.get(image)
+        except docker.errors.ImageNotFound:
+            missing.append(image)
+    return missing
+
+
+def use_local_image(docker_client, image, exception):
+    """Report a failed pull of `image` and fall back to the local image.
+
+    Exits when the image is not available locally either.
+    """
+    warning(f"Could not pull '{image}': {exception}")
+    try:
+        docker_client.images.get(image)
+    except docker.errors.ImageNotFound:
+        error(f"Image '{image}' is not available locally either")
+        exit(1)
+    info(f"Continuing with the local image '{image}'")
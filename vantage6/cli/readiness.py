@@ -0,0 +1,141 @@
+""" Waiting for node and server containers to become ready
+
+    `docker run` returns as soon as the container is created, while the
+    application inside it needs more time to get up and running (or
+    crashes). These helpers poll the container until it is actually usable.
+"""
+import time
+import urllib.error
+import urllib.request
+
+import docker
+
+# the node logs this line once it has connected to the server and is
+# ready to receive tasks
+NODE_READY_LOG_LINE = "Init complete"
+
+# Docker healthcheck that passes while the node holds an established TCP
+# connection (state 01) to the server port (argv[1]).
+NODE_HEALTHCHECK_SCRIPT = """
+import sys
+port = ':%04X' % int(sys.argv[1])
+lines = []
+for table in ('/proc/net/tcp', '/proc/net/tcp6'):
+    try:
+        lines += open(table).readlines()[1:]
+    except OSError:
+        pass
+fields = [line.split() for line in lines]
+connected = [f for f in fields if f[2].endswith(port) and f[3] == '01']
+sys.exit(0 if connected else 1)
+"""
+
+SERVER_HEALTHCHECK_SCRIPT = (
+    "import sys, urllib.request; "
+    "urllib.request.urlopen(sys.argv[1], timeout=5)"
+)
+
+# Docker expects durations in nanoseconds
+SECOND = 1_000_000_000
+
+
+class ContainerExited(Exception):
+    """The container stopped while we were waiting for it."""
+
+
+def wait_until(check, timeout, initial_delay=0.1, max_delay=5.0):
+    """Call `check` with exponential backoff until it returns True.
+
+    Parameters
+    ----------
+    check : callable
+        returns True when the condition is met
+    timeout : float
+        maximum number of seconds to wait
+    initial_delay : float, optional
+        seconds to wait after the first failed check, doubled after every
+        next failed check
+    max_delay : float, optional
+        upper limit of the delay between two checks
+
+    Returns
+    -------
+    float
+        seconds it took until the check succeeded
+
+    Raises
+    ------
+    TimeoutError
+        when the check did not succeed within `timeout` seconds
+    """
+    start = time.monotonic()
+    delay = initial_delay
+    while True:
+        if check():
+            return time.monotonic() - start
+
+        remaining = timeout - (time.monotonic() - start)
+        if remaining <= 0:
+            raise TimeoutError(f"Not ready after {timeout} seconds")
+
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
+
+
+def assert_running(container):
+    """Raise `ContainerExited` if `container` is no longer running."""
+    try:
+        container.reload()
+    except docker.errors.NotFound:
+        # auto-removed containers disappear once they exit
+        raise ContainerExited(f"Container {container.name} is removed")
+
+    if container.status in ("exited", "dead"):
+        logs = container.logs(tail=20).decode(errors="replace")
+        raise ContainerExited(
+            f"Container {container.name} exited:\n{logs}"
+        )
+
+
+def server_is_ready(container, url):
+    """Return True when the server API at `url` responds."""
+    assert_running(container)
+    try:
+        urllib.request.urlopen(url, timeout=2).read()
+    except urllib.error.HTTPError:
+        # the server responds, albeit with an error
+        return True
+    except OSError:
+        # connection refused/reset and timeouts
+        return False
+    return True
+
+
+def node_is_ready(container):
+    """Return True when the node reports that it is connected."""
+    assert_running(container)
+    return NODE_READY_LOG_LINE.encode() in container.logs()
+
+
+def healthcheck(test, interval=10, timeout=5, retries=3, start_period=10):
+    """Return a Docker healthcheck definition (durations in seconds)."""
+    return {
+        "test": test,
+        "interval": interval * SECOND,
+        "timeout": timeout * SECOND,
+        "retries": retries,
+        "start_period": start_period * SECOND,
+    }
+
+
+def server_healthcheck(port, api_path):
+    """Healthcheck that calls the version endpoint of the server API."""
+    url = f"http://127.0.0.1:{port}{api_path}/version"
+    return healthcheck(["CMD", "python", "-c", SERVER_HEALTHCHECK_SCRIPT,
+                        url])
+
+
+def node_healthcheck(server_port):
+    """Healthcheck that checks the connection of the node to the server."""
+    return healthcheck(["CMD", "python", "-c", NODE_HEALTHCHECK_SCRIPT,
+                        str(server_port)])
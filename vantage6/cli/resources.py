@@ -0,0 +1,124 @@
+""" Resource limits for the algorithm containers of a node
+
+    The `algorithm_resources` section of the node configuration limits what
+    a single algorithm container can use:
+
+        algorithm_resources:
+          cpus: 2.5           # number of cores
+          memory: 8g          # memory limit
+          shm_size: 2g        # size of /dev/shm (Docker defaults to 64 MB)
+          tmpfs_size: 1g      # size of the in-memory scratch space /tmp
+          ulimits:
+            nofile: 65536     # or {soft: 1024, hard: 65536}
+
+    The node receives these limits in the `ALGORITHM_RESOURCES` environment
+    variable, as JSON in the terms of the Docker API (bytes, nano cpus).
+"""
+import json
+import os
+import re
+
+from schema import And, Or, Use, Optional
+
+from vantage6.cli.database import host_memory
+
+ENVIRONMENT_VARIABLE = "ALGORITHM_RESOURCES"
+
+# mount point of the tmpfs scratch space in the algorithm containers
+SCRATCH_PATH = "/tmp"
+
+UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024 ** 2, "g": 1024 ** 3,
+         "t": 1024 ** 4}
+
+SIZE_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)\s*([bkmgt]?)b?$", re.IGNORECASE)
+
+
+def parse_size(value):
+    """Return a size like `512m` or `2g` (or a number of bytes) in bytes."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    match = SIZE_PATTERN.match(str(value).strip())
+    if not match:
+        raise ValueError(f"Invalid size '{value}'")
+    number, unit = match.groups()
+    return int(float(number) * UNITS[unit.lower()])
+
+
+def format_size(size):
+    """Return `size` in bytes as a size string, e.g. `2g`."""
+    for unit in ("g", "m", "k"):
+        if size >= UNITS[unit] and size % UNITS[unit] == 0:
+            return f"{size // UNITS[unit]}{unit}"
+    return str(size)
+
+
+SIZE = And(Use(parse_size), lambda n: n > 0)
+
+ULIMIT = Or(And(Use(int), lambda n: n >= -1),
+            {"soft": Use(int), "hard": Use(int)})
+
+VALIDATOR = {
+    Optional("cpus"): And(Use(float), lambda n: n > 0),
+    Optional("memory"): SIZE,
+    Optional("shm_size"): SIZE,
+    Optional("tmpfs_size"): SIZE,
+    Optional("ulimits"): {str: ULIMIT},
+}
+
+
+def docker_resources(resources):
+    """Return the `algorithm_resources` in terms of the Docker API.
+
+    Returns
+    -------
+    dict
+        host config settings: nano_cpus, mem_limit, shm_size, tmpfs and
+        ulimits
+    """
+    settings = {}
+    if "cpus" in resources:
+        settings["nano_cpus"] = int(float(resources["cpus"]) * 1e9)
+    if "memory" in resources:
+        settings["mem_limit"] = parse_size(resources["memory"])
+    if "shm_size" in resources:
+        settings["shm_size"] = parse_size(resources["shm_size"])
+    if "tmpfs_size" in resources:
+        size = parse_size(resources["tmpfs_size"])
+        settings["tmpfs"] = {SCRATCH_PATH: f"size={size}"}
+    if resources.get("ulimits"):
+        settings["ulimits"] = []
+        for name, limit in resources["ulimits"].items():
+            if not isinstance(limit, dict):
+                limit = {"soft": limit, "hard": limit}
+            settings["ulimits"].append({"name": name,
+                                        "soft": int(limit["soft"]),
+                                        "hard": int(limit["hard"])})
+    return settings
+
+
+def resources_environment(resources):
+    """Return the environment variables that pass the limits to the node."""
+    if not resources:
+        return {}
+    return {ENVIRONMENT_VARIABLE: json.dumps(docker_resources(resources))}
+
+
+def host_defaults(cpu_count=None, memory=None):
+    """Return sensible `algorithm_resources` for this host.
+
+    One core and a quarter of the memory are left to the node itself and
+    the host. Shared memory and scratch space are a quarter of the memory
+    limit, which is enough for the temporary arrays of NumPy and pandas.
+    """
+    cpu_count = cpu_count or os.cpu_count() or 1
+    memory = memory or host_memory()
+    limit = memory * 3 // 4 // UNITS["m"] * UNITS["m"]
+    return {
+        "cpus": float(max(cpu_count - 1, 1)),
+        "memory": format_size(limit),
+        "shm_size": format_size(min(limit // 4, 2 * UNITS["g"])
+                                // UNITS["m"] * UNITS["m"]),
+        "tmpfs_size": format_size(min(limit // 4, 4 * UNITS["g"])
+                                  // UNITS["m"] * UNITS["m"]),
+        "ulimits": {"nofile": 65536},
+    }
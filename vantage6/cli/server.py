@@ -11,14 +11,50 @@ from traitlets.config import get_config
 from colorama import (Fore, Style)
 from sqlalchemy.engine.url import make_url
 
-from vantage6.common import (info, warning, error,
+from vantage6.common import (info, warning, error, debug,
                              check_config_write_permissions)
-from vantage6.common.docker_addons import pull_if_newer
 from vantage6.common.globals import APPNAME, STRING_ENCODING
 # from vantage6.cli import fixture
 from vantage6.cli.globals import (DEFAULT_SERVER_ENVIRONMENT,
-                                  DEFAULT_SERVER_SYSTEM_FOLDERS)
+                                  DEFAULT_SERVER_SYSTEM_FOLDERS,
+                                  DEFAULT_SERVER_WORKERS,
+                                  DEFAULT_SERVER_IMAGE,
+                                  DEFAULT_LOAD_BALANCER_IMAGE,
+                                  DEFAULT_POSTGRES_IMAGE,
+                                  GROUP_LABEL,
+                                  ROLE_LABEL,
+                                  LOCAL_NETWORK_NAME,
+                                  server_threads)
 from vantage6.cli.context import ServerContext
+from vantage6.cli.load_balancer import nginx_config
+from vantage6.cli.database import start_postgres
+from vantage6.cli.docker_addons import (
+    get_or_create_network,
+    connect_to_network
+)
+from vantage6.cli.timing import click_timings
+from vantage6.cli.profiling import PROFILERS, start_profiling
+from vantage6.cli.docker_session import DockerSession
+from vantage6.cli.image_bundle import ImageIndex, image_index_path
+from vantage6.cli.image_pin import (
+    PinError,
+    is_available,
+    pin_image,
+    pinned_image
+)
+from vantage6.cli.pull import (
+    DEFAULT_STALL_TIMEOUT,
+    missing_images,
+    pull_images,
+    use_local_image
+)
+from vantage6.cli.readiness import (
+    ContainerExited,
+    wait_until,
+    server_is_ready,
+    server_healthcheck
+)
+from vantage6.cli.completion import add_completion
 from vantage6.cli.configuration_wizard import (
     select_configuration_questionaire,
     configuration_wizard
@@ -42,6 +78,10 @@ def click_insert_context(func):
     def func_with_context(name, config, environment, system_folders,
                           *args, **kwargs):
 
+        # commands with `click_timings` include loading the configuration
+        if kwargs.get("timer"):
+            kwargs["timer"].phase("load configuration")
+
         # select configuration if none supplied
         if config:
             ctx = ServerContext.from_external_config_file(
@@ -88,9 +128,20 @@ def click_insert_context(func):
 
 
 @click.group(name='server')
-def cli_server():
+@click.option('--profile', type=click.Choice(PROFILERS), default=None,
+              help="run the command under a deterministic (cprofile) or "
+                   "sampling profiler, results are written to the log "
+                   "folder")
+@click.pass_context
+def cli_server(click_ctx, profile):
     """Subcommand `vserver`."""
-    pass
+    if profile:
+        start_profiling(click_ctx, profile, ServerContext, [
+            ServerContext.instance_folders(
+                "server", "", DEFAULT_SERVER_SYSTEM_FOLDERS)["log"],
+            ServerContext.instance_folders(
+                "server", "", not DEFAULT_SERVER_SYSTEM_FOLDERS)["log"]
+        ])
 
 #
 #   start
@@ -103,105 +154,176 @@ def cli_server():
 @click.option('-i', '--image', default=None, help="Node Docker image to use")
 @click.option('--keep/--auto-remove', default=False,
               help="Keep image after finishing")
+@click.option('-w', '--workers', default=None, type=click.IntRange(min=1),
+              help="number of server worker processes (default: "
+                   "2 * cpu cores + 1)")
+@click.option('-t', '--threads', default=None, type=click.IntRange(min=1),
+              help="number of threads per worker process")
+@click.option('-r', '--replicas', default=None, type=click.IntRange(min=1),
+              help="number of server containers to run behind a load "
+                   "balancer (requires a database server)")
+@click.option('--with-db', type=click.Choice(["postgres"]), default=None,
+              help="start a database container for the server, overrides "
+                   "the configured uri")
+@click.option('--wait', is_flag=True, default=False,
+              help="wait until the server API responds")
+@click.option('--wait-timeout', default=120, type=click.IntRange(min=1),
+              help="seconds to wait for the server (with --wait)")
+@click.option('--stall-timeout', default=DEFAULT_STALL_TIMEOUT,
+              type=click.IntRange(min=1),
+              help="seconds without progress after which pulling an image "
+                   "is aborted")
+@click_timings
 @click_insert_context
-def cli_server_start(ctx, ip, port, debug, image, keep):
+def cli_server_start(ctx, ip, port, debug, image, keep, workers, threads,
+                     replicas, with_db, wait, wait_timeout, stall_timeout,
+                     timer):
     """Start the server."""
 
     info("Starting server...")
-    info("Finding Docker daemon.")
-    docker_client = docker.from_env()
-    # will print an error if not
-    check_if_docker_deamon_is_running(docker_client)
+    session = DockerSession()
+    docker_client = session.client
 
     # check that this server is not already running
-    running_servers = docker_client.containers.list(
-        filters={"label": f"{APPNAME}-type=server"})
+    timer.phase("check running servers")
+    running_servers = session.containers("server")
     for server in running_servers:
         if server.name == f"{APPNAME}-{ctx.name}-{ctx.scope}-server":
             error(f"Server {Fore.RED}{ctx.name}{Style.RESET_ALL} "
                   "is already running")
             exit(1)
 
-    # pull the server docker image
+    # replicas need to share a database, which is not possible with a
+    # file-based database like SQLite
+    replicas = replicas or ctx.config.get("replicas", 1)
+    if replicas > 1 and not with_db and \
+            make_url(ctx.config['uri']).host is None:
+        error("Multiple replicas require a database server, the file-based "
+              f"database {Fore.RED}{ctx.config['uri']}{Style.RESET_ALL} "
+              "cannot be shared between servers.")
+        exit(1)
+
+    # pull the server docker image, and the images of the database and load
+    # balancer when these are not available yet. The pulls run concurrently.
+    pinned = None
     if image is None:
-        image = ctx.config.get(
+        pinned = pinned_image(ctx.config, DEFAULT_SERVER_IMAGE)
+        image = pinned or ctx.config.get(
             "image",
-            "harbor.vantage6.ai/infrastructure/server:latest"
+            DEFAULT_SERVER_IMAGE
         )
-    info(f"Pulling latest server image '{image}'.")
-    try:
-        pull_if_newer(image)
-        # docker_client.images.pull(image)
-    except Exception:
-        warning("... alas, no dice!")
+    timer.phase("pull image")
+    images = []
+    image_index = ImageIndex(image_index_path(ctx.scope == "system"))
+    if pinned and is_available(docker_client, pinned):
+        info(f"Using pinned server image '{pinned}'.")
+    elif image_index.is_loaded(docker_client, image):
+        info(f"Using server image '{image}' from an offline bundle.")
+        image = image_index.local_reference(image)
     else:
-        info(" ... succes!")
+        info(f"Pulling latest server image '{image}'.")
+        images.append(image)
+    extra_images = []
+    if with_db:
+        extra_images.append(DEFAULT_POSTGRES_IMAGE)
+    if replicas > 1:
+        extra_images.append(DEFAULT_LOAD_BALANCER_IMAGE)
+    images += missing_images(docker_client, extra_images)
+
+    failed = pull_images(docker_client, images, stall_timeout)
+    for image_, e in failed.items():
+        use_local_image(docker_client, image_, e)
 
     info("Creating mounts")
+    timer.phase("assemble mounts")
     mounts = [
         docker.types.Mount(
             "/mnt/config.yaml", str(ctx.config_file), type="bind"
         )
     ]
 
-    # FIXME: code duplication with cli_server_import()
-    # try to mount database
-    uri = ctx.config['uri']
-    url = make_url(uri)
-    environment_vars = None
-
-    # If host is None, we're dealing with a file-based DB, like SQLite
-    if (url.host is None):
-        db_path = url.database
-
-        if not os.path.isabs(db_path):
-            # We're dealing with a relative path here -> make it absolute
-            db_path = ctx.data_dir / url.database
-
-        basename = os.path.basename(db_path)
-        dirname = os.path.dirname(db_path)
-        os.makedirs(dirname, exist_ok=True)
+    if with_db:
+        timer.phase("start database")
+    environment_vars, network = server_database(docker_client, ctx, mounts,
+                                                with_db, keep)
 
-        # we're mounting the entire folder that contains the database
-        mounts.append(docker.types.Mount(
-            "/mnt/database/", dirname, type="bind"
-        ))
+    # command line options take precedence over the configuration file,
+    # which in turn takes precedence over the defaults based on the host
+    workers = workers or ctx.config.get("workers", DEFAULT_SERVER_WORKERS)
+    threads = threads or ctx.config.get("threads", server_threads(workers))
+    info(f"Using {workers} worker(s) with {threads} thread(s) each")
 
-        environment_vars = {
-            "VANTAGE6_DB_URI": f"sqlite:////mnt/database/{basename}"
-        }
-
-    else:
-        warning(f"Database could not be transfered, make sure {url.host} "
-                "is reachable from the Docker container")
-        info("Consider using the docker-compose method to start a server")
+    # replicas are only reachable through the load balancer, so they need
+    # to listen on all interfaces of the private network
+    if replicas > 1:
+        ip = ip or "0.0.0.0"
 
     ip_ = f"--ip {ip}" if ip else ""
     port_ = f"--port {port}" if port else ""
     cmd = f'vserver-local start -c /mnt/config.yaml -e {ctx.environment} ' \
-          f'{ip_} {port_}'
+          f'{ip_} {port_} --workers {workers} --threads {threads}'
     info(cmd)
 
-    info("Run Docker container")
     port_ = str(port or ctx.config["port"] or 5000)
-    container = docker_client.containers.run(
-        image,
-        command=cmd,
-        mounts=mounts,
-        detach=True,
-        labels={
-            f"{APPNAME}-type": "server",
-            "name": ctx.config_file_name
-        },
-        environment=environment_vars,
-        ports={f"{port_}/tcp": ("127.0.0.1", port_)},
-        name=ctx.docker_container_name,
-        auto_remove=not keep,
-        tty=True
+    api_path = ctx.config.get("api_path", "")
+    healthcheck = server_healthcheck(port_, api_path) if wait else None
+
+    timer.phase("run container")
+    started_at = time.monotonic()
+    if replicas > 1:
+        try:
+            container = run_server_replicas(docker_client, ctx, image, cmd,
+                                            mounts, environment_vars, port_,
+                                            replicas, keep, healthcheck)
+        except docker.errors.DockerException as e:
+            error(f"Could not start the server replicas: {e}")
+            exit(1)
+    else:
+        info("Run Docker container")
+        container = docker_client.containers.run(
+            image,
+            command=cmd,
+            mounts=mounts,
+            detach=True,
+            labels={
+                f"{APPNAME}-type": "server",
+                "name": ctx.config_file_name
+            },
+            environment=environment_vars,
+            ports={f"{port_}/tcp": ("127.0.0.1", port_)},
+            network=network,
+            name=ctx.docker_container_name,
+            auto_remove=not keep,
+            healthcheck=healthcheck,
+            tty=True
+        )
+
+    # nodes on this machine reach the server by its container name on the
+    # shared network, instead of through the port published on the host
+    info(f"Connecting to network '{LOCAL_NETWORK_NAME}'")
+    timer.phase("connect to network")
+    connect_to_network(
+        get_or_create_network(docker_client, LOCAL_NETWORK_NAME),
+        container
     )
 
     info(f"Succes! container id = {container}")
 
+    if wait:
+        url = f"http://127.0.0.1:{port_}{api_path}/version"
+        info(f"Waiting for the server to respond at {url}")
+        timer.phase("wait until ready")
+        try:
+            wait_until(lambda: server_is_ready(container, url), wait_timeout)
+        except ContainerExited as e:
+            error(f"The server stopped before it was ready! {e}")
+            exit(1)
+        except TimeoutError:
+            error(f"The server was not ready within {wait_timeout} seconds")
+            exit(1)
+        info(f"Server is ready after {time.monotonic() - started_at:.1f}s")
+
+
 #
 #   list
 #
@@ -209,11 +331,7 @@ def cli_server_start(ctx, ip, port, debug, image, keep):
 def cli_server_configuration_list():
     """Print the available configurations."""
 
-    client = docker.from_env()
-    check_if_docker_deamon_is_running(client)
-
-    running_server = client.containers.list(
-        filters={"label": f"{APPNAME}-type=server"})
+    running_server = DockerSession().containers("server")
     running_node_names = []
     for node in running_server:
         running_node_names.append(node.name)
@@ -337,33 +455,46 @@ def cli_server_new(name, environment, system_folders):
 @click.option('-i', '--image', default=None, help="Node Docker image to use")
 @click.option('--keep/--auto-remove', default=False,
               help="Keep image after finishing")
+@click.option('--with-db', type=click.Choice(["postgres"]), default=None,
+              help="import into the database container of the server, "
+                   "as started by `vserver start --with-db`")
+@click_timings
 @click_insert_context
-def cli_server_import(ctx, file_, drop_all, image, keep):
+def cli_server_import(ctx, file_, drop_all, image, keep, with_db, timer):
     """ Import organizations/collaborations/users and tasks.
 
         Especially usefull for testing purposes.
     """
     info("Starting server...")
-    info("Finding Docker daemon.")
-    docker_client = docker.from_env()
-    # will print an error if not
-    check_if_docker_deamon_is_running(docker_client)
+    docker_client = DockerSession().client
 
-    # pull lastest Docker image
+    # pull lastest Docker image, unless it is pinned or from a bundle
+    pinned = None
     if image is None:
-        image = ctx.config.get(
+        pinned = pinned_image(ctx.config, DEFAULT_SERVER_IMAGE)
+        image = pinned or ctx.config.get(
             "image",
-            "harbor.vantage6.ai/infrastructure/server:latest"
+            DEFAULT_SERVER_IMAGE
         )
-    info(f"Pulling latest server image '{image}'.")
-    try:
-        docker_client.images.pull(image)
-    except Exception:
-        warning("... alas, no dice!")
+    timer.phase("pull image")
+    images = []
+    image_index = ImageIndex(image_index_path(ctx.scope == "system"))
+    if pinned and is_available(docker_client, pinned):
+        info(f"Using pinned server image '{pinned}'.")
+    elif image_index.is_loaded(docker_client, image):
+        info(f"Using server image '{image}' from an offline bundle.")
+        image = image_index.local_reference(image)
     else:
-        info(" ... succes!")
+        info(f"Pulling latest server image '{image}'.")
+        images.append(image)
+    if with_db:
+        images += missing_images(docker_client, [DEFAULT_POSTGRES_IMAGE])
+    failed = pull_images(docker_client, images)
+    for image_, e in failed.items():
+        use_local_image(docker_client, image_, e)
 
     info("Creating mounts")
+    timer.phase("assemble mounts")
     mounts = [
         docker.types.Mount(
             "/mnt/config.yaml", str(ctx.config_file), type="bind"
@@ -373,37 +504,10 @@ def cli_server_import(ctx, file_, drop_all, image, keep):
         )
     ]
 
-    # FIXME: code duplication with cli_server_start()
-    # try to mount database
-    uri = ctx.config['uri']
-    url = make_url(uri)
-    environment_vars = None
-
-    # If host is None, we're dealing with a file-based DB, like SQLite
-    if (url.host is None):
-        db_path = url.database
-
-        if not os.path.isabs(db_path):
-            # We're dealing with a relative path here -> make it absolute
-            db_path = ctx.data_dir / url.database
-
-        basename = os.path.basename(db_path)
-        dirname = os.path.dirname(db_path)
-        os.makedirs(dirname, exist_ok=True)
-
-        # we're mounting the entire folder that contains the database
-        mounts.append(docker.types.Mount(
-            "/mnt/database/", dirname, type="bind"
-        ))
-
-        environment_vars = {
-            "VANTAGE6_DB_URI": f"sqlite:////mnt/database/{basename}"
-        }
-
-    else:
-        warning(f"Database could not be transfered, make sure {url.host} "
-                "is reachable from the Docker container")
-        info("Consider using the docker-compose method to start a server")
+    if with_db:
+        timer.phase("start database")
+    environment_vars, network = server_database(docker_client, ctx, mounts,
+                                                with_db, keep)
 
     drop_all_ = "--drop-all" if drop_all else ""
     cmd = f'vserver-local import -c /mnt/config.yaml -e {ctx.environment} ' \
@@ -412,6 +516,7 @@ def cli_server_import(ctx, file_, drop_all, image, keep):
     info(cmd)
 
     info("Run Docker container")
+    timer.phase("run container")
     container = docker_client.containers.run(
         image,
         command=cmd,
@@ -422,6 +527,7 @@ def cli_server_import(ctx, file_, drop_all, image, keep):
             "name": ctx.config_file_name
         },
         environment=environment_vars,
+        network=network,
         auto_remove=not keep,
         tty=True
     )
@@ -483,26 +589,31 @@ def cli_server_import(ctx, file_, drop_all, image, keep):
 @click.option('--user', 'system_folders', flag_value=False,
               default=DEFAULT_SERVER_SYSTEM_FOLDERS)
 @click.option('--all', 'all_servers', flag_value=True)
-def cli_server_stop(name, system_folders, all_servers):
+@click_timings
+def cli_server_stop(name, system_folders, all_servers, timer):
     """Stop a or all running server. """
 
-    client = docker.from_env()
-    check_if_docker_deamon_is_running(client)
-
-    running_servers = client.containers.list(
-        filters={"label": f"{APPNAME}-type=server"})
+    timer.phase("list running servers")
+    session = DockerSession()
+    running_servers = session.containers("server")
 
     if not running_servers:
         warning("No servers are currently running.")
         return
 
-    running_server_names = [server.name for server in running_servers]
+    running_server_names = server_group_names(running_servers)
 
+    timer.phase("stop containers")
     if all_servers:
+        failed = stop_server_groups(session, running_servers,
+                                    running_server_names)
         for name in running_server_names:
-            container = client.containers.get(name)
-            container.kill()
-            info(f"Stopped the {Fore.GREEN}{name}{Style.RESET_ALL} server.")
+            if name in failed:
+                error(f"Failed to stop the {Fore.RED}{name}{Style.RESET_ALL}"
+                      " server.")
+            else:
+                info(f"Stopped the {Fore.GREEN}{name}{Style.RESET_ALL} "
+                     "server.")
     else:
         if not name:
             name = q.select("Select the server you wish to stop:",
@@ -513,12 +624,62 @@ def cli_server_stop(name, system_folders, all_servers):
             name = f"{APPNAME}-{name}-{post_fix}-server"
 
         if name in running_server_names:
-            container = client.containers.get(name)
-            container.kill()
-            info(f"Stopped the {Fore.GREEN}{name}{Style.RESET_ALL} server.")
+            if stop_server_groups(session, running_servers, [name]):
+                error(f"Failed to stop the {Fore.RED}{name}{Style.RESET_ALL}"
+                      " server.")
+            else:
+                info(f"Stopped the {Fore.GREEN}{name}{Style.RESET_ALL} "
+                     "server.")
         else:
             error(f"{Fore.RED}{name}{Style.RESET_ALL} is not running?")
 
+#
+#   image
+#
+@cli_server.group(name="image")
+def cli_server_image():
+    """Pin the server image to a digest."""
+    pass
+
+
+@cli_server_image.command(name="pin")
+@click.option("-i", "--image", default=None,
+              help="image to pin, replaces the configured image")
+@click_insert_context
+def cli_server_image_pin(ctx, image):
+    """Pin the server image to a digest.
+
+    The digest of the local image is used when it is available, otherwise
+    the tag is resolved in the registry. `vserver start` uses the pinned
+    image until it is moved with `vserver image upgrade`.
+    """
+    try:
+        _, digest = pin_image(DockerSession().client, ctx,
+                              DEFAULT_SERVER_IMAGE, image)
+    except PinError as e:
+        error(str(e))
+        exit(1)
+    info(f"Pinned the server image of {Fore.GREEN}{ctx.name}"
+         f"{Style.RESET_ALL} to {digest}")
+
+
+@cli_server_image.command(name="upgrade")
+@click_insert_context
+def cli_server_image_upgrade(ctx):
+    """Move the pinned server image to the digest its tag now refers to."""
+    try:
+        previous, digest = pin_image(DockerSession().client, ctx,
+                                     DEFAULT_SERVER_IMAGE, upgrade=True)
+    except PinError as e:
+        error(str(e))
+        exit(1)
+    if previous == digest:
+        info(f"The server image is up to date ({digest})")
+    else:
+        info(f"Upgraded the server image from {previous} to {digest}")
+        info("Restart the server to use it")
+
+
 #
 #   attach
 #
@@ -530,12 +691,9 @@ def cli_server_stop(name, system_folders, all_servers):
 def cli_server_attach(name, system_folders):
     """Attach the logs from the docker container to the terminal."""
 
-    client = docker.from_env()
-    check_if_docker_deamon_is_running(client)
-
-    running_servers = client.containers.list(
-        filters={"label": f"{APPNAME}-type=server"})
-    running_server_names = [node.name for node in running_servers]
+    session = DockerSession()
+    running_servers = session.containers("server")
+    running_server_names = server_group_names(running_servers)
 
     if not name:
         name = q.select("Select the server you wish to inspect:",
@@ -545,9 +703,11 @@ def cli_server_attach(name, system_folders):
         name = f"{APPNAME}-{name}-{post_fix}-server"
 
     if name in running_server_names:
-        container = client.containers.get(name)
-        logs = container.attach(stream=True, logs=True, stdout=True)
-        Thread(target=print_log_worker, args=(logs,), daemon=True).start()
+        # in case of replicas, the logs of all of them are shown
+        containers = [c for c in server_group(running_servers, name)
+                      if c.labels.get(ROLE_LABEL) != "load-balancer"]
+        Thread(target=session.follow_logs, args=(containers, print_log),
+               daemon=True).start()
         while True:
             try:
                 time.sleep(1)
@@ -558,14 +718,181 @@ def cli_server_attach(name, system_folders):
         error(f"{Fore.RED}{name}{Style.RESET_ALL} was not running!?")
 
 
-def check_if_docker_deamon_is_running(docker_client):
+def server_database(docker_client, ctx, mounts, with_db=None, keep=False):
+    """Make the database available to the server container(s).
+
+    With `with_db` the bundled database container is started (or re-used),
+    which the server reaches on a private network. A file-based database
+    (SQLite) is mounted into the container by adding it to `mounts`. Any
+    other database must be reachable from the container by itself.
+
+    Returns
+    -------
+    tuple
+        the environment variables and network (or None) for the server
+        container(s)
+    """
+    if with_db:
+        network = get_or_create_network(
+            docker_client, f"{ctx.docker_container_name}-net"
+        ).name
+        try:
+            uri = start_postgres(docker_client, ctx, network, keep)
+        except TimeoutError as e:
+            error(str(e))
+            exit(1)
+        return {"VANTAGE6_DB_URI": uri}, network
+
+    url = make_url(ctx.config['uri'])
+
+    # If host is None, we're dealing with a file-based DB, like SQLite
+    if url.host is None:
+        db_path = url.database
+
+        if not os.path.isabs(db_path):
+            # We're dealing with a relative path here -> make it absolute
+            db_path = ctx.data_dir / url.database
+
+        basename = os.path.basename(db_path)
+        dirname = os.path.dirname(db_path)
+        os.makedirs(dirname, exist_ok=True)
+
+        # we're mounting the entire folder that contains the database
+        mounts.append(docker.types.Mount(
+            "/mnt/database/", dirname, type="bind"
+        ))
+
+        return {"VANTAGE6_DB_URI": f"sqlite:////mnt/database/{basename}"}, \
+            None
+
+    warning(f"Database could not be transfered, make sure {url.host} "
+            "is reachable from the Docker container")
+    info("Consider using the docker-compose method to start a server")
+    return None, None
+
+
+def run_server_replicas(docker_client, ctx, image, cmd, mounts,
+                        environment_vars, port, replicas, keep,
+                        healthcheck=None):
+    """Start server replicas on a private network behind a load balancer.
+
+    The load balancer takes the place of the single server container: it
+    gets its name and publishes the server port. All containers share the
+    group label so that they can be stopped and attached to as one unit.
+    """
+    group = ctx.docker_container_name
+    network = get_or_create_network(docker_client, f"{group}-net")
+
+    # a group that is only partly running cannot serve anyone, and its
+    # containers would be in the way of the next attempt
+    started = []
     try:
-        docker_client.ping()
+        info(f"Run {replicas} server containers on network "
+             f"'{network.name}'")
+        upstreams = []
+        for i in range(1, replicas + 1):
+            replica_name = f"{group}-{i}"
+            started.append(docker_client.containers.run(
+                image,
+                command=cmd,
+                mounts=mounts,
+                detach=True,
+                labels={
+                    f"{APPNAME}-type": "server",
+                    "name": ctx.config_file_name,
+                    GROUP_LABEL: group,
+                    ROLE_LABEL: "replica"
+                },
+                environment=environment_vars,
+                network=network.name,
+                name=replica_name,
+                auto_remove=not keep,
+                healthcheck=healthcheck,
+                tty=True
+            ))
+            upstreams.append(f"{replica_name}:{port}")
+
+        info("Run load balancer container")
+        ctx.data_dir.mkdir(parents=True, exist_ok=True)
+        lb_config = ctx.data_dir / "load-balancer.conf"
+        lb_config.write_text(nginx_config(upstreams, port))
+
+        return docker_client.containers.run(
+            DEFAULT_LOAD_BALANCER_IMAGE,
+            mounts=[
+                docker.types.Mount("/etc/nginx/nginx.conf", str(lb_config),
+                                   type="bind", read_only=True)
+            ],
+            detach=True,
+            labels={
+                f"{APPNAME}-type": "server",
+                "name": ctx.config_file_name,
+                GROUP_LABEL: group,
+                ROLE_LABEL: "load-balancer"
+            },
+            network=network.name,
+            ports={f"{port}/tcp": ("127.0.0.1", port)},
+            name=group,
+            auto_remove=not keep
+        )
     except Exception:
-        error("Docker socket can not be found. Make sure Docker is running.")
-        exit()
+        if started:
+            warning(f"Removing the {len(started)} replica(s) that did start")
+        for container in started:
+            try:
+                container.remove(force=True)
+            except docker.errors.APIError as e:
+                debug(f"{container.name}: {e}")
+        raise
+
+
+def server_group(containers, name):
+    """Return the containers that belong to the server `name`."""
+    return [c for c in containers
+            if c.name == name or c.labels.get(GROUP_LABEL) == name]
+
+
+def server_group_names(containers):
+    """Return the names of the running servers, one for each group.
+
+    A group is also listed when only some of its containers are running,
+    e.g. a database that was left behind, so that it can be stopped.
+    """
+    names = {}
+    for c in containers:
+        names.setdefault(c.labels.get(GROUP_LABEL) or c.name)
+    return list(names)
+
+
+def stop_server_groups(session, containers, names):
+    """Stop all containers that belong to the servers `names`.
+
+    Returns
+    -------
+    set
+        names of the servers of which a container could not be stopped
+    """
+    members = [(name, c) for name in names
+               for c in server_group(containers, name)]
+    # give the databases the chance to shut down cleanly
+    databases = [c for _, c in members
+                 if c.labels.get(ROLE_LABEL) == "database"]
+    errors = session.kill_all([c for _, c in members
+                               if c not in databases])
+    errors.update(session.stop_all(databases))
+    for container_name, e in errors.items():
+        debug(f"{container_name}: {e}")
+    return {name for name, c in members if c.name in errors}
 
 
 def print_log_worker(logs_stream):
     for log in logs_stream:
-        print(log.decode(STRING_ENCODING), end="")
+        print_log(log)
+
+
+def print_log(log):
+    print(log.decode(STRING_ENCODING), end="")
+
+
+# after all commands have been defined
+add_completion(cli_server, "server")
@@ -0,0 +1,183 @@
+""" Splitting a database of a node into partitions
+
+    `vnode data shard` splits a (CSV) database into N partitions, so that
+    an algorithm can process them in parallel. Rows are either dealt out
+    in turn, which balances the number of rows, or assigned by the hash of
+    a key column, which keeps all rows with the same key together:
+
+        <output>/manifest.json
+        <output>/<label>-part0.csv
+        <output>/<label>-part1.csv
+        ...
+
+    The partitions are registered as databases of the node, labelled
+    `<label>-part<i>`. The manifest records the source, how it was split
+    and the number of rows of each partition.
+
+    Rows are streamed from the source to the partitions, memory use does
+    not depend on the size of the database.
+"""
+import csv
+import json
+import os
+import shutil
+import zlib
+
+from contextlib import ExitStack
+from pathlib import Path
+
+MANIFEST = "manifest.json"
+
+# rows that are buffered per partition before they are written
+BATCH_SIZE = 10000
+
+
+class ShardError(Exception):
+    """A database could not be split."""
+
+
+def partition_label(label, index):
+    return f"{label}-part{index}"
+
+
+def key_partition(value, partitions):
+    """Return the partition of a key, the same in every process and run."""
+    return zlib.crc32(value.encode("utf-8")) % partitions
+
+
+def _split(source, files, key=None, batch_size=BATCH_SIZE):
+    """Stream the rows of `source` into `files`, return the row counts."""
+    partitions = len(files)
+    with open(source, newline="") as fp, ExitStack() as stack:
+        try:
+            delimiter = csv.Sniffer().sniff(
+                fp.readline(), delimiters=",;\t|").delimiter
+        except csv.Error:
+            delimiter = ","
+        fp.seek(0)
+        reader = csv.reader(fp, delimiter=delimiter)
+        header = next(reader, None)
+        if header is None:
+            raise ShardError(f"{source} is empty")
+        if key is not None and key not in header:
+            raise ShardError(f"Column '{key}' is not in {source}")
+        column = header.index(key) if key is not None else None
+
+        writers = []
+        for file_ in files:
+            writer = csv.writer(stack.enter_context(
+                open(file_, "w", newline="")), delimiter=delimiter)
+            writer.writerow(header)
+            writers.append(writer)
+
+        batches = [[] for _ in range(partitions)]
+        rows = [0] * partitions
+        try:
+            for n, row in enumerate(reader):
+                if not row:
+                    continue
+                if column is None:
+                    i = n % partitions
+                else:
+                    value = row[column] if column < len(row) else ""
+                    i = key_partition(value, partitions)
+                batches[i].append(row)
+                if len(batches[i]) >= batch_size:
+                    writers[i].writerows(batches[i])
+                    rows[i] += len(batches[i])
+                    batches[i] = []
+        except csv.Error as e:
+            raise ShardError(f"Cannot read {source}: {e}") from e
+        for i, batch in enumerate(batches):
+            writers[i].writerows(batch)
+            rows[i] += len(batch)
+    return rows
+
+
+def shard(source, output, label, partitions, key=None):
+    """Split the CSV file `source` into `partitions` files in `output`.
+
+    Parameters
+    ----------
+    source : str or Path
+        the database to split
+    output : str or Path
+        folder of the partitions, replaced when it exists
+    label : str
+        label of the database, the partitions are named after it
+    partitions : int
+        number of partitions
+    key : str, optional
+        column to partition on, rows are dealt out in turn when omitted
+
+    Returns
+    -------
+    dict
+        the manifest
+    """
+    source, output = Path(source), Path(output)
+    stat = source.stat()
+    tmp = output.with_name(f".{output.name}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    files = [tmp / f"{partition_label(label, i)}.csv"
+             for i in range(partitions)]
+    try:
+        rows = _split(source, files, key)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    manifest = {
+        "source": str(source),
+        "source_size": stat.st_size,
+        "source_mtime": stat.st_mtime,
+        "label": label,
+        "partitions": partitions,
+        "key": key,
+        "files": [
+            {
+                "label": partition_label(label, i),
+                "path": str(output / file_.name),
+                "rows": rows[i],
+                "size": file_.stat().st_size,
+            }
+            for i, file_ in enumerate(files)
+        ],
+    }
+    with open(tmp / MANIFEST, "w") as fp:
+        json.dump(manifest, fp, indent=2)
+
+    # swap in the new partitions
+    old = output.with_name(f".{output.name}.old")
+    if output.exists():
+        os.rename(output, old)
+    os.rename(tmp, output)
+    shutil.rmtree(old, ignore_errors=True)
+    return manifest
+
+
+def read_manifest(output):
+    """Return the manifest in `output`, or None if there is none."""
+    try:
+        with open(Path(output) / MANIFEST) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def register(databases, manifest, previous=None):
+    """Return `databases` with the partitions of `manifest` registered.
+
+    Partitions of the `previous` manifest that no longer exist (e.g. when
+    the database was split into fewer partitions) are removed.
+    """
+    databases = dict(databases)
+    if previous:
+        for file_ in previous.get("files", []):
+            if databases.get(file_["label"]) == file_["path"]:
+                del databases[file_["label"]]
+    for file_ in manifest["files"]:
+        databases[file_["label"]] = file_["path"]
+    return databases
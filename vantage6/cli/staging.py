@@ -0,0 +1,305 @@
+""" Staging the databases of a node on a local disk
+
+    The databases of a node often live on a network share, from which every
+    task reads the full file again. With staging enabled, `vnode start` (or
+    `vnode stage`) copies the databases to a local cache folder and the node
+    mounts the staged copies instead:
+
+        staging:
+          enabled: true
+          path: /ssd/vantage6-staging   # default: <data folder>/staging
+          max_size: 50g                 # total size of the staged copies
+          chunk_size: 4m                # unit of the delta check
+
+    A staged copy is refreshed when the size or modification time of its
+    source changes. The source is then compared chunk by chunk against the
+    checksums of the staged copy. When nothing differs the copy is left
+    alone. Otherwise a new copy is written next to it, with the chunks
+    before the first difference taken from the old (local) copy, and
+    renamed over the old one. Readers never see a mix of old and new
+    chunks: a running node keeps reading the copy it bind mounted and uses
+    the new one after it is restarted.
+
+    When the cache exceeds `max_size` the least recently used copies are
+    evicted. A database that does not fit at all is not staged.
+"""
+import hashlib
+import json
+import os
+import time
+
+from pathlib import Path
+
+from schema import Use, Optional
+
+from vantage6.cli.resources import SIZE, parse_size
+
+DEFAULT_CHUNK_SIZE = 4 * 1024 ** 2
+
+INDEX_FILE = "index.json"
+
+VALIDATOR = {
+    Optional("enabled"): bool,
+    Optional("path"): Use(str),
+    Optional("max_size"): SIZE,
+    Optional("chunk_size"): SIZE,
+}
+
+
+class StagingError(Exception):
+    """A database could not be staged."""
+
+
+class StagedFile:
+    """The result of staging a single database."""
+
+    def __init__(self, source, path, status, changed_chunks=0):
+        self.source = source
+        self.path = path
+        # one of "fresh", "updated", "copied", "unchanged", "stale" or
+        # "skipped" (in which case `path` is the source)
+        self.status = status
+        self.changed_chunks = changed_chunks
+
+
+def chunk_digests(fp, chunk_size):
+    """Yield every chunk of `fp` and its checksum."""
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk, hashlib.blake2b(chunk, digest_size=16).hexdigest()
+
+
+class StagingCache:
+    """A folder with local copies of databases, evicted LRU by size.
+
+    Parameters
+    ----------
+    folder : str or Path
+        folder of the staged copies
+    max_size : int, optional
+        maximum total size of the staged copies in bytes
+    chunk_size : int, optional
+        size of the chunks that are compared against the source
+    """
+
+    def __init__(self, folder, max_size=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 clock=time.time):
+        self.folder = Path(folder)
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.clock = clock
+        try:
+            self.folder.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            raise StagingError(f"Cannot create {self.folder}: {e}") from e
+        self.entries = self._read_index()
+
+    def _read_index(self):
+        try:
+            with open(self.folder / INDEX_FILE) as fp:
+                entries = json.load(fp)
+        except (OSError, ValueError):
+            return {}
+        # forget copies that were removed behind our back
+        return {source: entry for source, entry in entries.items()
+                if (self.folder / entry["file"]).exists()}
+
+    def _write_index(self):
+        tmp = self.folder / f".{INDEX_FILE}.tmp"
+        with open(tmp, "w") as fp:
+            json.dump(self.entries, fp, indent=2)
+        os.replace(tmp, self.folder / INDEX_FILE)
+
+    @property
+    def size(self):
+        return sum(entry["size"] for entry in self.entries.values())
+
+    def path(self, source):
+        """Return the path of the staged copy of `source`."""
+        digest = hashlib.sha1(str(source).encode()).hexdigest()[:16]
+        return self.folder / f"{digest}-{Path(source).name}"
+
+    def evict(self, needed=0, keep=()):
+        """Evict the least recently used copies to make room for `needed`.
+
+        Copies of the sources in `keep` are never evicted.
+
+        Returns
+        -------
+        list
+            the sources whose copies were evicted
+        """
+        if self.max_size is None:
+            return []
+        evicted = []
+        candidates = sorted(
+            (source for source in self.entries if source not in keep),
+            key=lambda source: self.entries[source]["last_used"]
+        )
+        for source in candidates:
+            if self.size + needed <= self.max_size:
+                break
+            entry = self.entries.pop(source)
+            try:
+                os.remove(self.folder / entry["file"])
+            except FileNotFoundError:
+                pass
+            evicted.append(source)
+        if evicted:
+            self._write_index()
+        return evicted
+
+    def stage(self, source, keep=()):
+        """Stage `source` and return a `StagedFile`.
+
+        Parameters
+        ----------
+        source : str or Path
+            the database to stage
+        keep : iterable, optional
+            sources that may not be evicted to make room for `source`
+
+        Raises
+        ------
+        StagingError
+            when `source` cannot be read and has not been staged before,
+            or it cannot be copied (e.g. the disk is full)
+        """
+        try:
+            return self._stage(str(source), keep)
+        except OSError as e:
+            raise StagingError(f"Cannot stage {source}: {e}") from e
+
+    def _stage(self, source, keep):
+        entry = self.entries.get(source)
+        try:
+            stat = os.stat(source)
+        except OSError as e:
+            if entry:
+                # the share is unreachable, the last copy is better than none
+                entry["last_used"] = self.clock()
+                self._write_index()
+                return StagedFile(source, self.folder / entry["file"],
+                                  "stale")
+            raise StagingError(f"Cannot read {source}: {e}") from e
+
+        if entry and entry["size"] == stat.st_size \
+                and entry["mtime"] == stat.st_mtime:
+            entry["last_used"] = self.clock()
+            self._write_index()
+            return StagedFile(source, self.folder / entry["file"], "fresh")
+
+        needed = stat.st_size - (entry["size"] if entry else 0)
+        self.evict(max(needed, 0), keep=set(keep) | {source})
+        if self.max_size is not None \
+                and self.size + needed > self.max_size:
+            return StagedFile(source, Path(source), "skipped")
+
+        path = self.path(source)
+        old_digests = []
+        if entry and entry["chunk_size"] == self.chunk_size \
+                and path.exists():
+            old_digests = entry["chunks"]
+        digests = []
+        changed = 0
+        tmp = path.with_name(f".{path.name}.tmp")
+        dst = None
+        try:
+            with open(source, "rb") as src:
+                for i, (chunk, digest) in enumerate(
+                        chunk_digests(src, self.chunk_size)):
+                    digests.append(digest)
+                    if i < len(old_digests) and old_digests[i] == digest:
+                        if dst:
+                            dst.write(chunk)
+                        continue
+                    if dst is None:
+                        dst = open(tmp, "wb")
+                        self._copy_head(path, dst, i * self.chunk_size)
+                    dst.write(chunk)
+                    changed += 1
+                size = src.tell()
+            if dst is None and (len(digests) != len(old_digests)
+                                or not path.exists()):
+                # truncated (the remaining chunks are the same) or empty
+                dst = open(tmp, "wb")
+                self._copy_head(path, dst, size)
+            if dst:
+                dst.close()
+                os.replace(tmp, path)
+        except BaseException:
+            if dst:
+                dst.close()
+                os.remove(tmp)
+            raise
+
+        if not entry:
+            status = "copied"
+        elif changed or len(digests) != len(old_digests):
+            status = "updated"
+        else:
+            status = "unchanged"
+        self.entries[source] = {
+            "file": path.name,
+            "size": size,
+            "mtime": stat.st_mtime,
+            "chunk_size": self.chunk_size,
+            "chunks": digests,
+            "last_used": self.clock(),
+        }
+        self._write_index()
+        return StagedFile(source, path, status, changed)
+
+    def _copy_head(self, path, dst, size):
+        """Copy the first `size` bytes of the old copy at `path`."""
+        if not size:
+            return
+        with open(path, "rb") as old:
+            while size > 0:
+                data = old.read(min(self.chunk_size, size))
+                if not data:
+                    break
+                dst.write(data)
+                size -= len(data)
+
+
+def staging_settings(config):
+    """Return the staging settings of a node, or None when disabled."""
+    settings = config.get("staging") or {}
+    if not settings.get("enabled"):
+        return None
+    return settings
+
+
+def staging_cache(ctx, settings):
+    """Return the `StagingCache` of the node in `ctx`."""
+    folder = settings.get("path") or Path(ctx.data_dir) / "staging"
+    max_size = settings.get("max_size")
+    return StagingCache(
+        folder,
+        max_size=parse_size(max_size) if max_size is not None else None,
+        chunk_size=parse_size(settings.get("chunk_size",
+                                           DEFAULT_CHUNK_SIZE))
+    )
+
+
+def stage_databases(cache, databases):
+    """Stage all `databases` of a node.
+
+    Parameters
+    ----------
+    cache : StagingCache
+        the cache to stage them in
+    databases : dict
+        label and path of every database
+
+    Returns
+    -------
+    dict
+        the `StagedFile` of every label
+    """
+    sources = [str(path) for path in databases.values()]
+    return {label: cache.stage(path, keep=sources)
+            for label, path in databases.items()}
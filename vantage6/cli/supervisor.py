@@ -0,0 +1,393 @@
+""" The vnode daemon: a resident supervisor of the nodes on this machine
+
+    Every `vnode` invocation starts an interpreter, imports its modules,
+    parses the configuration files and connects to Docker. The daemon does
+    this once and then serves the `list`, `start`, `stop` and `status`
+    commands over a Unix socket. `vnode` forwards these commands to the
+    daemon when it is running (unless `--no-daemon` is given), before it
+    imports the rest of the CLI (see `vantage6.cli.entry`).
+
+    The daemon also restarts the nodes that it started when they crash,
+    with an exponential backoff. It runs `vnode restart` with the arguments
+    of `vnode start`, so that the exited container of a node that was
+    started with `--keep` (which still holds its name) is restarted in
+    place or replaced. A node that keeps crashing is no longer
+    restarted. A node that is stopped on purpose (by `vnode stop`, with or
+    without the daemon, or `docker stop`/`kill`) is no longer supervised:
+    the daemon recognizes these from the kill and stop events of Docker,
+    which a crashing container does not emit.
+
+    The protocol is a single line of JSON in each direction:
+
+        -> {"command": "start", "args": ["--name", "iknl"], "cwd": "/home"}
+        <- {"exit_code": 0, "output": "..."}
+"""
+import io
+import json
+import os
+import socketserver
+import threading
+import time
+import traceback
+
+from collections import deque
+from contextlib import redirect_stdout, redirect_stderr
+from pathlib import Path
+
+import click
+
+from vantage6.common import info, warning, error, Singleton
+from vantage6.common.globals import APPNAME
+from vantage6.cli.context import NodeContext
+from vantage6.cli.docker_session import DockerSession
+from vantage6.cli.daemon_client import DAEMON_COMMANDS, forward
+
+# key in the click context meta data that holds the subcommand arguments
+SUBCOMMAND_ARGS = "vantage6.subcommand_args"
+
+
+class ForwardingGroup(click.Group):
+    """Group that keeps the arguments of the invoked subcommand.
+
+    Click does not pass these to the group callback, which needs them to
+    forward the command to the daemon.
+    """
+
+    def resolve_command(self, ctx, args):
+        cmd_name, cmd, rest = super().resolve_command(ctx, args)
+        ctx.meta[SUBCOMMAND_ARGS] = rest
+        return cmd_name, cmd, rest
+
+
+class ConfigIndex:
+    """Keeps the parsed configurations until one of the files changes."""
+
+    def __init__(self):
+        self._cache = {}
+
+    def get(self, folder, load):
+        """Return the configurations in `folder`, using `load` if needed."""
+        signature = self.signature(folder)
+        cached = self._cache.get(str(folder))
+        if cached is None or cached[0] != signature:
+            cached = (signature, load())
+            self._cache[str(folder)] = cached
+        return cached[1]
+
+    @staticmethod
+    def signature(folder):
+        try:
+            entries = [(e.name, e.stat().st_mtime_ns, e.stat().st_size)
+                       for e in os.scandir(folder) if e.name.endswith(".yaml")]
+        except FileNotFoundError:
+            return ()
+        return tuple(sorted(entries))
+
+
+class SupervisedNode:
+    """A node that is restarted when its container disappears."""
+
+    def __init__(self, container_name, args, cwd=None):
+        self.container_name = container_name
+        self.args = args
+        # relative paths in `args` (e.g. --config) are relative to this
+        self.cwd = cwd
+        self.registered_at = _now_ns()
+        self.state = "running"
+        self.restarts = deque()
+        self.next_attempt = None
+
+
+class Supervisor:
+    """Restarts crashed nodes with an exponential backoff.
+
+    Parameters
+    ----------
+    start : callable
+        starts a node, called with the arguments of `vnode start` and the
+        working directory to run it in
+    running : callable
+        returns the names of the running node containers
+    stopped : callable, optional
+        returns the name and time (in ns since the epoch) of every node
+        container that was stopped on purpose since the previous call
+    initial_delay, max_delay : float, optional
+        seconds to wait before the first restart, doubled for every next
+        restart up to `max_delay`
+    max_restarts, window : int, optional
+        a node that crashed more than `max_restarts` times within `window`
+        seconds is in a crash loop and is no longer restarted
+    """
+
+    def __init__(self, start, running, stopped=lambda: [], initial_delay=1,
+                 max_delay=300, max_restarts=5, window=600,
+                 clock=time.monotonic):
+        self.start = start
+        self.running = running
+        self.stopped = stopped
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.max_restarts = max_restarts
+        self.window = window
+        self.clock = clock
+        self.nodes = {}
+
+    def register(self, container_name, args, cwd=None):
+        self.nodes[container_name] = SupervisedNode(container_name, args,
+                                                    cwd)
+
+    def unregister(self, container_name):
+        self.nodes.pop(container_name, None)
+
+    def tick(self):
+        """Check all supervised nodes, restart those that are due."""
+        if not self.nodes:
+            return
+        for name, stopped_at in self.stopped():
+            node = self.nodes.get(name)
+            # an earlier incarnation may have been stopped before this one
+            # was registered
+            if node and stopped_at >= node.registered_at:
+                info(f"Node {name} was stopped, it is no longer "
+                     "supervised.")
+                self.unregister(name)
+        running = set(self.running())
+        now = self.clock()
+
+        for node in self.nodes.values():
+            if node.state == "crash-loop":
+                continue
+            if node.container_name in running:
+                node.state = "running"
+                continue
+
+            if node.state == "running":
+                # it crashed since the last check
+                while node.restarts and now - node.restarts[0] > self.window:
+                    node.restarts.popleft()
+                if len(node.restarts) >= self.max_restarts:
+                    node.state = "crash-loop"
+                    error(f"Node {node.container_name} crashed "
+                          f"{len(node.restarts) + 1} times within "
+                          f"{self.window} seconds, it is no longer "
+                          "restarted.")
+                    continue
+                delay = min(self.initial_delay * 2 ** len(node.restarts),
+                            self.max_delay)
+                node.state = "backoff"
+                node.next_attempt = now + delay
+                warning(f"Node {node.container_name} is not running, "
+                        f"restarting in {delay} seconds.")
+
+            if node.state == "backoff" and now >= node.next_attempt:
+                info(f"Restarting node {node.container_name}.")
+                node.restarts.append(now)
+                node.state = "running"
+                self.start(node.args, node.cwd)
+
+    def status(self):
+        """Return a table with the state of the supervised nodes."""
+        if not self.nodes:
+            return "No nodes are supervised.\n"
+        header = f"{'Node':40}{'State':14}{'Restarts':>10}"
+        lines = [header, "-" * len(header)]
+        for node in self.nodes.values():
+            lines.append(f"{node.container_name:40}{node.state:14}"
+                         f"{len(node.restarts):>10}")
+        return "\n".join(lines) + "\n"
+
+
+class Daemon:
+    """Serves `vnode` commands over a Unix socket and supervises nodes.
+
+    Parameters
+    ----------
+    cli : click.Group
+        the `vnode` command group, used to run the commands in-process
+    socket_path : Path
+        path of the control socket
+    poll_interval : float, optional
+        seconds between two checks of the supervised nodes
+    """
+
+    def __init__(self, cli, socket_path, poll_interval=5):
+        self.cli = cli
+        self.socket_path = Path(socket_path)
+        self.poll_interval = poll_interval
+        # commands change global state (working directory, stdout), so
+        # only one runs at a time. Restarts by the supervisor re-enter it.
+        self.lock = threading.RLock()
+        self.session = DockerSession()
+        self.supervisor = Supervisor(start=self.restart,
+                                     running=self.running_nodes,
+                                     stopped=self.stopped_nodes)
+        self._events_since = _now_ns()
+        self._stop = threading.Event()
+        self._server = None
+
+    def running_nodes(self):
+        return [c.name for c in self.session.containers("node")]
+
+    def stopped_nodes(self):
+        """Return the node containers that were stopped on purpose.
+
+        `docker stop` and `docker kill` (which `vnode stop` uses) emit a
+        stop or kill event, a container that exits by itself does not.
+
+        Returns
+        -------
+        list
+            name and time (in ns) of every stop since the previous call
+        """
+        until = _now_ns()
+        events = self.session.client.events(
+            since=_timestamp(self._events_since),
+            until=_timestamp(until),
+            filters={
+                "type": "container",
+                "event": ["kill", "stop"],
+                "label": f"{APPNAME}-type=node"
+            },
+            decode=True
+        )
+        self._events_since = until
+        return [(event["Actor"]["Attributes"].get("name"),
+                 event["timeNano"]) for event in events]
+
+    def restart(self, args, cwd=None):
+        exit_code, output = self.run("restart", args, cwd)
+        if exit_code != 0:
+            warning(f"Restart failed:\n{output}")
+
+    def run(self, command, args, cwd=None):
+        """Run `vnode command args` in this process.
+
+        Returns
+        -------
+        tuple
+            exit code and output of the command
+        """
+        output = io.StringIO()
+        with self.lock, redirect_stdout(output), redirect_stderr(output):
+            # contexts are singletons, a new command needs a fresh one
+            Singleton._instances.pop(NodeContext, None)
+            previous = os.getcwd()
+            try:
+                os.chdir(cwd or previous)
+                self.cli.main(args=["--no-daemon", command, *args],
+                              prog_name="vnode", standalone_mode=False)
+                exit_code = 0
+            except click.exceptions.Exit as e:
+                exit_code = e.exit_code
+            except click.ClickException as e:
+                e.show(file=output)
+                exit_code = e.exit_code
+            except click.Abort:
+                exit_code = 1
+            except SystemExit as e:
+                exit_code = e.code if isinstance(e.code, int) else \
+                    int(e.code is not None)
+            except Exception:
+                traceback.print_exc(file=output)
+                exit_code = 1
+            finally:
+                os.chdir(previous)
+        return exit_code, output.getvalue()
+
+    def handle(self, request):
+        """Handle a request and return the response."""
+        command, args = request["command"], request.get("args", [])
+        if command not in DAEMON_COMMANDS:
+            return {"exit_code": 2, "output": f"Unknown command {command}\n"}
+
+        with self.lock:
+            return self._handle(command, args, request.get("cwd"))
+
+    def _handle(self, command, args, cwd):
+        if command == "status":
+            return {"exit_code": 0, "output": self.supervisor.status()}
+
+        before = set(self.running_nodes()) if command != "list" else set()
+        exit_code, output = self.run(command, args, cwd)
+
+        if command == "start" and exit_code == 0:
+            # supervise the container(s) this command started
+            for name in set(self.running_nodes()) - before:
+                self.supervisor.register(name, args, cwd)
+        elif command == "stop":
+            for name in before - set(self.running_nodes()):
+                self.supervisor.unregister(name)
+
+        return {"exit_code": exit_code, "output": output}
+
+    def supervise(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                with self.lock:
+                    self.supervisor.tick()
+            except Exception as e:
+                error(f"Supervisor check failed: {e}")
+
+    def serve_forever(self):
+        """Serve requests until interrupted."""
+        if forward("status", [], self.socket_path) is not None:
+            error(f"A daemon is already listening on {self.socket_path}")
+            exit(1)
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # keep the parsed configurations and Docker connection warm
+        NodeContext.config_index = ConfigIndex()
+        DockerSession.shared_client = self.session.client
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                try:
+                    request = json.loads(self.rfile.readline())
+                    response = daemon.handle(request)
+                except Exception as e:
+                    response = {"exit_code": 1, "output": f"{e}\n"}
+                self.wfile.write(json.dumps(response).encode() + b"\n")
+
+        # only the user may connect, the socket is created with this mode
+        # rather than changed after it was bound
+        umask = os.umask(0o177)
+        try:
+            self._server = socketserver.ThreadingUnixStreamServer(
+                str(self.socket_path), Handler)
+        finally:
+            os.umask(umask)
+        self._server.daemon_threads = True
+        threading.Thread(target=self.supervise, daemon=True).start()
+
+        info(f"Listening on {self.socket_path}")
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            info("Stopping the daemon.")
+        finally:
+            self._stop.set()
+            self._server.server_close()
+            self.socket_path.unlink()
+            NodeContext.config_index = None
+            DockerSession.shared_client = None
+
+    def shutdown(self):
+        """Stop `serve_forever` (from another thread)."""
+        self._server.shutdown()
+
+
+def _now_ns():
+    """Return the current time in ns since the epoch.
+
+    `time.time_ns` needs Python 3.7.
+    """
+    return int(time.time() * 10 ** 9)
+
+
+def _timestamp(ns):
+    """Return a time in ns as a timestamp for the Docker API."""
+    return f"{ns // 10 ** 9}.{ns % 10 ** 9:09d}"
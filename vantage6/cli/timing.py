@@ -0,0 +1,152 @@
+""" Timing of the phases of a command
+
+    Commands like `vnode start` run a fixed sequence of steps (pinging the
+    Docker daemon, loading the configuration, pulling the image, ...). The
+    `Timer` records how long each of these phases takes so that slow
+    commands can be diagnosed. The result can be printed as a table or
+    written as a Chrome trace-event file (chrome://tracing, Perfetto).
+"""
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+from functools import wraps
+
+import click
+
+
+class Span:
+    """A named, timed part of a command."""
+
+    def __init__(self, name, depth=0):
+        self.name = name
+        self.depth = depth
+        self.thread_id = threading.get_ident()
+        # wall clock for the trace file, monotonic clock for durations
+        self.timestamp = time.time()
+        self.start = time.perf_counter()
+        self.end = None
+
+    @property
+    def duration(self):
+        end = self.end if self.end is not None else time.perf_counter()
+        return end - self.start
+
+
+class Timer:
+    """Records the phases (and nested spans) of a command.
+
+    Phases are sequential: starting a new phase ends the previous one.
+    Spans can be used to time a block within a phase.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._phase = None
+        self._depth = 0
+        self._lock = threading.Lock()
+        self.created = time.perf_counter()
+
+    def phase(self, name):
+        """End the current phase and start the phase `name`."""
+        self._end_phase()
+        self._phase = self._start(name, depth=0)
+
+    def stop(self):
+        """End the current phase."""
+        self._end_phase()
+
+    @contextmanager
+    def span(self, name):
+        """Time the enclosed block."""
+        self._depth += 1
+        span = self._start(name, depth=self._depth)
+        try:
+            yield span
+        finally:
+            span.end = time.perf_counter()
+            self._depth -= 1
+
+    def _start(self, name, depth):
+        span = Span(name, depth)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def _end_phase(self):
+        if self._phase and self._phase.end is None:
+            self._phase.end = time.perf_counter()
+        self._phase = None
+
+    @property
+    def total(self):
+        ends = [s.end for s in self.spans if s.end is not None]
+        return (max(ends) if ends else time.perf_counter()) - self.created
+
+    def summary(self):
+        """Return a table with the duration of every phase and span."""
+        total = self.total or 1e-9
+        header = f"{'Phase':40}{'Duration':>12}{'%':>8}"
+        lines = [header, "-" * len(header)]
+        for span in self.spans:
+            name = "  " * span.depth + span.name
+            lines.append(
+                f"{name:40}{format_duration(span.duration):>12}"
+                f"{100 * span.duration / total:>7.1f}%"
+            )
+        lines.append("-" * len(header))
+        lines.append(f"{'total':40}{format_duration(self.total):>12}")
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        """Return the spans in the Chrome trace-event format."""
+        pid = os.getpid()
+        events = []
+        for span in self.spans:
+            events.append({
+                "name": span.name,
+                "cat": "phase" if span.depth == 0 else "span",
+                "ph": "X",
+                "ts": int(span.timestamp * 1e6),
+                "dur": int(span.duration * 1e6),
+                "pid": pid,
+                "tid": span.thread_id,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path):
+        with open(path, "w") as fp:
+            json.dump(self.chrome_trace(), fp)
+
+
+def format_duration(seconds):
+    if seconds < 1:
+        return f"{seconds * 1000:.1f}ms"
+    return f"{seconds:.2f}s"
+
+
+def click_timings(func):
+    """Add the `--timings` and `--trace-file` options to a command.
+
+    The command receives a `Timer` as the `timer` keyword argument. Once the
+    command finishes (or exits) the timings are reported.
+    """
+    @click.option('--timings', is_flag=True, default=False,
+                  help="print the duration of each phase of the command")
+    @click.option('--trace-file', default=None,
+                  type=click.Path(dir_okay=False, writable=True),
+                  help="write the phases to a Chrome trace-event file")
+    @wraps(func)
+    def func_with_timer(*args, timings, trace_file, **kwargs):
+        timer = Timer()
+        try:
+            return func(*args, timer=timer, **kwargs)
+        finally:
+            timer.stop()
+            if timings:
+                click.echo(timer.summary())
+            if trace_file:
+                timer.write_chrome_trace(trace_file)
+    return func_with_timer
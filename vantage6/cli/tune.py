@@ -0,0 +1,167 @@
+""" Measuring the host to recommend the concurrency of a node
+
+    `vnode tune` measures the cores, memory, disk throughput of the data
+    folder and the overhead of starting a container, and derives from
+    these how many algorithm containers the node should run at once
+    (`max_tasks`) and how many tasks it should queue (`queue_size`):
+
+        concurrency:
+          max_tasks: 4
+          queue_size: 8
+
+    The node receives this profile in the `CONCURRENCY` environment
+    variable, as JSON.
+"""
+import json
+import math
+import os
+import statistics
+import tempfile
+import time
+
+from schema import And, Use, Optional
+
+from vantage6.cli.database import host_memory
+from vantage6.cli.resources import parse_size
+
+ENVIRONMENT_VARIABLE = "CONCURRENCY"
+
+# what a task is assumed to need when `algorithm_resources` does not say
+DEFAULT_TASK_CPUS = 1
+DEFAULT_TASK_MEMORY = 2 * 1024 ** 3
+
+# disk throughput (MB/s) a task is assumed to need to read its data
+DISK_PER_TASK = 50
+
+# memory kept free for the node, the host and the page cache
+RESERVED_MEMORY = 0.25
+
+VALIDATOR = {
+    "max_tasks": And(Use(int), lambda n: n > 0),
+    Optional("queue_size"): And(Use(int), lambda n: n >= 0),
+    Optional("measured"): dict,
+}
+
+
+def available_cores():
+    """Return the number of cores this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def disk_throughput(folder, size=64 * 1024 ** 2, block=1024 ** 2):
+    """Measure the sequential write and read throughput of `folder`.
+
+    The file is synced to disk after writing and dropped from the page
+    cache (where supported) before it is read back.
+
+    Returns
+    -------
+    tuple
+        write and read throughput in MB/s
+    """
+    data = os.urandom(block)
+    fd, path = tempfile.mkstemp(prefix=".tune-", dir=folder)
+    try:
+        start = time.perf_counter()
+        for _ in range(size // block):
+            os.write(fd, data)
+        os.fsync(fd)
+        write = time.perf_counter() - start
+
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        os.lseek(fd, 0, os.SEEK_SET)
+        start = time.perf_counter()
+        while os.read(fd, block):
+            pass
+        read = time.perf_counter() - start
+    finally:
+        os.close(fd)
+        os.remove(path)
+
+    mb = size / 1024 ** 2
+    return mb / max(write, 1e-9), mb / max(read, 1e-9)
+
+
+def container_overhead(docker_client, image, n=3):
+    """Return the median time (in seconds) to run a container that exits."""
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        docker_client.containers.run(image, "true", remove=True)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def recommend(cores, memory, disk_mbps=None, container_start=None,
+              resources=None):
+    """Return the concurrency profile for the measured host.
+
+    Parameters
+    ----------
+    cores : int
+        available cores
+    memory : int
+        memory of the host in bytes
+    disk_mbps : float, optional
+        read throughput of the data folder in MB/s
+    container_start : float, optional
+        seconds to start (and stop) a container
+    resources : dict, optional
+        the `algorithm_resources` of the node, the limits of a single task
+
+    Returns
+    -------
+    tuple
+        the profile and the resource that limits the number of tasks
+    """
+    resources = resources or {}
+    task_cpus = float(resources.get("cpus", DEFAULT_TASK_CPUS))
+    task_memory = parse_size(resources.get("memory", DEFAULT_TASK_MEMORY))
+
+    limits = {
+        "cores": int(cores // task_cpus),
+        "memory": int(memory * (1 - RESERVED_MEMORY) // task_memory),
+    }
+    if disk_mbps:
+        limits["disk"] = int(disk_mbps // DISK_PER_TASK)
+    limited_by = min(limits, key=limits.get)
+    max_tasks = max(limits[limited_by], 1)
+
+    # queue enough tasks to keep the slots busy while containers start
+    queue_size = max_tasks * (1 + math.ceil(container_start or 0))
+    return {"max_tasks": max_tasks, "queue_size": queue_size}, limited_by
+
+
+def concurrency_environment(profile):
+    """Return the environment variables that pass the profile to the node."""
+    if not profile:
+        return {}
+    return {ENVIRONMENT_VARIABLE: json.dumps({
+        key: value for key, value in profile.items() if key != "measured"
+    })}
+
+
+def measure(folder, docker_client=None, image=None):
+    """Measure the host, see `recommend`.
+
+    Returns
+    -------
+    dict
+        cores, memory (bytes), disk_write and disk_read (MB/s) and
+        container_start (seconds, when `docker_client` is given)
+    """
+    write, read = disk_throughput(folder)
+    measured = {
+        "cores": available_cores(),
+        "memory": host_memory(),
+        "disk_write": round(write, 1),
+        "disk_read": round(read, 1),
+    }
+    if docker_client is not None:
+        measured["container_start"] = round(
+            container_overhead(docker_client, image), 3)
+    return measured